@@ -12,10 +12,7 @@ It is composed of multiple directives and settings:
 
 """
 
-import json
-import os
 import re
-from dataclasses import dataclass, field
 from itertools import groupby
 from typing import Any, ClassVar, Dict, List, Optional, Tuple, cast
 
@@ -23,7 +20,9 @@ import sphinx
 from docutils import nodes
 from docutils.statemachine import StringList
 from sphinx.application import Sphinx
+from sphinx.config import Config
 from sphinx.domains.c import CObject
+from sphinx.errors import ConfigError
 from sphinx.ext.autodoc import (
     Documenter,
     bool_option,
@@ -34,34 +33,37 @@ from sphinx.ext.autodoc.directive import DocumenterBridge
 from sphinx.util import logging
 from sphinx.util.docstrings import prepare_docstring
 
-from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.cache import (
+    find_compilation_database,
+    prune_disk_cache,
+    reset_module_cache,
+)
+from sphinx_c_autodoc.compilation_database import ENTRY_POLICIES
+from sphinx_c_autodoc.dependencies import (
+    ConstructKey,
+    find_changed_constructs,
+    get_include_dependencies,
+    merge_fingerprints,
+    note_construct,
+    purge_fingerprints,
+    save_unchanged_documents,
+)
 from sphinx_c_autodoc.domains.c import patch_c_domain
+from sphinx_c_autodoc.loader import PARSE_OPTIONS, DocumentedObject
+from sphinx_c_autodoc.preparse import (
+    find_c_file,
+    get_module,
+    parse_referenced_files,
+    unfreeze_objects,
+)
 
-
-# TODO not real fond of this being here in the main c autodoc file, need to
-# find a way to make it easier to cache the documented files.
-@dataclass
-class ViewCodeListing:
-    """
-    A data structure used for constructing a viewcode source listing.
-
-    Attributes:
-        raw_listing:
-            The plain text representation of the code. This should be
-            basically the output of file.read().
-
-        ast (Dict):
-            A dictionary like representation of the code constructs.
-            See :ref:`developer_notes:Common Terms`.
-
-        doc_links (Dict): To be used by the consumers, i.e. viewcode.
-
-    """
-
-    raw_listing: str
-    ast: Dict
-    doc_links: Dict = field(default_factory=dict)
-
+#: Which of the files included by a C file are dependencies of the documents
+#: documenting it.
+#:
+#: - all: Every included file, including system headers.
+#: - roots: Only included files within the ``c_autodoc_roots``.
+#: - none: Only the C file itself.
+INCLUDE_DEPENDENCIES = ("all", "roots", "none")
 
 logger = logging.getLogger(__name__)
 
@@ -82,6 +84,9 @@ class CObjectDocumenter(Documenter):
     # objects
     priority = 11
 
+    # The loaded C file, rather than a python module
+    module: Optional[DocumentedObject]
+
     option_spec: ClassVar[dict] = {
         "members": members_option,
         "noindex": bool_option,
@@ -130,7 +135,7 @@ class CObjectDocumenter(Documenter):
 
                 False if the signature couldn't be parsed.
         """
-        c_autodoc_re = re.compile(r"^([\w\/\\.]+)(::([\w.]+\.)?(\w+))?\s*$")
+        c_autodoc_re = re.compile(r"^([^\s:]+)(::([\w.]+\.)?(\w+))?\s*$")
 
         match = c_autodoc_re.match(self.name)
         if match is None:
@@ -204,54 +209,24 @@ class CObjectDocumenter(Documenter):
         Returns:
             bool: True if the file was imported, false otherwise.
         """
-        for source_dir in self.env.config.c_autodoc_roots:
-            filename = os.path.join(source_dir, self.get_real_modname())
-
-            # Prefixing with "/" will force "absolute" path which is relative
-            # to the source directory.
-            rel_filename, filename = self.env.relfn2path(f"/{filename}")
-            if os.path.isfile(filename):
-                break
-        else:
+        modname = self.get_real_modname()
+        found = find_c_file(self.env, modname)
+        if found is None:
             logger.warning(
                 "Unable to find file, %s, in any of the directories %s "
                 "all directories are relative to the top documentation source "
                 "directory",
-                self.get_real_modname(),
+                modname,
                 self.env.config.c_autodoc_roots,
                 location=(self.env.docname, self.directive.lineno),
             )
             return False
 
-        self.env.note_dependency(rel_filename)
-
-        source_dict = getattr(self.env, "_viewcode_c_modules", {})
-        cast(Any, self.env)._viewcode_c_modules = source_dict
-
-        # TODO The :attr:`temp_data` is reset for each document ideally want to
-        # use or make an attribute on `self.env` that is reset per run or just
-        # not pickled.
-        modules_dict = cast(
-            Dict[str, Any], self.env.temp_data.setdefault("c:loaded_modules", {})
+        rel_filename, filename = found
+        module = get_module(
+            self.env, modname, filename, self.get_compilation_database()
         )
-
-        if filename not in modules_dict:
-            with open(filename, encoding="utf-8") as f:
-                contents = [f.read()]
-
-            # let extensions preprocess files
-            self.env.app.emit("c-autodoc-pre-process", filename, contents)
-            compilation_db = self.get_compilation_database()
-            compilation_args = self.env.config.c_autodoc_compilation_args
-            modules_dict[filename] = loader.load(
-                filename, contents[0], compilation_db, compilation_args
-            )
-            ast = json.loads(str(modules_dict[filename]))
-            source_dict.setdefault(
-                self.get_real_modname(), ViewCodeListing(contents[0], ast)
-            )
-
-        self.module = modules_dict[filename]
+        self.module = module
 
         self.object = self.module
         self.object_name = self.name
@@ -263,8 +238,37 @@ class CObjectDocumenter(Documenter):
                 self.object_name = obj
                 self.object = self.object.children[self.object_name]
 
+        self.note_dependencies(modname, rel_filename, filename, module)
         return True
 
+    def note_dependencies(
+        self, modname: str, rel_filename: str, filename: str, module: DocumentedObject
+    ) -> None:
+        """
+        Note what the current document depends on for documenting
+        :attr:`object`.
+
+        With ``c_autodoc_construct_dependencies`` this is a fingerprint of
+        :attr:`object`, see :mod:`sphinx_c_autodoc.dependencies`. Otherwise
+        it's the C file, and the headers it includes as limited by
+        ``c_autodoc_include_dependencies``.
+
+        Args:
+            modname (str): The C file, as written in the directive.
+            rel_filename (str): The C file relative to the source directory.
+            filename (str): The full path of the C file.
+            module (DocumentedObject): The loaded C file.
+        """
+        if self.env.config.c_autodoc_construct_dependencies:
+            members = bool(self.options.members) or bool(self.objpath)
+            key = ConstructKey(modname, tuple(self.objpath), members)
+            note_construct(self.env, filename, module, key, self.object)
+            return
+
+        self.env.note_dependency(rel_filename)
+        for include in get_include_dependencies(self.env, module):
+            self.env.note_dependency(include)
+
     def get_compilation_database(self) -> Optional[str]:
         """
         Get's the compilation database from the environment
@@ -275,14 +279,8 @@ class CObjectDocumenter(Documenter):
                 compilation database.
 
         """
-        database = self.env.config.c_autodoc_compilation_database
-        if not database:
-            return None
-
-        # Prefixing with "/" will force "absolute" path which is relative
-        # to the source directory.
-        _, filename = self.env.relfn2path(f"/{database}")
-        if os.path.isfile(filename):
+        filename, exists = find_compilation_database(self.env)
+        if filename is None or exists:
             return filename
 
         logger.warning(
@@ -786,9 +784,71 @@ class CModule(CObject):
         return node.children
 
 
-def setup(app: Sphinx) -> None:
+def check_parse_options(app: Sphinx, config: Config) -> None:
+    """
+    Ensure ``c_autodoc_parse_options`` only names known options.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        config (Config): The configuration of `app`.
+
+    Raises:
+        ConfigError: When an unknown option is given.
+    """
+    unknown = [o for o in config.c_autodoc_parse_options if o not in PARSE_OPTIONS]
+    if unknown:
+        raise ConfigError(
+            f"Unknown c_autodoc_parse_options {', '.join(unknown)}, expected "
+            f"any of {', '.join(PARSE_OPTIONS)}"
+        )
+
+
+def check_compilation_database_policy(app: Sphinx, config: Config) -> None:
+    """
+    Ensure ``c_autodoc_compilation_database_policy`` is a known policy.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        config (Config): The configuration of `app`.
+
+    Raises:
+        ConfigError: When an unknown policy is given.
+    """
+    policy = config.c_autodoc_compilation_database_policy
+    if policy not in ENTRY_POLICIES:
+        raise ConfigError(
+            f"Unknown c_autodoc_compilation_database_policy {policy}, expected "
+            f"one of {', '.join(ENTRY_POLICIES)}"
+        )
+
+
+def check_include_dependencies(app: Sphinx, config: Config) -> None:
+    """
+    Ensure ``c_autodoc_include_dependencies`` is a known setting.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        config (Config): The configuration of `app`.
+
+    Raises:
+        ConfigError: When an unknown setting is given.
+    """
+    setting = config.c_autodoc_include_dependencies
+    if setting not in INCLUDE_DEPENDENCIES:
+        raise ConfigError(
+            f"Unknown c_autodoc_include_dependencies {setting}, expected "
+            f"one of {', '.join(INCLUDE_DEPENDENCIES)}"
+        )
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
     """
     Setup function for registering this with sphinx
+
+    Returns:
+        Dict[str, Any]: The extension metadata. The parsed modules kept on the
+        environment are per process and never pickled with it, so reading in
+        parallel is safe.
     """
     app.require_sphinx("2.0")
     app.setup_extension("sphinx.ext.autodoc")
@@ -805,7 +865,30 @@ def setup(app: Sphinx) -> None:
     app.add_directive_to_domain("c", "module", CModule)
     app.add_config_value("c_autodoc_roots", [""], "env")
     app.add_config_value("c_autodoc_compilation_database", None, "env")
+    app.add_config_value("c_autodoc_compilation_database_policy", "first", "env")
     app.add_config_value("c_autodoc_compilation_args", [""], "env")
+    app.add_config_value("c_autodoc_parse_options", [], "env")
+    app.add_config_value("c_autodoc_module_cache_size", 256 * 1024 * 1024, "")
+    app.add_config_value("c_autodoc_cache_dir", None, "")
+    app.add_config_value("c_autodoc_cache_max_size", 512 * 1024 * 1024, "")
+    app.add_config_value("c_autodoc_parallel_parse", None, "")
+    app.add_config_value("c_autodoc_include_dependencies", "roots", "env")
+    app.add_config_value("c_autodoc_construct_dependencies", False, "env")
     app.add_event("c-autodoc-pre-process")
+    app.add_event("c-autodoc-module-loaded")
+    app.add_event("c-autodoc-module-changed")
+    app.connect("config-inited", check_parse_options)
+    app.connect("config-inited", check_compilation_database_policy)
+    app.connect("config-inited", check_include_dependencies)
+    app.connect("builder-inited", reset_module_cache)
+    app.connect("build-finished", prune_disk_cache)
+    app.connect("env-before-read-docs", parse_referenced_files)
+    app.connect("env-updated", unfreeze_objects)
+    app.connect("env-get-outdated", find_changed_constructs)
+    app.connect("env-updated", save_unchanged_documents)
+    app.connect("env-purge-doc", purge_fingerprints)
+    app.connect("env-merge-info", merge_fingerprints)
 
     patch_c_domain()
+
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
@@ -0,0 +1,670 @@
+"""
+Caching of loaded C modules.
+
+Parsing a C file with libclang is by far the most expensive part of
+documenting it, so each file should only be parsed once per build no matter
+how many documents reference it. Loaded modules are also saved to disk so that
+later builds can skip libclang entirely for files which haven't changed. The
+saved modules are keyed by the source of this package, so changing the code
+which builds them, even in an editable install, never reuses stale modules.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+from importlib import metadata
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.clang.patches import clang_version
+from sphinx_c_autodoc.loader import DocumentedObject
+
+#: The attribute of the :class:`BuildEnvironment` holding the :class:`ModuleCache`.
+MODULE_CACHE_ATTRIBUTE = "_c_autodoc_module_cache"
+
+#: The attribute of the :class:`BuildEnvironment` holding the :class:`DiskCache`.
+DISK_CACHE_ATTRIBUTE = "_c_autodoc_disk_cache"
+
+#: The attribute of the :class:`BuildEnvironment` holding the compilation
+#: database found for ``c_autodoc_compilation_database``, see
+#: :func:`find_compilation_database`.
+COMPILATION_DATABASE_ATTRIBUTE = "_c_autodoc_compilation_database"
+
+#: Bumped whenever the layout of the on disk cache entries changes.
+DISK_CACHE_FORMAT = 2
+
+#: The directory of this package, whose python files make up the
+#: :func:`extension_fingerprint`.
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#: The objects whose size is counted without looking inside of them, see
+#: :func:`estimate_size`.
+ATOMIC_TYPES = (str, bytes, int, float, bool, type(None))
+
+#: The objects which are shared rather than part of a module, see
+#: :func:`estimate_size`.
+SHARED_TYPES = (type, ModuleType, FunctionType)
+
+logger = logging.getLogger(__name__)
+
+
+class ModuleCache:
+    """
+    A least recently used cache of loaded C modules, bounded by the memory
+    the modules are estimated to use.
+
+    Unlike :attr:`BuildEnvironment.temp_data`, which Sphinx resets for every
+    document, this lives for the entire build. The cache is never pickled
+    with the environment, an unpickled cache is always empty.
+
+    Arguments:
+        max_size (int): The estimated memory, in bytes, the modules may use,
+            see :func:`estimate_size`. When exceeded the least recently used
+            modules are evicted. None means unbounded.
+    """
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.total_size = 0
+        self._modules: OrderedDict[Hashable, Tuple[DocumentedObject, int]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._modules)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._modules
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        The modules are only valid for the current build, so leave them out
+        of the pickled environment.
+        """
+        return {"max_size": self.max_size, "total_size": 0, "_modules": OrderedDict()}
+
+    def get(self, key: Hashable) -> Optional[DocumentedObject]:
+        """
+        Get the module for `key`, marking it as the most recently used.
+
+        Args:
+            key (Hashable): The key of the module, see :func:`module_key`.
+
+        Returns:
+            DocumentedObject: The module if it is in the cache, None otherwise.
+        """
+        entry = self._modules.get(key)
+        if entry is None:
+            return None
+
+        self._modules.move_to_end(key)
+        return entry[0]
+
+    def add(
+        self, key: Hashable, module: DocumentedObject, size: Optional[int] = None
+    ) -> None:
+        """
+        Add `module` to the cache, evicting the least recently used modules
+        if the cache is full.
+
+        A module which is larger than the entire cache isn't added.
+
+        Args:
+            key (Hashable): The key of the module, see :func:`module_key`.
+            module (DocumentedObject): The loaded module.
+            size (int): The memory `module` uses, estimated when None.
+        """
+        if self.max_size is not None and self.max_size <= 0:
+            return
+
+        if size is None:
+            size = estimate_size(module)
+        if self.max_size is not None and size > self.max_size:
+            logger.debug(
+                "[c_autodoc] %r is larger than c_autodoc_module_cache_size", key
+            )
+            return
+
+        previous = self._modules.pop(key, None)
+        if previous is not None:
+            self.total_size -= previous[1]
+        self._modules[key] = (module, size)
+        self.total_size += size
+
+        if self.max_size is None:
+            return
+
+        while self.total_size > self.max_size:
+            _, (_, evicted_size) = self._modules.popitem(last=False)
+            self.total_size -= evicted_size
+
+    def clear(self) -> None:
+        """
+        Remove all modules from the cache.
+        """
+        self._modules.clear()
+        self.total_size = 0
+
+
+def estimate_size(obj: object) -> int:
+    """
+    Estimate the memory used by `obj` and everything it references.
+
+    Each object is counted once, by :func:`sys.getsizeof`. Classes, functions
+    and python modules are shared by everything, so aren't counted.
+
+    Args:
+        obj (object): The object to estimate the size of, usually a loaded C
+            module.
+
+    Returns:
+        int: The estimated size, in bytes.
+    """
+    size = 0
+    seen = set()
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, ATOMIC_TYPES):
+            continue
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        else:
+            attributes = getattr(item, "__dict__", None)
+            if attributes is not None:
+                pending.append(attributes)
+            for cls in type(item).__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    value = getattr(item, slot, None)
+                    if value is not None:
+                        pending.append(value)
+
+    return size
+
+
+class DiskCache:
+    """
+    A persistent cache of loaded C modules.
+
+    Each entry is a pickled, frozen, :class:`DocumentedObject` tree along with
+    the hashes of the headers the module included. An entry is only used if
+    none of those headers have changed since it was written.
+
+    Arguments:
+        directory (str): The directory to store the cache entries in.
+        fingerprint (str): Identifies the code which loaded the modules, see
+            :func:`extension_fingerprint`. Part of every key.
+        max_size (int): The size, in bytes, the entries may use on disk, see
+            :meth:`prune`. None means unbounded.
+    """
+
+    def __init__(
+        self, directory: str, fingerprint: str = "", max_size: Optional[int] = None
+    ) -> None:
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self._file_hashes: Dict[str, Optional[str]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        File hashes are only valid for the current build.
+        """
+        return {
+            "directory": self.directory,
+            "fingerprint": self.fingerprint,
+            "max_size": self.max_size,
+            "_file_hashes": {},
+        }
+
+    def key(
+        self,
+        filename: str,
+        contents: str,
+        compilation_args: Sequence[str],
+        parse_options: Sequence[str] = (),
+    ) -> str:
+        """
+        Create the key of a module in this cache, see :func:`disk_key`.
+        """
+        return disk_key(
+            filename, contents, compilation_args, parse_options, self.fingerprint
+        )
+
+    def get(self, key: str) -> Optional[DocumentedObject]:
+        """
+        Get the module stored under `key`.
+
+        Args:
+            key (str): The key of the module, see :func:`disk_key`.
+
+        Returns:
+            DocumentedObject: The module if it's in the cache and none of the
+                files it included have changed.  None otherwise.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                includes, module = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            # A corrupt or incompatible entry is just a cache miss
+            logger.debug("[c_autodoc] ignoring cache entry %s: %s", key, error)
+            return None
+
+        for include, include_hash in includes:
+            if self.file_hash(include) != include_hash:
+                return None
+
+        # Mark the entry as recently used so that pruning keeps it
+        try:
+            os.utime(entry_path)
+        except OSError:  # pragma: no cover
+            pass
+
+        return module
+
+    def add(self, key: str, module: DocumentedObject) -> None:
+        """
+        Store `module` under `key`.
+
+        Args:
+            key (str): The key of the module, see :func:`disk_key`.
+            module (DocumentedObject): The loaded module. This must be frozen,
+                see :meth:`DocumentedObject.freeze`.
+        """
+        includes = [
+            (include, self.file_hash(include))
+            for include in getattr(module, "includes", ())
+        ]
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Write to a temporary file and then move it in place so that
+            # readers, possibly in other processes, never see a partial entry.
+            fd, temp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((includes, module), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, self._entry_path(key))
+        except OSError as error:
+            logger.warning(
+                "Unable to write C autodoc cache entry to %s: %s",
+                self.directory,
+                error,
+                type="c_autodoc",
+            )
+
+    def prune(self) -> None:
+        """
+        Remove the least recently used entries until the entries fit in
+        :attr:`max_size`.
+
+        Entries are never removed otherwise, even once every key that would
+        find them is gone, e.g. after the C file or this extension changes.
+        """
+        if self.max_size is None:
+            return
+
+        entries = []
+        try:
+            with os.scandir(self.directory) as scanned:
+                for entry in scanned:
+                    if entry.name.endswith(".pickle"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # pragma: no cover
+                continue
+            total_size -= size
+
+    def file_hash(self, filename: str) -> Optional[str]:
+        """
+        Get the hash of the contents of `filename`.
+
+        Hashes are remembered for the life of this instance, since many modules
+        will include the same headers.
+
+        Args:
+            filename (str): The file to hash.
+
+        Returns:
+            str: The hash of the contents of `filename`, None if it can't be read.
+        """
+        if filename not in self._file_hashes:
+            try:
+                with open(filename, "rb") as f:
+                    digest: Optional[str] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                digest = None
+            self._file_hashes[filename] = digest
+
+        return self._file_hashes[filename]
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pickle")
+
+
+def module_key(
+    filename: str,
+    contents: str,
+    compilation_database: Optional[str],
+    compilation_args: Optional[Sequence[str]],
+    parse_options: Sequence[str] = (),
+    compilation_database_policy: str = "first",
+) -> Tuple[str, str, Optional[str], str, Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Create the key identifying a loaded module.
+
+    Args:
+        filename (str): The full path of the C file.
+        contents (str): The contents of `filename`, prior to any
+            pre-processing.
+        compilation_database (str): The compilation database used for
+            `filename`.
+        compilation_args (Sequence[str]): The additional compilation arguments.
+        parse_options (Sequence[str]): The additional translation unit options.
+        compilation_database_policy (str): The entry of the compilation
+            database used for `filename`.
+
+    Returns:
+        tuple: The key for the module of `filename`.
+    """
+    content_hash = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+    return (
+        filename,
+        content_hash,
+        compilation_database,
+        compilation_database_policy,
+        tuple(compilation_args or ()),
+        tuple(sorted(parse_options)),
+    )
+
+
+def disk_key(
+    filename: str,
+    contents: str,
+    compilation_args: Sequence[str],
+    parse_options: Sequence[str] = (),
+    fingerprint: str = "",
+) -> str:
+    """
+    Create the key identifying a module stored in the :class:`DiskCache`.
+
+    Args:
+        filename (str): The full path of the C file.
+        contents (str): The contents of `filename` as given to libclang, i.e.
+            after any pre-processing.
+        compilation_args (Sequence[str]): All of the arguments used to parse
+            `filename`.
+        parse_options (Sequence[str]): The additional translation unit options.
+        fingerprint (str): Identifies the code loading the module, see
+            :func:`extension_fingerprint`.
+
+    Returns:
+        str: The key for the module of `filename`.
+    """
+    key = hashlib.sha256()
+    for part in (
+        fingerprint,
+        filename,
+        contents,
+        ",".join(sorted(parse_options)),
+        *compilation_args,
+    ):
+        key.update(part.encode("utf-8"))
+        key.update(b"\0")
+
+    return key.hexdigest()
+
+
+def extension_fingerprint() -> str:
+    """
+    Identify the code which loads modules, so that modules saved by other
+    code are never used.
+
+    This covers the cache format, the version of this extension, the libclang
+    version and the contents of every python file of this package. The version
+    alone isn't enough, editable and development installs change the code
+    without changing the version.
+
+    Returns:
+        str: The hash of everything loading a module depends on.
+    """
+    try:
+        extension_version = metadata.version("sphinx-c-autodoc")
+    except metadata.PackageNotFoundError:  # pragma: no cover
+        extension_version = "unknown"
+
+    fingerprint = hashlib.sha256()
+    for part in (str(DISK_CACHE_FORMAT), extension_version, clang_version()):
+        fingerprint.update(part.encode("utf-8"))
+        fingerprint.update(b"\0")
+
+    source_files = []
+    for directory, subdirectories, filenames in os.walk(PACKAGE_DIR):
+        subdirectories[:] = [d for d in subdirectories if d != "__pycache__"]
+        source_files.extend(
+            os.path.join(directory, f) for f in filenames if f.endswith(".py")
+        )
+
+    for source_file in sorted(source_files):
+        fingerprint.update(os.path.relpath(source_file, PACKAGE_DIR).encode("utf-8"))
+        fingerprint.update(b"\0")
+        with open(source_file, "rb") as f:
+            fingerprint.update(f.read())
+        fingerprint.update(b"\0")
+
+    return fingerprint.hexdigest()
+
+
+def load_module(
+    env: BuildEnvironment,
+    filename: str,
+    contents: str,
+    compilation_database: Optional[str],
+    compilation_args: Optional[Sequence[str]],
+    parse_options: Sequence[str] = (),
+    compilation_database_policy: str = "first",
+) -> DocumentedObject:
+    """
+    Load `filename` from the :class:`DiskCache`, falling back to parsing it
+    with :func:`loader.load`.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        filename (str): The full path of the C file.
+        contents (str): The contents of `filename`, after any pre-processing.
+        compilation_database (str): The compilation database for `filename`.
+        compilation_args (Sequence[str]): The additional compilation arguments.
+        parse_options (Sequence[str]): The additional translation unit options,
+            see :data:`loader.PARSE_OPTIONS`.
+        compilation_database_policy (str): Which entry of the compilation
+            database to use for `filename`, see
+            :data:`~sphinx_c_autodoc.compilation_database.ENTRY_POLICIES`.
+
+    Returns:
+        DocumentedObject: The documented version of `filename`.
+    """
+    args = get_parse_args(
+        filename, compilation_database, compilation_args, compilation_database_policy
+    )
+
+    disk_cache = get_disk_cache(env)
+    if disk_cache is None:
+        return loader.load(
+            filename, contents, compilation_args=args, parse_options=parse_options
+        )
+
+    key = disk_cache.key(filename, contents, args, parse_options)
+    module = disk_cache.get(key)
+    if module is None:
+        module = loader.load(
+            filename, contents, compilation_args=args, parse_options=parse_options
+        )
+        disk_cache.add(key, module)
+
+    return module
+
+
+def get_parse_args(
+    filename: str,
+    compilation_database: Optional[str],
+    compilation_args: Optional[Sequence[str]],
+    compilation_database_policy: str = "first",
+) -> List[str]:
+    """
+    Get all of the arguments to parse `filename` with.
+
+    Args:
+        filename (str): The full path of the C file.
+        compilation_database (str): The compilation database for `filename`.
+        compilation_args (Sequence[str]): The additional compilation arguments.
+        compilation_database_policy (str): Which entry of the compilation
+            database to use for `filename`.
+
+    Returns:
+        List[str]: The arguments from the compilation database followed by
+        `compilation_args`.
+    """
+    args: List[str] = loader.get_compilation_args(
+        filename, compilation_database, compilation_database_policy
+    )
+    if compilation_args:
+        args += compilation_args
+
+    return args
+
+
+def find_compilation_database(env: BuildEnvironment) -> Tuple[Optional[str], bool]:
+    """
+    Find the compilation database, ``c_autodoc_compilation_database``.
+
+    Every document uses the same compilation database, so it's only looked for
+    once per build.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        Tuple[Optional[str], bool]: The full path to the compilation database,
+        None if there isn't one, and whether it exists.
+    """
+    database = env.config.c_autodoc_compilation_database
+    if not database:
+        return None, False
+
+    found = getattr(env, COMPILATION_DATABASE_ATTRIBUTE, None)
+    if found is None or found[0] != database:
+        # Prefixing with "/" will force "absolute" path which is relative
+        # to the source directory.
+        _, filename = env.relfn2path(f"/{database}")
+        found = (database, filename, os.path.isfile(filename))
+        setattr(env, COMPILATION_DATABASE_ATTRIBUTE, found)
+
+    _, filename, exists = found
+    return filename, exists
+
+
+def get_disk_cache(env: BuildEnvironment) -> Optional[DiskCache]:
+    """
+    Get the disk cache for the current build.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        DiskCache: The disk cache of `env`.  None if the disk cache is
+            disabled with ``c_autodoc_cache_dir = False``.
+    """
+    return getattr(env, DISK_CACHE_ATTRIBUTE, None)
+
+
+def get_module_cache(env: BuildEnvironment) -> ModuleCache:
+    """
+    Get the module cache for the current build.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        ModuleCache: The module cache of `env`, created if needed.
+    """
+    module_cache = getattr(env, MODULE_CACHE_ATTRIBUTE, None)
+    if module_cache is None:
+        module_cache = ModuleCache(env.config.c_autodoc_module_cache_size)
+        setattr(env, MODULE_CACHE_ATTRIBUTE, module_cache)
+
+    return module_cache
+
+
+def reset_module_cache(app: Sphinx) -> None:
+    """
+    Start every build with an empty module cache sized per the current
+    configuration, and a disk cache in the configured directory. The
+    compilation database is looked for again, in case it's been moved.
+
+    Meant to be connected to the `builder-inited` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+    """
+    assert app.env is not None
+    module_cache = ModuleCache(app.config.c_autodoc_module_cache_size)
+    setattr(app.env, MODULE_CACHE_ATTRIBUTE, module_cache)
+
+    cache_dir = app.config.c_autodoc_cache_dir
+    directory = None
+    if cache_dir is None:
+        directory = os.path.join(app.doctreedir, "c_autodoc")
+    elif cache_dir:
+        directory = os.path.join(app.srcdir, cache_dir)
+
+    disk_cache = None
+    if directory is not None:
+        disk_cache = DiskCache(
+            directory, extension_fingerprint(), app.config.c_autodoc_cache_max_size
+        )
+    setattr(app.env, DISK_CACHE_ATTRIBUTE, disk_cache)
+    setattr(app.env, COMPILATION_DATABASE_ATTRIBUTE, None)
+
+
+def prune_disk_cache(app: Sphinx, exception: Optional[Exception]) -> None:
+    """
+    Keep the disk cache within ``c_autodoc_cache_max_size`` once the build is
+    done.
+
+    Meant to be connected to the `build-finished` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        exception (Exception): The exception which stopped the build, if any.
+    """
+    disk_cache = get_disk_cache(app.env)
+    if disk_cache is not None:
+        disk_cache.prune()
@@ -4,10 +4,66 @@ Expose some CXComment functionality to python for libclang
 """
 
 import ctypes
-from typing import Any, Optional
+from collections import namedtuple
+from typing import Any, Iterator, List, Optional
 
 from clang import cindex
 
+#: The ``CXCommentKind`` values of the comment nodes.
+NULL_COMMENT = 0
+TEXT_COMMENT = 1
+INLINE_COMMAND_COMMENT = 2
+HTML_START_TAG_COMMENT = 3
+HTML_END_TAG_COMMENT = 4
+PARAGRAPH_COMMENT = 5
+BLOCK_COMMAND_COMMENT = 6
+PARAM_COMMAND_COMMENT = 7
+TPARAM_COMMAND_COMMENT = 8
+VERBATIM_BLOCK_COMMAND_COMMENT = 9
+VERBATIM_BLOCK_LINE_COMMENT = 10
+VERBATIM_LINE_COMMENT = 11
+FULL_COMMENT = 12
+
+#: The ``CXCommentInlineCommandRenderKind`` value of commands rendered without
+#: any markup, ``\\n``, ``\\p`` and similar.
+INLINE_RENDER_NORMAL = 0
+
+#: The ``CXCommentInlineCommandRenderKind`` value of ``\\anchor``, which
+#: renders no text.
+INLINE_RENDER_ANCHOR = 4
+
+#: Block commands providing the abstract of a comment.
+BRIEF_COMMANDS = ("brief", "short", "abstract")
+
+#: Block commands which don't take part in the documentation.
+HEADERFILE_COMMANDS = ("headerfile",)
+
+#: Block commands describing the return value.
+RETURNS_COMMANDS = ("returns", "return", "result")
+
+#: Block commands describing the exceptions raised, which C doesn't have.
+THROWS_COMMANDS = ("throws", "throw", "exception")
+
+#: The ``getParamIndex`` of a parameter which isn't in the declaration.
+INVALID_PARAM_INDEX = 0xFFFFFFFF
+
+#: The documentation parts of a full comment. These are the same parts, in the
+#: same order, that clang provides in the comment's XML rendering.
+#:
+#: - abstract: The paragraph of the ``\\brief`` command, or the first
+#:   paragraph. None when the comment has neither.
+#: - discussion: The remaining paragraphs, or None when there are no other
+#:   blocks in the comment.
+#: - params: (name, paragraph) pairs of the documented parameters, in the
+#:   order of the declaration.
+#: - returns: The paragraphs of the returns commands.
+#:
+#: Paragraphs may be only whitespace, clang leaves these out of the XML
+#: rendering but still provides the element holding them.
+CommentParts = namedtuple(
+    "CommentParts", ["abstract", "discussion", "params", "returns"]
+)
+
 
 def cxstring_to_str(value: Any) -> Optional[str]:
     """Convert a CXString unless the clang bindings already converted it."""
@@ -33,3 +89,192 @@ class Comment(ctypes.Structure):
         # Clang 21 and up return empty string '', instead of None
         # Keeping at callers logic to look for None until Clang 21 is min Clang version
         return full_comment or None
+
+    @property
+    def kind(self) -> int:
+        """
+        The ``CXCommentKind`` of this comment node.
+        """
+        return cindex.conf.lib.clang_Comment_getKind(self)
+
+    def get_children(self) -> Iterator["Comment"]:
+        """
+        The child nodes of this comment node.
+        """
+        lib = cindex.conf.lib
+        for i in range(lib.clang_Comment_getNumChildren(self)):
+            yield lib.clang_Comment_getChild(self, i)
+
+    def is_whitespace(self) -> bool:
+        """
+        Whether this paragraph, or text, node is only whitespace.
+        """
+        return bool(cindex.conf.lib.clang_Comment_isWhitespace(self))
+
+    @property
+    def command_name(self) -> str:
+        """
+        The name of the command of a block or inline command node.
+        """
+        lib = cindex.conf.lib
+        if self.kind == INLINE_COMMAND_COMMENT:
+            name = lib.clang_InlineCommandComment_getCommandName(self)
+        else:
+            name = lib.clang_BlockCommandComment_getCommandName(self)
+        return cxstring_to_str(name) or ""
+
+    @property
+    def paragraph(self) -> "Comment":
+        """
+        The paragraph of a block, or parameter, command node.
+        """
+        return cindex.conf.lib.clang_BlockCommandComment_getParagraph(self)
+
+    @property
+    def param_name(self) -> str:
+        """
+        The parameter name, as written, of a parameter command node.
+        """
+        name = cindex.conf.lib.clang_ParamCommandComment_getParamName(self)
+        return cxstring_to_str(name) or ""
+
+    @property
+    def param_index(self) -> int:
+        """
+        The sort position of a parameter command node.
+
+        This is the index of the parameter in the declaration. Variadic
+        parameters come after all of the named parameters and parameters which
+        aren't in the declaration come last.
+        """
+        lib = cindex.conf.lib
+        if not lib.clang_ParamCommandComment_isParamIndexValid(self):
+            return INVALID_PARAM_INDEX
+
+        # libclang reports the variadic parameter with the invalid index.
+        return min(
+            lib.clang_ParamCommandComment_getParamIndex(self), INVALID_PARAM_INDEX - 1
+        )
+
+    def is_direction_explicit(self) -> bool:
+        """
+        Whether a parameter command node was given an ``[in]``, or similar,
+        direction.
+        """
+        return bool(cindex.conf.lib.clang_ParamCommandComment_isDirectionExplicit(self))
+
+    def is_documented_param(self) -> bool:
+        """
+        Whether a parameter command node documents a parameter. It must name
+        the parameter and either have a direction or a description.
+        """
+        if not self.param_name:
+            return False
+
+        return self.is_direction_explicit() or not self.paragraph.is_whitespace()
+
+    def get_text(self) -> str:
+        """
+        The text of a paragraph node.
+
+        This matches the text clang provides for the paragraph in the comment's
+        XML rendering. The lines of the paragraph are joined together, inline
+        commands are replaced by their arguments and HTML tags are kept as
+        written.
+        """
+        lib = cindex.conf.lib
+        text = []
+        for child in self.get_children():
+            kind = child.kind
+            if kind == TEXT_COMMENT:
+                text.append(cxstring_to_str(lib.clang_TextComment_getText(child)))
+            elif kind == INLINE_COMMAND_COMMENT:
+                text.append(_inline_command_text(child))
+            elif kind in (HTML_START_TAG_COMMENT, HTML_END_TAG_COMMENT):
+                text.append(
+                    cxstring_to_str(lib.clang_HTMLTagComment_getAsString(child))
+                )
+
+        return "".join(t for t in text if t)
+
+    def get_parts(self) -> Optional[CommentParts]:
+        """
+        Split up a full comment into its documentation parts.
+
+        Only the top level of the comment is looked at, the text of the parts is
+        left to :meth:`get_text`, so comments can be checked for parameters and
+        returns without rendering them.
+
+        Returns:
+            CommentParts: The parts of this comment, None when this is a null
+            comment.
+        """
+        if self.kind != FULL_COMMENT:
+            return None
+
+        brief = None
+        first_paragraph = None
+        blocks = []
+        params = []
+        returns = []
+        for child in self.get_children():
+            kind = child.kind
+            if kind == PARAGRAPH_COMMENT:
+                if not child.is_whitespace():
+                    first_paragraph = first_paragraph or child
+                    blocks.append(child)
+            elif kind == BLOCK_COMMAND_COMMENT:
+                name = child.command_name
+                if name in BRIEF_COMMANDS and brief is None:
+                    brief = child.paragraph
+                elif name in RETURNS_COMMANDS:
+                    returns.append(child.paragraph)
+                elif name not in HEADERFILE_COMMANDS + THROWS_COMMANDS:
+                    blocks.append(child.paragraph)
+            elif kind == PARAM_COMMAND_COMMENT and child.is_documented_param():
+                params.append((child.param_index, child.param_name, child.paragraph))
+            elif kind in (VERBATIM_BLOCK_COMMAND_COMMENT, VERBATIM_LINE_COMMENT):
+                # Verbatim blocks have no paragraph, but still start the
+                # discussion.
+                blocks.append(None)
+
+        abstract = brief
+        if abstract is None and first_paragraph is not None:
+            abstract = first_paragraph
+            blocks.remove(first_paragraph)
+
+        discussion: Optional[List[Comment]] = None
+        if blocks:
+            discussion = [b for b in blocks if b is not None]
+
+        params.sort(key=lambda p: p[0])
+        return CommentParts(
+            abstract,
+            discussion,
+            [(name, paragraph) for _, name, paragraph in params],
+            returns,
+        )
+
+
+def _inline_command_text(comment: Comment) -> str:
+    """
+    The text of an inline command node, ``\\p foo`` is ``foo``.
+    """
+    lib = cindex.conf.lib
+    num_args = lib.clang_InlineCommandComment_getNumArgs(comment)
+    if not num_args:
+        return ""
+
+    args = [
+        cxstring_to_str(lib.clang_InlineCommandComment_getArgText(comment, i)) or ""
+        for i in range(num_args)
+    ]
+    if not args[0]:
+        return ""
+
+    render_kind = lib.clang_InlineCommandComment_getRenderKind(comment)
+    if render_kind == INLINE_RENDER_NORMAL:
+        return "".join(f"{a} " for a in args)
+    if render_kind == INLINE_RENDER_ANCHOR:
+        return ""
+    return args[0]
@@ -0,0 +1,160 @@
+"""
+Gather the cursors of a file in a single pass over libclang's children.
+
+The python bindings create a :class:`cindex.Cursor` for every child, check it
+against the null cursor, and then every property asked for is another call into
+libclang. Documenting a file needs the same handful of details for every
+construct, so they're gathered in one visit of the children instead.
+"""
+
+from collections import namedtuple
+from typing import Any, Collection, List, Optional, Tuple
+
+from clang import cindex
+from clang.cindex import Cursor
+
+#: A child cursor as gathered by :func:`collect_children`.
+#:
+#: - cursor: The child cursor itself.
+#: - kind: The :class:`cindex.CursorKind` of the child.
+#: - spelling: The spelling of the child.
+#: - type_spelling: The spelling of the child's type.
+#: - start: The byte offset of the start of the child's extent.
+#: - first_child: The first child of the child, only gathered for the kinds
+#:   in `nested_kinds`, None otherwise.
+CursorRecord = namedtuple(
+    "CursorRecord",
+    ["cursor", "kind", "spelling", "type_spelling", "start", "first_child"],
+)
+
+#: Don't visit the children of the child, `CXChildVisit_Continue`.
+VISIT_CONTINUE = 1
+
+#: Visit the children of the child, `CXChildVisit_Recurse`.
+VISIT_RECURSE = 2
+
+#: Set in the raw encoding of locations within macro expansions.
+MACRO_LOCATION_BIT = 1 << 31
+
+#: The cursor kinds which may be shadowing a nested construct, see
+#: :func:`sphinx_c_autodoc.loader.get_nested_node`.
+NESTED_KINDS = (
+    cindex.CursorKind.TYPEDEF_DECL,
+    cindex.CursorKind.FIELD_DECL,
+    cindex.CursorKind.VAR_DECL,
+)
+
+
+def collect_children(
+    cursor: Cursor,
+    skip_kinds: Collection[cindex.CursorKind] = (),
+    main_file_only: bool = False,
+) -> List[CursorRecord]:
+    """
+    Gather the children of `cursor`.
+
+    Args:
+        cursor (:class:`cindex.Cursor`): The cursor to gather the children of.
+        skip_kinds (Collection[cindex.CursorKind]): Kinds of children to leave
+            out.
+        main_file_only (bool): Only gather the children located in the main
+            file of the translation unit.
+
+    Returns:
+        List[CursorRecord]: The children of `cursor` in the order libclang
+        visits them.
+    """
+    lib = cindex.conf.lib
+    tu = cursor._tu
+    root = bytes(cursor)
+    skip_ids = {k.value for k in skip_kinds}
+    nested_ids = {k.value for k in NESTED_KINDS}
+    children: List[Cursor] = []
+    first_children: List[Optional[Cursor]] = []
+    main_start, main_end = main_file_range(tu) if main_file_only else (0, 0)
+
+    # Only the children of the most recent record can be visited, and only if
+    # it was recursed into.
+    recursing = False
+
+    def visitor(child: Cursor, parent: Cursor, _: Any) -> int:
+        nonlocal recursing
+        if recursing:
+            if bytes(parent) != root:
+                # A child of the previous record, only the first one is wanted.
+                if first_children[-1] is None:
+                    child._tu = tu
+                    first_children[-1] = child
+                return VISIT_CONTINUE
+            recursing = False
+
+        # The kind is part of the cursor structure so is free to check, do it
+        # before anything needing a call into libclang.
+        kind_id = child._kind_id
+        if kind_id in skip_ids:
+            return VISIT_CONTINUE
+
+        if main_file_only:
+            location = lib.clang_getCursorLocation(child)
+            raw_location = location.int_data
+            if raw_location & MACRO_LOCATION_BIT:
+                if not lib.clang_Location_isFromMainFile(location):
+                    return VISIT_CONTINUE
+            elif not main_start <= raw_location <= main_end:
+                return VISIT_CONTINUE
+
+        child._tu = tu
+        children.append(child)
+        first_children.append(None)
+        if kind_id in nested_ids:
+            recursing = True
+            return VISIT_RECURSE
+        return VISIT_CONTINUE
+
+    lib.clang_visitChildren(cursor, cindex.callbacks["cursor_visit"](visitor), [])
+
+    return [
+        make_record(child, first_child)
+        for child, first_child in zip(children, first_children, strict=True)
+    ]
+
+
+def main_file_range(tu: cindex.TranslationUnit) -> Tuple[int, int]:
+    """
+    Get the range of raw locations of the main file of `tu`.
+
+    libclang gives every file its own contiguous range of raw locations, so a
+    location is in the main file when its raw encoding falls in this range.
+    Comparing raw locations avoids calling into libclang for each of the,
+    possibly tens of thousands, top level cursors from included headers.
+
+    Args:
+        tu (:class:`cindex.TranslationUnit`): The translation unit to get the
+            main file range of.
+
+    Returns:
+        Tuple[int, int]: The first and last raw location of the main file.
+    """
+    extent = tu.cursor.extent
+    return extent.start.int_data, extent.end.int_data
+
+
+def make_record(cursor: Cursor, first_child: Optional[Cursor]) -> CursorRecord:
+    """
+    Create the record of `cursor`.
+
+    Args:
+        cursor (:class:`cindex.Cursor`): The cursor to create the record of.
+        first_child (:class:`cindex.Cursor`): The first child of `cursor`.
+
+    Returns:
+        CursorRecord: The record of `cursor`.
+    """
+    return CursorRecord(
+        cursor,
+        cursor.kind,
+        cursor.spelling,
+        cursor.type.spelling,
+        cursor.extent.start.offset,
+        first_child,
+    )
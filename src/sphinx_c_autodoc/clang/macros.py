@@ -0,0 +1,223 @@
+"""
+Find the macro definitions of a translation unit's main file without libclang's
+detailed preprocessing record.
+
+The detailed preprocessing record is the only way libclang provides macro
+definition cursors, but it also records every macro expansion and inclusion of
+the entire translation unit. For files including large headers that is a
+significant part of parsing. Instead the main file's source is scanned for
+``#define`` directives and each one is given a stand in for the cursor libclang
+would have provided.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from clang import cindex
+from clang.cindex import SourceLocation, SourceRange, TranslationUnit
+
+from sphinx_c_autodoc.clang.comments import Comment
+from sphinx_c_autodoc.clang.cursors import CursorRecord
+from sphinx_c_autodoc.clang.tokens import get_source, get_token_index
+
+#: The parts of the source which matter for finding directives. Comments and
+#: literals are matched so that directive like text within them is skipped.
+SCAN_RE = re.compile(
+    rb"""
+    /\*.*?\*/
+    | //(?:\\\r?\n|[^\n])*
+    | "(?:\\.|[^"\\\n])*"
+    | '(?:\\.|[^'\\\n])*'
+    | ^[ \t]*\#[ \t]*(?P<directive>\w+)(?P<rest>(?:\\\r?\n|[^\n])*)
+    """,
+    re.DOTALL | re.MULTILINE | re.VERBOSE,
+)
+
+#: The name at the start of the rest of a ``#define`` directive.
+NAME_RE = re.compile(rb"(?:[ \t]|\\\r?\n)*([A-Za-z_]\w*)")
+
+#: The comments, and line continuations, within the condition of a directive.
+#: A block comment may carry on past the end of the directive's line.
+CONDITION_NOISE_RE = re.compile(rb"/\*.*?(?:\*/|$)|//.*|\\\r?\n", re.DOTALL)
+
+#: The kind of comment tokens, the bindings create the kinds when imported.
+COMMENT_KIND = cindex.TokenKind.COMMENT  # ty: ignore[unresolved-attribute]
+
+#: Directives starting a conditional block.
+IF_DIRECTIVES = (b"if", b"ifdef", b"ifndef")
+
+
+class ScannedMacro:
+    """
+    A macro definition found by :func:`scan_macros`.
+
+    This provides the parts of the :class:`cindex.Cursor` interface that the
+    loader uses for ``MACRO_DEFINITION`` cursors, so that the documented macros
+    are the same as those from the detailed preprocessing record.
+
+    Arguments:
+        tu (:class:`cindex.TranslationUnit`): The translation unit the macro is
+            in.
+        spelling (str): The name of the macro.
+        extent (:class:`cindex.SourceRange`): From the macro's name to the end
+            of its last token.
+        function_like (bool): Whether the macro takes arguments.
+    """
+
+    kind = cindex.CursorKind.MACRO_DEFINITION  # ty: ignore[unresolved-attribute]
+
+    def __init__(
+        self,
+        tu: TranslationUnit,
+        spelling: str,
+        extent: SourceRange,
+        function_like: bool,
+    ) -> None:
+        self.tu = tu
+        self.spelling = spelling
+        self.extent = extent
+        self.raw_comment = ""
+        self.comment_extent = SourceRange()
+        self._function_like = function_like
+
+    @property
+    def translation_unit(self) -> TranslationUnit:
+        """
+        The translation unit the macro is in.
+        """
+        return self.tu
+
+    @property
+    def location(self) -> SourceLocation:
+        """
+        The location of the macro's name.
+        """
+        return self.extent.start
+
+    @property
+    def hash(self) -> int:
+        """
+        A hash of the macro, for naming it should it be anonymous.
+        """
+        return hash((self.spelling, self.extent.start.offset))
+
+    def is_macro_function_like(self) -> bool:
+        """
+        Whether the macro takes arguments.
+        """
+        return self._function_like
+
+    def getParsedComment(self) -> Comment:  # noqa: N802
+        """
+        libclang never parses the comments of macros, so this is the null
+        comment.
+        """
+        return Comment()
+
+
+def scan_macros(tu: TranslationUnit) -> List[CursorRecord]:
+    """
+    Find the macro definitions in the main file of `tu`.
+
+    Macros defined within ``#if 0`` blocks are skipped, but other conditions
+    aren't evaluated, so macros in any other inactive blocks are still found.
+
+    Args:
+        tu (:class:`cindex.TranslationUnit`): The translation unit to find the
+            macros of.
+
+    Returns:
+        List[CursorRecord]: A record for each macro definition, in the order
+        they're defined.
+    """
+    source = get_source(tu)
+    main_file = tu.cursor.extent.start.file
+    token_index = get_token_index(tu)
+
+    records = []
+
+    # Each open conditional block as (inactive, taken). `taken` is True once a
+    # branch is known to be active, False if only inactive branches have been
+    # seen and None if a condition couldn't be evaluated.
+    conditions: List[Tuple[bool, Optional[bool]]] = []
+    for match in SCAN_RE.finditer(source):
+        directive = match.group("directive")
+        if directive is None:
+            continue
+
+        rest = match.group("rest")
+        if directive != b"define":
+            condition = CONDITION_NOISE_RE.sub(b" ", rest).strip()
+            _update_conditions(conditions, directive, condition)
+            continue
+
+        if any(inactive for inactive, _ in conditions):
+            continue
+
+        name_match = NAME_RE.match(rest)
+        if name_match is None:
+            continue
+
+        name_start = match.start("rest") + name_match.start(1)
+        name_end = match.start("rest") + name_match.end(1)
+
+        # The extent ends at the last token, ignoring any trailing comments.
+        line_end = match.end()
+        tokens = [
+            t
+            for t in token_index.get_tokens(name_start, line_end)
+            if t.start < line_end and t.kind != COMMENT_KIND
+        ]
+        end = tokens[-1].end if tokens else name_end
+
+        extent = SourceRange.from_locations(
+            SourceLocation.from_offset(tu, main_file, name_start),
+            SourceLocation.from_offset(tu, main_file, end),
+        )
+        function_like = source[name_end : name_end + 1] == b"("
+        name = name_match.group(1).decode("utf-8")
+        macro = ScannedMacro(tu, name, extent, function_like)
+        records.append(CursorRecord(macro, macro.kind, name, "", name_start, None))
+
+    return records
+
+
+def _update_conditions(
+    conditions: List[Tuple[bool, Optional[bool]]], directive: bytes, condition: bytes
+) -> None:
+    """
+    Track the conditional blocks, only the literal ``0`` and ``1`` conditions
+    are evaluated.
+    """
+    if directive in IF_DIRECTIVES:
+        conditions.append(_evaluate(directive, condition, taken=False))
+    elif not conditions:
+        return
+    elif directive == b"elif":
+        _, taken = conditions[-1]
+        if taken:
+            conditions[-1] = (True, True)
+        else:
+            conditions[-1] = _evaluate(directive, condition, taken)
+    elif directive == b"else":
+        _, taken = conditions[-1]
+        conditions[-1] = (bool(taken), True)
+    elif directive == b"endif":
+        conditions.pop()
+
+
+def _evaluate(
+    directive: bytes, condition: bytes, taken: Optional[bool]
+) -> Tuple[bool, Optional[bool]]:
+    """
+    Evaluate an ``#if`` or ``#elif`` branch.
+
+    Returns:
+        Tuple[bool, Optional[bool]]: Whether the branch is inactive, and
+        whether a branch has been taken.
+    """
+    if directive in (b"if", b"elif") and condition == b"0":
+        return True, taken
+    if directive in (b"if", b"elif") and condition == b"1":
+        return False, True
+    return False, None
@@ -7,6 +7,19 @@ functionality.
 # This module deliberately accesses private cindex members while containing the
 # monkey-patching in one place for other consumers.
 
+from array import array
+from ctypes import (
+    POINTER,
+    addressof,
+    byref,
+    c_size_t,
+    c_uint,
+    c_void_p,
+    sizeof,
+    string_at,
+)
+from itertools import repeat
+from operator import sub
 from typing import Any, List, Optional, Tuple, cast
 
 from clang import cindex
@@ -14,6 +27,11 @@ from clang.cindex import Cursor, SourceLocation, SourceRange, TranslationUnit
 
 from sphinx_c_autodoc.clang.comments import Comment, cxstring_to_str
 
+#: The ``CXPrintingPolicyProperty`` values set when printing a declaration.
+#: These are the ``SuppressInitializers``, ``TerseOutput``,
+#: ``PolishForDeclaration`` and ``ConstantsAsWritten`` properties.
+DECLARATION_POLICY = (6, 17, 18, 23)
+
 
 def source_location_is_from_main_file(self: SourceLocation) -> bool:
     """
@@ -104,6 +122,191 @@ def cursor_tu(self: Cursor) -> TranslationUnit:
     return self._tu
 
 
+def cursor_get_declaration(self: Cursor) -> str:
+    """
+    Get the declaration of the cursor as clang prints it.
+
+    This is the declaration clang provides in the XML of a parsed comment,
+    without the initializers of variables, which may be large tables that
+    would only be thrown away.
+
+    Returns:
+        str: The declaration, it may span multiple lines.
+    """
+    lib = cindex.conf.lib
+    policy = lib.clang_getCursorPrintingPolicy(self)
+    try:
+        for policy_property in DECLARATION_POLICY:
+            lib.clang_PrintingPolicy_setProperty(policy, policy_property, 1)
+        declaration = lib.clang_getCursorPrettyPrinted(self, policy)
+    finally:
+        lib.clang_PrintingPolicy_dispose(policy)
+
+    return cxstring_to_str(declaration) or ""
+
+
+def clang_version() -> str:
+    """
+    The version of the libclang being used.
+
+    Returns:
+        str: The libclang version string, i.e. ``clang version 21.1.0``.
+    """
+    return cxstring_to_str(cindex.conf.lib.clang_getClangVersion()) or ""
+
+
+class TokenBuffer:
+    """
+    The tokens of an extent straight from a single ``clang_tokenize`` call.
+
+    The python bindings wrap every token in a :class:`cindex.Token` and then
+    query its kind, spelling and extent with separate calls into libclang. For
+    a whole file that is far more costly than the tokenizing itself. Instead
+    the ``CXToken`` array is kept as is and the kinds, offsets and lengths are
+    read directly out of it as columns, while the spellings are sliced from
+    the source text.
+
+    The ``CXToken`` array is owned by this instance and must be released with
+    :meth:`dispose`, or by using the buffer as a context manager. The
+    :attr:`kinds` and :attr:`lengths` are views into the array so they are
+    only usable until then.
+
+    Arguments:
+        tu (:class:`cindex.TranslationUnit`): The translation unit to tokenize.
+        extent (:class:`cindex.SourceRange`): The extent to tokenize, this
+            must be within a single file.
+
+    Attributes:
+        kinds (memoryview): The ``CXTokenKind`` value of each token.
+        lengths (memoryview): The length, in bytes, of each token.
+        offsets (array): The byte offset of each token in the file.
+    """
+
+    def __init__(self, tu: TranslationUnit, extent: SourceRange) -> None:
+        self._tu = tu
+        self._memory = POINTER(cindex.Token)()
+        self._count = 0
+        self.kinds = memoryview(b"").cast("I")
+        self.lengths = memoryview(b"").cast("I")
+        self.offsets = array("I")
+        self._file = extent.start.file
+
+        count = c_uint()
+        cindex.conf.lib.clang_tokenize(tu, extent, byref(self._memory), byref(count))
+        self._count = count.value
+        if not self._count:
+            return
+
+        # Each CXToken is `unsigned int_data[4]` followed by `void *ptr_data`,
+        # view the array as unsigned ints and take every token's worth.
+        stride = sizeof(cindex.Token) // sizeof(c_uint)
+        words_type = c_uint * (self._count * stride)
+        words = words_type.from_address(addressof(self._memory.contents))
+        columns = memoryview(words).cast("B").cast("I")
+        self.kinds = columns[0::stride]
+        self.lengths = columns[2::stride]
+        self.offsets = self._get_offsets(columns[1::stride])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self) -> "TokenBuffer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.dispose()
+
+    def __del__(self) -> None:
+        self.dispose()
+
+    def dispose(self) -> None:
+        """
+        Release the ``CXToken`` array back to libclang.
+        """
+        if self._memory:
+            self.kinds.release()
+            self.lengths.release()
+            cindex.conf.lib.clang_disposeTokens(self._tu, self._memory, self._count)
+            self._memory = POINTER(cindex.Token)()
+
+    def spellings(self) -> List[str]:
+        """
+        Get the spelling of every token.
+
+        Returns:
+            List[str]: The spelling of each token.
+        """
+        if not self._count:
+            return []
+
+        source = self.source()
+        if source is None:  # pragma: no cover
+            lib = cindex.conf.lib
+            return [
+                lib.clang_getTokenSpelling(self._tu, token)
+                for token in self._memory[: self._count]
+            ]
+
+        first = self.offsets[0]
+        return [
+            source[offset - first : offset - first + length].decode("utf-8", "replace")
+            for offset, length in zip(self.offsets, self.lengths, strict=True)
+        ]
+
+    def _token_offset(self, index: int) -> int:
+        lib = cindex.conf.lib
+        offset = c_uint()
+        location = lib.clang_getTokenLocation(self._tu, self._memory[index])
+        lib.clang_getInstantiationLocation(location, None, None, None, byref(offset))
+        return offset.value
+
+    def _get_offsets(self, raw_locations: memoryview) -> array:
+        """
+        Get the file offsets of the tokens.
+
+        The raw location of a token is its offset in all of the source loaded
+        by libclang, so the tokens of one file are the same distance apart as
+        their offsets. If the last token doesn't line up, each token's offset
+        is asked for instead.
+        """
+        base = raw_locations[0] - self._token_offset(0)
+        offsets = array("I", map(sub, raw_locations, repeat(base, self._count)))
+
+        last = self._count - 1
+        if offsets[last] != self._token_offset(last):  # pragma: no cover
+            offsets = array("I", (self._token_offset(i) for i in range(self._count)))
+
+        raw_locations.release()
+        return offsets
+
+    def source(self) -> Optional[bytes]:
+        """
+        Get the source text the tokens span, as libclang sees it.
+
+        Only the span of the tokens is copied, so tokenizing a small part of
+        a large file stays cheap.
+
+        Returns:
+            bytes: The source from the start of the first token to the end of
+            the last token. None if there are no tokens, or the source isn't
+            available.
+        """
+        if not self._count:
+            return None
+
+        size = c_size_t()
+        contents = cindex.conf.lib.clang_getFileContents(
+            self._tu, self._file, byref(size)
+        )
+        if not contents:  # pragma: no cover
+            return None
+
+        first = self.offsets[0]
+        last = self._count - 1
+        end = self.offsets[last] + self.lengths[last]
+        return string_at(contents + first, end - first)
+
+
 # List of functions which are in the native libclang but aren't normally
 # provided by the python bindings of clang.
 FUNCTION_LIST: List[Tuple] = [
@@ -116,6 +319,32 @@ FUNCTION_LIST: List[Tuple] = [
         [Comment],
         cindex._CXString,
     ),
+    ("clang_getClangVersion", [], cindex._CXString),
+    ("clang_Comment_getKind", [Comment], c_uint),
+    ("clang_Comment_getNumChildren", [Comment], c_uint),
+    ("clang_Comment_getChild", [Comment, c_uint], Comment),
+    ("clang_Comment_isWhitespace", [Comment], c_uint),
+    ("clang_TextComment_getText", [Comment], cindex._CXString),
+    ("clang_InlineCommandComment_getCommandName", [Comment], cindex._CXString),
+    ("clang_InlineCommandComment_getRenderKind", [Comment], c_uint),
+    ("clang_InlineCommandComment_getNumArgs", [Comment], c_uint),
+    ("clang_InlineCommandComment_getArgText", [Comment, c_uint], cindex._CXString),
+    ("clang_HTMLTagComment_getAsString", [Comment], cindex._CXString),
+    ("clang_BlockCommandComment_getCommandName", [Comment], cindex._CXString),
+    ("clang_BlockCommandComment_getParagraph", [Comment], Comment),
+    ("clang_ParamCommandComment_getParamName", [Comment], cindex._CXString),
+    ("clang_ParamCommandComment_isParamIndexValid", [Comment], c_uint),
+    ("clang_ParamCommandComment_getParamIndex", [Comment], c_uint),
+    ("clang_ParamCommandComment_isDirectionExplicit", [Comment], c_uint),
+    ("clang_getCursorPrintingPolicy", [cindex.Cursor], c_void_p),
+    ("clang_PrintingPolicy_setProperty", [c_void_p, c_uint, c_uint]),
+    ("clang_PrintingPolicy_dispose", [c_void_p]),
+    ("clang_getCursorPrettyPrinted", [cindex.Cursor, c_void_p], cindex._CXString),
+    (
+        "clang_getFileContents",
+        [cindex.TranslationUnit, cindex.File, POINTER(c_size_t)],
+        c_void_p,
+    ),
 ]
 
 
@@ -157,6 +386,7 @@ def add_new_methods() -> None:
         cursor_set_comment_extent
     )
     cursor_class.getParsedComment = cursor_get_parsed_comment
+    cursor_class.get_declaration = cursor_get_declaration
     cursor_class.is_macro_function_like = cursor_is_macro_function_like
     cursor_class.tu = property(cursor_tu)
 
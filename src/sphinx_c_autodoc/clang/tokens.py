@@ -0,0 +1,242 @@
+"""
+Provide a single tokenization of a translation unit's main file.
+
+Tokenizing with libclang has a fixed cost for every call, so tokenizing each
+construct on its own adds up quickly for large headers. Instead the main file
+is tokenized once and the constructs look up their tokens by offset.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from ctypes import byref, c_size_t, string_at
+from operator import add
+from typing import Any, Iterator, List, Optional, cast
+
+from clang import cindex
+from clang.cindex import Cursor, SourceRange, TranslationUnit
+
+from sphinx_c_autodoc.clang.patches import TokenBuffer
+
+#: A token of a :class:`TokenIndex`. The `start` and `end` are the byte
+#: offsets of the token in the main file, `end` being exclusive.
+IndexedToken = namedtuple("IndexedToken", ["kind", "spelling", "start", "end"])
+
+
+class TokenIndex:
+    """
+    All of the tokens in the main file of a translation unit, sorted by offset.
+
+    The tokens are held as columns of their kinds and offsets, along with the
+    source text. The :class:`IndexedToken`\'s are only created for the tokens
+    asked for, so large initializers and tables cost little until they're
+    looked at.
+
+    The index holds no reference to the translation unit so it can be stored on
+    the translation unit without creating a reference cycle, see
+    :func:`get_token_index`.
+
+    Arguments:
+        tu (:class:`~clang.cindex.TranslationUnit`): The translation unit to
+            tokenize the main file of.
+    """
+
+    __slots__ = ("_ends", "_kinds", "_source", "_source_start", "_spellings", "_starts")
+
+    def __init__(self, tu: TranslationUnit) -> None:
+        with TokenBuffer(tu, tu.cursor.extent) as buffer:
+            self._starts = buffer.offsets
+            self._ends = array("I", map(add, buffer.offsets, buffer.lengths))
+            self._kinds = array("I", buffer.kinds.tobytes())
+            self._source = buffer.source()
+            self._spellings: Optional[List[str]] = None
+            if self._source is None:  # pragma: no cover
+                self._spellings = buffer.spellings()
+
+        self._source_start = self._starts[0] if self._starts else 0
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, index: int) -> IndexedToken:
+        start = self._starts[index]
+        end = self._ends[index]
+        if self._spellings is not None:  # pragma: no cover
+            spelling = self._spellings[index]
+        else:
+            source_start = self._source_start
+            raw = cast(bytes, self._source)[start - source_start : end - source_start]
+            spelling = raw.decode("utf-8", "replace")
+
+        kind = cindex.TokenKind.from_value(self._kinds[index])
+        return IndexedToken(kind, spelling, start, end)
+
+    def get_tokens(self, start: int, end: int) -> List[IndexedToken]:
+        """
+        Get the tokens in the range of `start` to `end`.
+
+        The range is handled the same way ``clang_tokenize`` handles it so
+        that the results match tokenizing the range directly. Tokens begin with
+        the first token at, or after, `start` and continue up to, and
+        including, the first token that ends at, or after, `end`. This means
+        at least one token is provided as long as there is one after `start`.
+
+        Args:
+            start (int): The byte offset of the start of the range.
+            end (int): The byte offset of the end of the range.
+
+        Returns:
+            List[IndexedToken]: The tokens in the range.
+        """
+        first = bisect_left(self._starts, start)
+        if first == len(self._starts):
+            return []
+
+        last = bisect_left(self._ends, end, lo=first)
+        last = min(last, len(self._starts) - 1)
+        return [self[i] for i in range(first, last + 1)]
+
+    def iter_tokens(self, start: int) -> Iterator[IndexedToken]:
+        """
+        Iterate over the tokens from `start` to the end of the file.
+
+        Tokens are only created as they're iterated over, so this is the way to
+        look through the start of a large construct without knowing where to
+        stop.
+
+        Args:
+            start (int): The byte offset to start at, the first token is the
+                first one at, or after, this offset.
+
+        Yields:
+            IndexedToken: The tokens, in order, from `start`.
+        """
+        for i in range(bisect_left(self._starts, start), len(self._starts)):
+            yield self[i]
+
+    def get_extent_tokens(self, extent: SourceRange) -> List[IndexedToken]:
+        """
+        Get the tokens in `extent`, the equivalent of
+        :meth:`Cursor.get_tokens`.
+
+        Args:
+            extent (:class:`~clang.cindex.SourceRange`): The extent, in the
+                main file, to get the tokens of.
+
+        Returns:
+            List[IndexedToken]: The tokens in `extent`.
+        """
+        return self.get_tokens(extent.start.offset, extent.end.offset)
+
+
+def tokenize(tu: TranslationUnit, extent: SourceRange) -> List[IndexedToken]:
+    """
+    Tokenize `extent` of the main file of `tu`.
+
+    Args:
+        tu (:class:`~clang.cindex.TranslationUnit`): The translation unit to
+            tokenize.
+        extent (:class:`~clang.cindex.SourceRange`): The extent to tokenize.
+
+    Returns:
+        List[IndexedToken]: The tokens of `extent` in the order they appear.
+    """
+    with TokenBuffer(tu, extent) as buffer:
+        kinds = {k: cindex.TokenKind.from_value(k) for k in set(buffer.kinds)}
+        return [
+            IndexedToken(kinds[kind], spelling, offset, offset + length)
+            for kind, spelling, offset, length in zip(
+                buffer.kinds,
+                buffer.spellings(),
+                buffer.offsets,
+                buffer.lengths,
+                strict=True,
+            )
+        ]
+
+
+def get_token_index(tu: TranslationUnit) -> TokenIndex:
+    """
+    Get the token index of `tu`, creating it on first use.
+
+    Args:
+        tu (:class:`~clang.cindex.TranslationUnit`): The translation unit to
+            get the token index of.
+
+    Returns:
+        TokenIndex: The token index of `tu`'s main file.
+    """
+    token_index: Optional[TokenIndex] = getattr(tu, "_token_index", None)
+    if token_index is None:
+        token_index = TokenIndex(tu)
+        cast(Any, tu)._token_index = token_index
+
+    return token_index
+
+
+def get_source(tu: TranslationUnit) -> bytes:
+    """
+    Get the source of the main file of `tu`, as libclang sees it, creating it on
+    first use.
+
+    Args:
+        tu (:class:`~clang.cindex.TranslationUnit`): The translation unit to
+            get the source of.
+
+    Returns:
+        bytes: The contents of `tu`'s main file.
+    """
+    source: Optional[bytes] = getattr(tu, "_source", None)
+    if source is None:
+        size = c_size_t()
+        main_file = tu.cursor.extent.start.file
+        contents = cindex.conf.lib.clang_getFileContents(tu, main_file, byref(size))
+        source = string_at(contents, size.value) if contents else b""
+        cast(Any, tu)._source = source
+
+    return source
+
+
+def get_first_token(tu: TranslationUnit) -> Optional[IndexedToken]:
+    """
+    Get the first token of the main file of `tu`.
+
+    When the token index hasn't been created only the first token is
+    tokenized, so this doesn't depend on the size of the file.
+
+    Args:
+        tu (:class:`~clang.cindex.TranslationUnit`): The translation unit to
+            get the first token of.
+
+    Returns:
+        IndexedToken: The first token, None for an empty file.
+    """
+    token_index: Optional[TokenIndex] = getattr(tu, "_token_index", None)
+    if token_index is not None:
+        return token_index[0] if token_index else None
+
+    # ``clang_tokenize`` always provides the token at the start of a range, so
+    # an empty range at the start of the file is just the first token.
+    start = tu.cursor.extent.start
+    tokens = tokenize(tu, SourceRange.from_locations(start, start))
+    return tokens[0] if tokens else None
+
+
+def token_extent(cursor: Cursor, token: IndexedToken) -> SourceRange:
+    """
+    Create the extent of `token`.
+
+    Args:
+        cursor (:class:`~clang.cindex.Cursor`): A cursor in the main file of
+            the translation unit `token` came from.
+        token (IndexedToken): The token to get the extent of.
+
+    Returns:
+        :class:`~clang.cindex.SourceRange`: The extent of `token`.
+    """
+    tu = cursor.translation_unit
+    file = cursor.extent.start.file
+    return SourceRange.from_locations(
+        cindex.SourceLocation.from_offset(tu, file, token.start),
+        cindex.SourceLocation.from_offset(tu, file, token.end),
+    )
@@ -0,0 +1,340 @@
+"""
+Look up the compile commands of C files in a compilation database.
+
+libclang re-reads the entire compilation database every time one is opened,
+and there's no way to ask it for the commands of more than one file at a time.
+For large projects that means reading, and parsing, a database of many
+megabytes for every C file documented. Instead the database is read once, into
+an index of the commands by file, and only read again when it changes.
+
+libclang is still used for files which aren't in the database, like headers,
+as it infers their commands from similar files which are in the database.
+libclang only reads databases named ``compile_commands.json``, it ignores the
+name of the file, whereas here the named file is always the one read.
+
+See https://clang.llvm.org/docs/JSONCompilationDatabase.html for the format.
+"""
+
+import json
+import os
+import re
+import shlex
+from collections import namedtuple
+from typing import IO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from clang import cindex
+
+#: The entry used when a file is in the compilation database more than once.
+#:
+#: - first: The first entry for the file, this is what libclang provides.
+#: - last: The last entry for the file, for databases where later builds are
+#:   appended to earlier ones.
+ENTRY_POLICIES = ("first", "last")
+
+#: The amount of the compilation database to read at a time, in characters.
+CHUNK_SIZE = 1024 * 1024
+
+#: Compiler launchers which are removed from the start of the commands, the
+#: same ones libclang removes.
+COMPILER_WRAPPERS = ("ccache", "distcc", "sccache")
+
+#: Extensions of source files, a launcher followed by one of these is given the
+#: source file rather than a compiler.
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".i", ".ii", ".m", ".mm")
+
+#: The end of the whitespace between the entries of the compilation database.
+NON_WHITESPACE_RE = re.compile(r"\S")
+
+#: A compile command of a file in the compilation database.
+#:
+#: - directory: The working directory of the compilation.
+#: - arguments: The arguments, as a tuple, or the command, as a string, the
+#:   file is compiled with. Commands are only split into arguments once
+#:   they're asked for.
+CompileCommand = namedtuple("CompileCommand", ["directory", "arguments"])
+
+# The compilation databases which have been read in this process, keyed by
+# their absolute path, see :func:`get_compilation_database`.
+_databases: Dict[str, Tuple[Tuple[int, int], "CompilationDatabase"]] = {}
+
+
+class CompilationDatabase:
+    """
+    The compile commands of a compilation database, indexed by the normalized
+    absolute path of each file.
+
+    Arguments:
+        filename (str): The compilation database to read.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._commands: Dict[str, List[CompileCommand]] = {}
+        self._args: Dict[Tuple[str, str], List[str]] = {}
+        self._inferred: Optional[cindex.CompilationDatabase] = None
+
+        with open(filename, encoding="utf-8") as f:
+            for entry in iter_entries(f):
+                self._add_entry(entry)
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def get_commands(self, filename: str) -> List[CompileCommand]:
+        """
+        Get the compile commands of `filename`.
+
+        Args:
+            filename (str): The file to get the commands of.
+
+        Returns:
+            List[CompileCommand]: The commands of `filename` in the order they
+            are in the database. Empty if `filename` isn't in the database.
+        """
+        return self._commands.get(normalize_path(filename), [])
+
+    def infer_commands(self, filename: str) -> List[CompileCommand]:
+        """
+        Get the compile commands libclang infers for `filename`, a file which
+        isn't in the database.
+
+        libclang only reads databases named ``compile_commands.json``, so
+        nothing is inferred for databases with other names.
+
+        Args:
+            filename (str): The file to infer the commands of.
+
+        Returns:
+            List[CompileCommand]: The inferred commands of `filename`.
+        """
+        if os.path.basename(self.filename) != "compile_commands.json":
+            return []
+
+        if self._inferred is None:
+            directory = os.path.dirname(self.filename)
+            try:
+                self._inferred = cindex.CompilationDatabase.fromDirectory(directory)
+            except cindex.CompilationDatabaseError:
+                return []
+
+        commands = self._inferred.getCompileCommands(filename) or []
+        return [CompileCommand(c.directory, tuple(c.arguments)) for c in commands]
+
+    def get_args(self, filename: str, policy: str = "first") -> List[str]:
+        """
+        Get the arguments to parse `filename` with.
+
+        The compiler and the file itself are removed from the arguments and a
+        ``-working-directory`` is added, so that relative paths in the
+        arguments are relative to the directory of the entry.
+
+        Args:
+            filename (str): The file to get the arguments of.
+            policy (str): Which entry to use when `filename` has more than one,
+                see :data:`ENTRY_POLICIES`.
+
+        Returns:
+            List[str]: The arguments for `filename`. Empty if `filename` isn't
+            in the database.
+        """
+        key = (normalize_path(filename), policy)
+        args = self._args.get(key)
+        if args is None:
+            args = self._args[key] = self._create_args(filename, policy)
+
+        # Callers are free to add to the arguments.
+        return list(args)
+
+    def _create_args(self, filename: str, policy: str) -> List[str]:
+        commands = self.get_commands(filename) or self.infer_commands(filename)
+        if not commands:
+            return []
+
+        command = commands[-1] if policy == "last" else commands[0]
+        arguments = command.arguments
+        if isinstance(arguments, str):
+            arguments = shlex.split(arguments)
+        arguments = expand_response_files(arguments, command.directory)
+
+        # First argument is compiler path, last is the file to compile
+        args = unwrap_compiler(arguments)[1:-1]
+
+        # Since things like includes and defines could be relative we force the
+        # working directory.
+        args.append(f"-working-directory={command.directory}")
+        return args
+
+    def _add_entry(self, entry: Dict[str, object]) -> None:
+        directory = entry.get("directory")
+        file_ = entry.get("file")
+        arguments = entry.get("arguments")
+        if arguments is None:
+            arguments = entry.get("command")
+        elif isinstance(arguments, list):
+            arguments = tuple(arguments)
+
+        if not (
+            isinstance(directory, str)
+            and isinstance(file_, str)
+            and isinstance(arguments, (str, tuple))
+        ):
+            return
+
+        path = normalize_path(os.path.join(directory, file_))
+        self._commands.setdefault(path, []).append(CompileCommand(directory, arguments))
+
+
+def get_compilation_database(filename: str) -> CompilationDatabase:
+    """
+    Get the compilation database `filename`, reading it on first use.
+
+    The database is read again whenever its modification time or size
+    changes.
+
+    Args:
+        filename (str): The compilation database.
+
+    Returns:
+        CompilationDatabase: The compile commands in `filename`.
+
+    Raises:
+        OSError: When `filename` can't be read.
+        ValueError: When `filename` isn't a JSON array of entries.
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _databases.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    database = CompilationDatabase(path)
+    _databases[path] = (stamp, database)
+    return database
+
+
+def iter_entries(stream: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Iterate over the entries of a compilation database.
+
+    The database is read, and decoded, a chunk at a time. Only the current
+    chunk of the text is held on to, not the entire database.
+
+    Args:
+        stream (IO[str]): The compilation database to read.
+        chunk_size (int): The number of characters to read at a time.
+
+    Yields:
+        dict: Each entry, in the order they are in the database.
+
+    Raises:
+        ValueError: When `stream` isn't a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size)
+    position = skip_whitespace(buffer, 0)
+    if buffer[position : position + 1] != "[":
+        raise ValueError("A compilation database must be a JSON array")
+    position += 1
+
+    while True:
+        position = skip_whitespace(buffer, position)
+        text = buffer[position : position + 1]
+        if text == "]":
+            return
+
+        if text == ",":
+            position += 1
+            continue
+
+        try:
+            entry, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Either the buffer ends part way through an entry, or it's been
+            # used up, so the next chunk is needed.
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise ValueError(
+                    "A compilation database must be a JSON array"
+                ) from None
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        if isinstance(entry, dict):
+            yield entry
+        position = end
+
+
+def skip_whitespace(text: str, position: int) -> int:
+    """
+    Get the position of the first non whitespace character of `text` at, or
+    after, `position`.
+    """
+    match = NON_WHITESPACE_RE.search(text, position)
+    return match.start() if match else len(text)
+
+
+def expand_response_files(arguments: Sequence[str], directory: str) -> List[str]:
+    """
+    Replace the ``@file`` arguments with the arguments in the file, the same
+    as the compiler would.
+
+    Args:
+        arguments (Sequence[str]): The arguments of a compile command.
+        directory (str): The directory relative response files are in.
+
+    Returns:
+        List[str]: The expanded arguments. Response files which can't be read
+        are left as they are.
+    """
+    expanded = []
+    for argument in arguments:
+        if argument.startswith("@"):
+            try:
+                with open(os.path.join(directory, argument[1:]), encoding="utf-8") as f:
+                    expanded.extend(shlex.split(f.read()))
+                continue
+            except OSError:
+                pass
+        expanded.append(argument)
+
+    return expanded
+
+
+def unwrap_compiler(arguments: List[str]) -> List[str]:
+    """
+    Remove any compiler launchers, like ``ccache``, from the start of
+    `arguments`.
+
+    Args:
+        arguments (List[str]): The arguments of a compile command.
+
+    Returns:
+        List[str]: The arguments starting at the compiler.
+    """
+    while len(arguments) > 1:
+        wrapper, _ = os.path.splitext(os.path.basename(arguments[0]))
+        compiler = arguments[1]
+        has_compiler = not compiler.startswith("-") and not compiler.endswith(
+            SOURCE_EXTENSIONS
+        )
+        if wrapper not in COMPILER_WRAPPERS or not has_compiler:
+            break
+        arguments = arguments[1:]
+
+    return arguments
+
+
+def normalize_path(filename: str) -> str:
+    """
+    Normalize `filename` for looking up in the compilation database.
+
+    Args:
+        filename (str): The path to normalize.
+
+    Returns:
+        str: The absolute, normalized, path of `filename`.
+    """
+    return os.path.normcase(os.path.normpath(os.path.abspath(filename)))
@@ -0,0 +1,456 @@
+"""
+Track which C constructs each document renders, so that changing a C file only
+reads again the documents whose constructs changed.
+
+Sphinx's dependencies are whole files. Any change to a C file, or a header it
+includes, reads again every document which documents anything from it. With
+``c_autodoc_construct_dependencies`` each document instead records a
+fingerprint of the constructs it documented. Before the documents are read,
+the C files which changed are loaded again and only the documents whose
+fingerprints no longer match are outdated.
+
+The C files themselves are no longer dependencies of the documents, so a file
+can change without any document being read again. Each changed file is
+announced with the ``c-autodoc-module-changed`` event, so that extensions like
+viewcode can update what they keep of it.
+"""
+
+import hashlib
+import os
+import re
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+from sphinx_c_autodoc.cache import find_compilation_database
+from sphinx_c_autodoc.loader import DocumentedObject
+from sphinx_c_autodoc.preparse import find_c_file, load_c_file
+
+#: The attribute of the :class:`BuildEnvironment` holding the
+#: :class:`Fingerprints`.
+FINGERPRINTS_ATTRIBUTE = "_c_autodoc_fingerprints"
+
+#: The names given to anonymous constructs, these are based on libclang's hash
+#: of the cursor which differs between parses.
+ANON_NAME_RE = re.compile(r"\banon_\w+_\d+\b")
+
+#: A construct documented by a directive.
+#:
+#: - modname: The C file, as written in the directive.
+#: - objpath: The names leading to the construct within the C file, empty for
+#:   the C file itself.
+#: - members: Whether the children of the construct were documented too.
+ConstructKey = namedtuple("ConstructKey", ["modname", "objpath", "members"])
+
+#: The modification time and size of a file, ``(-1, -1)`` when it's missing.
+FileStamp = Tuple[str, int, int]
+
+logger = logging.getLogger(__name__)
+
+
+class Fingerprints:
+    """
+    The fingerprints of the constructs documented by each document.
+
+    Unlike the module cache, these are pickled with the environment so they
+    can be compared against on the next build.
+
+    Attributes:
+        documents (Dict[str, Dict[ConstructKey, str]]): The fingerprint of each
+            construct documented, by document.
+        stamps (Dict[str, Tuple[FileStamp, ...]]): The stamps of each C file,
+            and the headers it depends on, from when it was last loaded.
+        stamped (Set[str]): The C files stamped during this build, these are
+            never pickled.
+        unchanged (Set[str]): The documents of C files which changed during
+            this build, without any of their constructs changing. These are
+            never pickled.
+    """
+
+    def __init__(self) -> None:
+        self.documents: Dict[str, Dict[ConstructKey, str]] = {}
+        self.stamps: Dict[str, Tuple[FileStamp, ...]] = {}
+        self.stamped: Set[str] = set()
+        self.unchanged: Set[str] = set()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Which files were stamped only matters to the current build.
+        """
+        return {
+            "documents": self.documents,
+            "stamps": self.stamps,
+            "stamped": set(),
+            "unchanged": set(),
+        }
+
+    def add(self, docname: str, key: ConstructKey, digest: str) -> None:
+        """
+        Record the fingerprint of a construct documented by `docname`.
+
+        Args:
+            docname (str): The document the construct is documented in.
+            key (ConstructKey): The construct.
+            digest (str): The fingerprint of the construct, see
+                :func:`fingerprint`.
+        """
+        self.documents.setdefault(docname, {})[key] = digest
+
+    def stamp(self, filename: str, dependencies: Iterable[str]) -> None:
+        """
+        Record the stamps of `filename`, and its `dependencies`, once per
+        build.
+
+        Args:
+            filename (str): The full path of the C file.
+            dependencies (Iterable[str]): The headers `filename` depends on.
+        """
+        if filename in self.stamped:
+            return
+
+        self.stamps[filename] = file_stamps([filename, *dependencies])
+        self.stamped.add(filename)
+
+    def purge(self, docname: str) -> None:
+        """
+        Forget the constructs of `docname`.
+
+        Args:
+            docname (str): The document being removed from the environment.
+        """
+        self.documents.pop(docname, None)
+
+    def merge(self, docnames: Iterable[str], other: "Fingerprints") -> None:
+        """
+        Merge in the fingerprints of `docnames` from `other`.
+
+        Args:
+            docnames (Iterable[str]): The documents read by `other`.
+            other (Fingerprints): The fingerprints of a parallel reading
+                process.
+        """
+        for docname in docnames:
+            if docname in other.documents:
+                self.documents[docname] = other.documents[docname]
+        self.stamps.update(other.stamps)
+
+
+def get_fingerprints(env: BuildEnvironment) -> Fingerprints:
+    """
+    Get the fingerprints of `env`, creating them if needed.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        Fingerprints: The fingerprints of the documented constructs.
+    """
+    fingerprints = getattr(env, FINGERPRINTS_ATTRIBUTE, None)
+    if fingerprints is None:
+        fingerprints = Fingerprints()
+        setattr(env, FINGERPRINTS_ATTRIBUTE, fingerprints)
+    return fingerprints
+
+
+def get_include_dependencies(
+    env: BuildEnvironment, module: DocumentedObject
+) -> List[str]:
+    """
+    Get the headers included by `module` which are dependencies of the
+    documents documenting it, as limited by ``c_autodoc_include_dependencies``.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        module (DocumentedObject): The loaded C file.
+
+    Returns:
+        List[str]: The full path of each header.
+    """
+    setting = env.config.c_autodoc_include_dependencies
+    if setting == "none":
+        return []
+
+    includes = getattr(module, "includes", ())
+    if setting == "roots":
+        roots = tuple(
+            os.path.join(env.relfn2path(f"/{root}")[1], "")
+            for root in env.config.c_autodoc_roots
+        )
+        return [i for i in includes if i.startswith(roots)]
+
+    return list(includes)
+
+
+def file_stamps(filenames: Sequence[str]) -> Tuple[FileStamp, ...]:
+    """
+    Get the modification time and size of each of `filenames`.
+
+    Args:
+        filenames (Sequence[str]): The files to stamp.
+
+    Returns:
+        Tuple[FileStamp, ...]: The stamp of each file, in the same order.
+    """
+    stamps = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+            stamps.append((filename, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append((filename, -1, -1))
+
+    return tuple(stamps)
+
+
+def fingerprint(obj: DocumentedObject, members: bool) -> str:
+    """
+    Create a fingerprint of what's documented for `obj`.
+
+    Only what ends up in the document is included, so moving a construct
+    within its file, or changing another construct, leaves the fingerprint
+    alone.
+
+    Args:
+        obj (DocumentedObject): The construct to fingerprint.
+        members (bool): Whether to include the children of `obj`.
+
+    Returns:
+        str: The fingerprint of `obj`.
+    """
+    digest = hashlib.sha256()
+    _update_fingerprint(digest, obj, members)
+    return digest.hexdigest()
+
+
+def _update_fingerprint(digest: Any, obj: DocumentedObject, members: bool) -> None:
+    for part in (
+        obj.type,
+        obj.name,
+        obj.format_name(),
+        obj.format_args(),
+        obj.declaration,
+        obj.get_doc(),
+        str(obj.is_public()),
+    ):
+        digest.update(ANON_NAME_RE.sub("anon", part or "").encode("utf-8"))
+        digest.update(b"\0")
+
+    if not members:
+        return
+
+    for child in obj.children.values():
+        digest.update(b"{")
+        _update_fingerprint(digest, child, members)
+        digest.update(b"}")
+
+
+def resolve_construct(
+    module: DocumentedObject, objpath: Sequence[str]
+) -> Optional[DocumentedObject]:
+    """
+    Find the construct at `objpath` in `module`.
+
+    Returns:
+        DocumentedObject: The construct, None when it's no longer in `module`.
+    """
+    obj = module
+    for name in objpath:
+        child = obj.children.get(name)
+        if child is None:
+            return None
+        obj = child
+
+    return obj
+
+
+def note_construct(
+    env: BuildEnvironment,
+    filename: str,
+    module: DocumentedObject,
+    key: ConstructKey,
+    obj: DocumentedObject,
+) -> None:
+    """
+    Record the fingerprint of `obj` for the current document.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        filename (str): The full path of the C file `obj` is in.
+        module (DocumentedObject): The loaded C file.
+        key (ConstructKey): The construct being documented.
+        obj (DocumentedObject): The construct at ``key.objpath`` in `module`.
+    """
+    fingerprints = get_fingerprints(env)
+    fingerprints.add(env.docname, key, fingerprint(obj, key.members))
+    fingerprints.stamp(filename, get_include_dependencies(env, module))
+
+
+def find_changed_constructs(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """
+    Find the documents whose documented constructs have changed.
+
+    Only the C files whose stamps changed are loaded again, and only when a
+    document which hasn't already been outdated documents them. Each file
+    loaded again is announced with the ``c-autodoc-module-changed`` event,
+    rather than ``c-autodoc-module-loaded``, as its documents may not be read.
+
+    Meant to be connected to the `env-get-outdated` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The current build environment.
+        added (Set[str]): The documents added since the last build.
+        changed (Set[str]): The documents Sphinx found to have changed.
+        removed (Set[str]): The documents removed since the last build.
+
+    Returns:
+        List[str]: The documents to read again.
+    """
+    if not app.config.c_autodoc_construct_dependencies:
+        return []
+
+    fingerprints = get_fingerprints(env)
+    fingerprints.stamped.clear()
+    fingerprints.unchanged.clear()
+    skip = added | changed | removed
+
+    outdated: Set[str] = set()
+    by_file = _group_by_file(env, fingerprints, skip, outdated)
+
+    compilation_db, exists = find_compilation_database(env)
+    if not exists:
+        compilation_db = None
+
+    for filename, documents in by_file.items():
+        stamps = fingerprints.stamps.get(filename)
+        if stamps is not None and stamps == file_stamps([s[0] for s in stamps]):
+            continue
+
+        modname = next(iter(documents.values()))[0].modname
+        try:
+            module, contents = load_c_file(env, filename, compilation_db)
+        except Exception as error:
+            logger.debug("[c_autodoc] unable to load %s: %s", filename, error)
+            outdated.update(documents)
+            continue
+
+        if contents is not None:
+            app.emit("c-autodoc-module-changed", modname, filename, contents, module)
+
+        fingerprints.stamp(filename, get_include_dependencies(env, module))
+        for docname, keys in documents.items():
+            if _constructs_changed(module, keys, fingerprints.documents[docname]):
+                outdated.add(docname)
+            else:
+                fingerprints.unchanged.add(docname)
+
+    fingerprints.unchanged -= outdated
+    return sorted(outdated)
+
+
+def _group_by_file(
+    env: BuildEnvironment,
+    fingerprints: Fingerprints,
+    skip: Set[str],
+    outdated: Set[str],
+) -> Dict[str, Dict[str, List[ConstructKey]]]:
+    # The documents, and their constructs, of each C file which may have changed.
+    # Documents of C files which can no longer be found are outdated.
+    by_file: Dict[str, Dict[str, List[ConstructKey]]] = {}
+    for docname, constructs in fingerprints.documents.items():
+        if docname in skip:
+            continue
+
+        for key in constructs:
+            found = find_c_file(env, key.modname)
+            if found is None:
+                outdated.add(docname)
+                continue
+
+            by_file.setdefault(found[1], {}).setdefault(docname, []).append(key)
+
+    return by_file
+
+
+def _constructs_changed(
+    module: DocumentedObject,
+    keys: Iterable[ConstructKey],
+    digests: Dict[ConstructKey, str],
+) -> bool:
+    for key in keys:
+        obj = resolve_construct(module, key.objpath)
+        if obj is None or fingerprint(obj, key.members) != digests[key]:
+            return True
+    return False
+
+
+def save_unchanged_documents(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """
+    Get the documents of C files which changed without any of their
+    constructs changing.
+
+    Sphinx only saves the environment when a document was read or is to be
+    written. Returning these documents writes them again, so that the new
+    stamps of their C files, and anything kept of the files by the
+    ``c-autodoc-module-changed`` event, are saved with the environment.
+    Otherwise every later build would load the files again.
+
+    Meant to be connected to the `env-updated` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        List[str]: The documents to write again.
+    """
+    fingerprints = getattr(env, FINGERPRINTS_ATTRIBUTE, None)
+    if fingerprints is None:
+        return []
+
+    return sorted(fingerprints.unchanged)
+
+
+def purge_fingerprints(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    """
+    Forget the constructs of `docname`.
+
+    Meant to be connected to the `env-purge-doc` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The current build environment.
+        docname (str): The document being removed from the environment.
+    """
+    fingerprints = getattr(env, FINGERPRINTS_ATTRIBUTE, None)
+    if fingerprints is not None:
+        fingerprints.purge(docname)
+
+
+def merge_fingerprints(
+    app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment
+) -> None:
+    """
+    Merge the fingerprints from a parallel reading process, `other`, into `env`.
+
+    Meant to be connected to the `env-merge-info` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The main build environment.
+        docnames (Set[str]): The documents read by `other`.
+        other (BuildEnvironment): The environment of the process which read
+            `docnames`.
+    """
+    other_fingerprints = getattr(other, FINGERPRINTS_ATTRIBUTE, None)
+    if other_fingerprints is not None:
+        get_fingerprints(env).merge(docnames, other_fingerprints)
@@ -5,17 +5,33 @@ Load the c file objects
 import json
 import os
 import re
+import sys
 import textwrap
-from collections import OrderedDict, namedtuple
+from collections import namedtuple
 from itertools import takewhile
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, cast
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union, cast
 
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 from clang import cindex
 from clang.cindex import Cursor, StorageClass, Token
 
+from sphinx_c_autodoc.clang.comments import Comment, CommentParts
+from sphinx_c_autodoc.clang.cursors import (
+    NESTED_KINDS,
+    CursorRecord,
+    collect_children,
+    make_record,
+)
+from sphinx_c_autodoc.clang.macros import scan_macros
 from sphinx_c_autodoc.clang.patches import patch_clang
+from sphinx_c_autodoc.clang.tokens import (
+    IndexedToken,
+    get_first_token,
+    get_source,
+    get_token_index,
+    token_extent,
+)
+from sphinx_c_autodoc.compilation_database import get_compilation_database
 
 #: Nodes which clang doesn't autopopulate with the associated comment
 UNDOCUMENTED_NODES = (cindex.CursorKind.MACRO_DEFINITION,)
@@ -31,12 +47,48 @@ TRAILING_COMMENT_START = ("/**<", "/*!<", "///<")
 #: often used to use the enumerators but not force the type usage.
 ALLOWED_ANONYMOUS = (cindex.CursorKind.ENUM_DECL,)
 
+#: The ``CXTranslationUnit_KeepGoing`` option, the python bindings don't
+#: provide it.
+PARSE_KEEP_GOING = 0x200
+
+#: The translation unit options which can be set with
+#: ``c_autodoc_parse_options``.
+PARSE_OPTIONS = {
+    "skip_function_bodies": cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES,
+    "incomplete": cindex.TranslationUnit.PARSE_INCOMPLETE,
+    "keep_going": PARSE_KEEP_GOING,
+    "scan_macros": 0,
+}
+
+#: The parse option which finds the macros by scanning the source, see
+#: :func:`~sphinx_c_autodoc.clang.macros.scan_macros`, rather than from the
+#: detailed processing record.
+SCAN_MACROS = "scan_macros"
+
 # Must do this prior to calling into clang
 patch_clang()
 
+# The index shared by every parse, keyed by the process it was created in, see
+# :func:`get_index`.
+_indexes: Dict[int, cindex.Index] = {}
+
+#: Whitespace and comments, which may come before a function body.
+BLOCK_PREFIX_RE = re.compile(rb"(?:\s+|/\*.*?\*/|//[^\n]*)*", re.DOTALL)
+
+#: The parts of a block which matter for matching up braces. Comments and
+#: literals are matched so the braces within them are ignored.
+BLOCK_CONTENTS_RE = re.compile(
+    rb"[{}]|/\*.*?\*/|//[^\n]*|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'",
+    re.DOTALL,
+)
+
 #: A light container to mimic a :class:`cindex.Token` for comments.
 PsuedoToken = namedtuple("PsuedoToken", ["spelling", "extent"])
 
+#: The children of every construct which has none. Shared so that leaf
+#: constructs, the vast majority, don't each allocate an empty container.
+NO_CHILDREN: Mapping[str, "DocumentedObject"] = MappingProxyType({})
+
 
 class DocumentedObject:
     """
@@ -63,27 +115,81 @@ class DocumentedObject:
         name (str): The name of the object. For example functions this would
             be *only* the name of the function.
         node (:class:`~clang.cindex.Cursor`): The node representing this object.
+            This is None once the object has been frozen, see :meth:`freeze`.
         _children: The children of the object. For
-            example for structs this would be the members or fields.
-        _soup (:class:`~bs4.BeautifulSoup`): The soupified version of
-            :attr:`node`'s clang xml comment.
+            example for structs this would be the members or fields. None
+            when the object has no children.
+        _comment_parts (CommentParts): The parts of :attr:`node`'s parsed
+            clang comment.
         _declaration (str): The declaration string. For most things this is
             the type as well as the name.
         _line_range (Tuple[int, int]): The line range of the C construct,
             this will include any leading or trailing comments that may be
             part of the construct's documentation.
+        _documentation (str): The cached result of :meth:`get_doc`.
+        _public (bool): The cached result of :meth:`is_public`.
     """
 
     type_ = "object"
 
+    # Some headers have tens of thousands of constructs, slots keep the per
+    # construct memory down.
+    __slots__ = (
+        "_children",
+        "_comment_parts",
+        "_declaration",
+        "_documentation",
+        "_line_range",
+        "_public",
+        "doc",
+        "name",
+        "node",
+    )
+
     def __init__(self, node: Cursor) -> None:
         self.doc = ""
         self.name = ""
-        self.node = node
-        self._children: Optional[OrderedDict] = None
-        self._soup: Optional[BeautifulSoup] = None
+        self.node: Optional[Cursor] = node
+        self._children: Optional[Dict[str, DocumentedObject]] = None
+        self._comment_parts: Optional[CommentParts] = None
         self._declaration: Optional[str] = None
         self._line_range: Optional[Tuple[int, int]] = None
+        self._documentation: Optional[str] = None
+        self._public: Optional[bool] = None
+
+    @property
+    def cursor(self) -> Cursor:
+        """
+        The node representing this object.
+
+        Raises:
+            ValueError: If this object has been frozen, see :meth:`freeze`.
+        """
+        if self.node is None:
+            raise ValueError(f"{self.name} has been frozen and no longer has a node")
+        return self.node
+
+    def freeze(self) -> None:
+        """
+        Compute everything needed to document this object, and its children,
+        and then let go of :attr:`node`.
+
+        A frozen object no longer references any libclang data, so it can be
+        pickled and outlive the translation unit it was loaded from.
+        """
+        self.line_range()
+        _ = self.declaration
+        self.get_doc()
+        self.is_public()
+
+        for child in self.children.values():
+            child.freeze()
+
+        if not self._children:
+            self._children = None
+
+        self.node = None
+        self._comment_parts = None
 
     def line_range(self) -> Tuple[int, int]:
         """
@@ -93,8 +199,8 @@ class DocumentedObject:
         of the construct's documentation.
         """
         if self._line_range is None:
-            node_extent = self.node.extent
-            comment_extent = self.node.comment_extent
+            node_extent = self.cursor.extent
+            comment_extent = self.cursor.comment_extent
             if comment_extent.start.file is None:
                 comment_extent = node_extent
 
@@ -113,12 +219,12 @@ class DocumentedObject:
         return self.type_
 
     @property
-    def children(self) -> dict:
+    def children(self) -> Mapping[str, "DocumentedObject"]:
         """
         The child objects of this object.
         """
         if self._children is None:
-            self._children = OrderedDict()
+            return NO_CHILDREN
 
         return self._children
 
@@ -141,33 +247,48 @@ class DocumentedObject:
         """
         Will turn this instance into a JSON like representation.
         """
-        obj_dict: Dict[str, Any] = {}
-        obj_dict["doc"] = self.doc
-        obj_dict["type"] = self.type
-        obj_dict["name"] = self.name
-
-        line_range = self.line_range()
-        obj_dict["start_line"] = line_range[0]
-        obj_dict["end_line"] = line_range[1]
-
-        obj_dict["children"] = []
+        return json.dumps(self.to_ast())
 
-        for child in self.children.values():
-            obj_dict["children"].append(json.loads(str(child)))
+    def to_ast(self) -> Dict[str, Any]:
+        """
+        Create the dictionary like representation of this object and all of
+        its children. See :ref:`developer_notes:Common Terms`.
 
-        return json.dumps(obj_dict)
+        Returns:
+            Dict[str, Any]: The AST of this object.
+        """
+        start_line, end_line = self.line_range()
+        return {
+            "doc": self.doc,
+            "type": self.type,
+            "name": self.name,
+            "start_line": start_line,
+            "end_line": end_line,
+            "children": [child.to_ast() for child in self.children.values()],
+        }
 
     def get_doc(self) -> str:
         """
         Get the documentation paragraph of the item
         """
-        if self.soup is not None:
-            root = cast(Tag, self.soup.contents[0])
-            body = self.get_paragraph(root.find("abstract", recursive=False))
-            body += self.get_paragraph(root.find("discussion", recursive=False))
-            return body
+        if self._documentation is None:
+            comment_doc = self.get_comment_doc()
+            self._documentation = self.doc if comment_doc is None else comment_doc
+
+        return self._documentation
+
+    def get_comment_doc(self) -> Optional[str]:
+        """
+        Gets the documentation from the :attr:`comment_parts`. If there is no
+        parsed comment this will return None.
+        """
+        parts = self.comment_parts
+        if parts is None:
+            return None
 
-        return self.doc
+        body = self.get_abstract(parts)
+        body += self.get_paragraph(parts.discussion)
+        return body
 
     @property
     def declaration(self) -> str:
@@ -179,10 +300,10 @@ class DocumentedObject:
         if self._declaration is None:
             # First try to utilize the clang comment's version as it is assumed
             # to be the more correct.
-            self._declaration = self.get_soup_declaration()
+            self._declaration = self.get_comment_declaration()
 
         if self._declaration is None:
-            # soup failed so fall back to manual parsing
+            # No clang comment so fall back to manual parsing
             self._declaration = self.get_parsed_declaration()
 
         return self._declaration
@@ -196,58 +317,64 @@ class DocumentedObject:
         # off chance an object fails to implement this.
         return self.name
 
-    def get_soup_declaration(self) -> Optional[str]:
+    def get_comment_declaration(self) -> Optional[str]:
         """
-        Get the declaration element from :attr:`soup`. If there is no soup or
-        no declaration this will return None.
+        Get the declaration clang provides for commented constructs. If there
+        is no parsed comment this will return None.
         """
-        if self.soup is None:
+        if self.comment_parts is None:
             return None
 
-        root = cast(Tag, self.soup.contents[0])
-
-        # It seems with different versions of clang the newlines will at times
-        # be kept around from some declarations. This causes problems with
-        # sphinx as the signature should remain all in one line.
-        declaration_tag = cast(Tag, root.find("declaration"))
-        lines = declaration_tag.text.splitlines()
+        # Clang will at times keep newlines in some declarations. This causes
+        # problems with sphinx as the signature should remain all in one line.
+        lines = self.cursor.get_declaration().splitlines()
         declaration = " ".join(line.strip() for line in lines)
         return declaration
 
     @property
-    def soup(self) -> Optional[BeautifulSoup]:
+    def comment_parts(self) -> Optional[CommentParts]:
         """
-        Get the beautifulsoup representation of this object's comment.
+        Get the parts of this object's parsed clang comment.
 
         Returns:
-            BeautifulSoup: The xml comment for this C object turned into soup.
+            CommentParts: The parts of the comment for this C object, None if
+            clang didn't parse a comment for it.
+        """
+        if self._comment_parts is None and self.node is not None:
+            self._comment_parts = self.node.getParsedComment().get_parts()
+
+        return self._comment_parts
+
+    def get_abstract(self, parts: CommentParts) -> str:
         """
-        if self._soup is None:
-            comment = self.node.getParsedComment().as_xml()
-            if comment is not None:
-                self._soup = BeautifulSoup(comment, features="html.parser")
+        Get the abstract paragraph from `parts`, see :meth:`get_paragraph`.
+        """
+        if parts.abstract is None:
+            return ""
 
-        return self._soup
+        return self.get_paragraph([parts.abstract])
 
     @staticmethod
-    def get_paragraph(tag: Optional[Tag]) -> str:
+    def get_paragraph(paragraphs: Optional[Sequence[Comment]]) -> str:
         """
-        Get the paragraph contents from `tag`.
+        Get the contents of `paragraphs`.
 
         Args:
-            tag (:class:`~BeautifulSoup.tag`): The tag to get the paragraph
+            paragraphs (Sequence[Comment]): The paragraph comments to get the
                 contents from.
 
         Returns:
             str: One of two things:
-                - An empty string if `tag` is None.
-                - All of the paragraph contents of `tag` with newlines
+                - An empty string if `paragraphs` is None.
+                - All of the non whitespace paragraph contents with newlines
                   between them along with a trailing newline, otherwise.
         """
-        if tag is None:
+        if paragraphs is None:
             return ""
 
-        paragraph = "\n".join(p.text.strip() for p in tag.find_all("para"))
+        paragraph = "\n".join(
+            p.get_text().strip() for p in paragraphs if not p.is_whitespace()
+        )
         paragraph += "\n"
         return paragraph
 
@@ -267,9 +394,19 @@ class DocumentedObject:
               things the linker can get access to. Mainly this means functions
               and variables that are not static.
         """
+        if self._public is None:
+            self._public = self.get_parsed_public()
+
+        return self._public
+
+    def get_parsed_public(self) -> bool:
+        """
+        Determine if this item is public as parsed from the :attr:`node`. See
+        :meth:`is_public` for the rules.
+        """
         # Here we'll do the most common logic, and let specific constructs that
         # can be public do special logic.
-        if self.node.location.file.name.endswith(".h"):
+        if self.cursor.location.file.name.endswith(".h"):
             return True
 
         return False
@@ -278,10 +415,26 @@ class DocumentedObject:
 class DocumentedFile(DocumentedObject):
     """
     A documented file
+
+    Attributes:
+        includes (Tuple[str, ...]): The full path of every file included,
+            directly or indirectly, by this file.
     """
 
     type_ = "file"
 
+    __slots__ = ("includes",)
+
+    def __init__(self, node: Cursor) -> None:
+        super().__init__(node)
+        self.includes: Tuple[str, ...] = ()
+
+    def get_parsed_public(self) -> bool:
+        """
+        Files are public when they are header files.
+        """
+        return self.cursor.spelling.endswith(".h")
+
 
 class DocumentedMacro(DocumentedObject):
     """
@@ -290,6 +443,8 @@ class DocumentedMacro(DocumentedObject):
 
     type_ = "macro"
 
+    __slots__ = ()
+
     def format_args(self, **kwargs: Any) -> str:
         """
         If the macro is function like, gets the parenthesis version of the
@@ -326,12 +481,13 @@ class DocumentedMacro(DocumentedObject):
         Creates the full declaration of the macro. For function like macros
         this will include the parenthesised arguments.
         """
-        if not self.node.is_macro_function_like():
+        if not self.cursor.is_macro_function_like():
             return f"{self.name}"
 
         # We know this must be a function like macro, which means the first 2
         # tokens are `MACRO_NAME` followed by `(`.
-        token_iter = self.node.get_tokens()
+        cursor = self.cursor
+        token_iter = iter(get_token_index(cursor.tu).get_extent_tokens(cursor.extent))
         next(token_iter)
         next(token_iter)
 
@@ -354,6 +510,8 @@ class DocumentedEnumerator(DocumentedObject):
 
     type_ = "enumerator"
 
+    __slots__ = ()
+
     def format_name(self) -> str:
         """
         The name of the object.
@@ -370,6 +528,8 @@ class DocumentedMember(DocumentedObject):
 
     type_ = "member"
 
+    __slots__ = ()
+
     def get_parsed_declaration(self) -> str:
         """
         Build up the name from the node. This should be the member's type and
@@ -383,7 +543,7 @@ class DocumentedMember(DocumentedObject):
 
         The parsed declaration of `bar` would be `int bar`.
         """
-        type_ = self.node.type.spelling
+        type_ = self.cursor.type.spelling
 
         # Libclang will return the type as `float [20]` when looking at
         # `float foo[20]`.  We could look at the kind `TypeKind.CONSTANTARRAY`
@@ -392,7 +552,7 @@ class DocumentedMember(DocumentedObject):
         array_contents = "".join(array)
         return f"{type_} {self.name} {array_contents}"
 
-    def is_public(self) -> bool:
+    def get_parsed_public(self) -> bool:
         """
         Members are always public, because it's their parents that determine
         public versus private.
@@ -407,46 +567,59 @@ class DocumentedFunction(DocumentedObject):
 
     type_ = "function"
 
-    def get_soup_doc(self) -> Optional[str]:
+    __slots__ = ()
+
+    def get_comment_doc(self) -> Optional[str]:
         """
-        Gets the documentation from the :attr:`_soup`.
+        Gets the documentation from the :attr:`comment_parts`.
         """
-        if self.soup is None:
-            return None
-        root = cast(Tag, self.soup.contents[0])
+        parts = self.comment_parts
 
-        if not root.find("parameters", recursive=False) and not root.find(
-            "resultdiscussion"
-        ):
+        # Without parameters or returns the raw comment is used, so don't
+        # bother with the text of the comment.
+        if parts is None or (not parts.params and not parts.returns):
             return None
 
-        body = self.get_paragraph(root.find("abstract", recursive=False))
-        body += self.get_paragraph(root.find("discussion", recursive=False))
+        body = self.get_abstract(parts)
+        body += self.get_paragraph(parts.discussion)
 
         # Single newlines are tread as the same paragraph in restructured text,
         # providing 2 results in separate paragraphs.
         body = body.replace("\n", "\n\n")
 
-        for param in root.find_all("parameter"):
-            name = cast(Tag, param.find("name")).text
-            param_doc = self.get_paragraph(param.discussion)
+        for name, paragraph in parts.params:
+            param_doc = self.get_paragraph([paragraph])
             body += f"\n:param {name}: {param_doc}"
 
-        returns = self.get_paragraph(root.find("resultdiscussion", recursive=False))
-        if returns:
+        if parts.returns:
+            returns = self.get_paragraph(parts.returns)
             body += f"\n:returns: {returns}"
 
         return body
 
-    def get_doc(self) -> str:
+    def line_range(self) -> Tuple[int, int]:
         """
-        Get the documentation paragraph of the item
+        The lines in the source file that this function covers.
+
+        When function bodies are skipped, see ``skip_function_bodies``, clang
+        ends the function's extent at its arguments, so the lines are extended
+        to cover the body.
         """
-        soup_doc = self.get_soup_doc()
-        if soup_doc is not None:
-            return soup_doc
+        if self._line_range is None:
+            start_line, end_line = super().line_range()
+
+            func = self.cursor
+            end = func.extent.end
+            body_end = find_block_end(get_source(func.tu), end.offset)
+            if body_end is not None:
+                body_end_location = cindex.SourceLocation.from_offset(
+                    func.tu, end.file, body_end
+                )
+                end_line = max(end_line, body_end_location.line)
 
-        return self.doc
+            self._line_range = (start_line, end_line)
+
+        return self._line_range
 
     def format_args(self, **kwargs: Any) -> str:
         """
@@ -483,37 +656,36 @@ class DocumentedFunction(DocumentedObject):
         Returns:
             str: The arguments for use in the function signature.
         """
-        func = self.node
+        func = self.cursor
 
         # Early logic used to iterate over, `func.get_arguments()`, however when there
         # is an unknown type clang will sometimes fail to provide tokens for that
         # argument. For example in "unknown_type foo[]" the brackets will cause clang
         # to return back no tokens for the argument.
-        start = func.location
-        end = func.extent.end
-        if func.is_definition():
-            # When a function is a definition the last child is the compound statement
-            # so we need to move prior to the compound statement
-            children = list(func.get_children())
-            body_start = children[-1].extent.start.offset
-            end = cindex.SourceLocation.from_offset(func.tu, start.file, body_start - 1)
-
-        extent = cindex.SourceRange.from_locations(start, end)
-        non_comment_tokens = (
-            t
-            for t in cindex.TokenGroup.get_tokens(func.tu, extent=extent)
-            if t.kind != cindex.TokenKind.COMMENT
-        )
+        # The arguments are the tokens within the parenthesis following the name.
+        # Matching the parenthesis works the same whether or not the function body
+        # was parsed, and leaves out anything, like attributes, after them.
+        arguments = []
+        depth = 0
+        for token in get_token_index(func.tu).iter_tokens(func.location.offset):
+            if token.kind == cindex.TokenKind.COMMENT:
+                continue
+
+            spelling = token.spelling
+            if spelling == ")" or (not depth and spelling in (";", "{")):
+                depth -= 1
+                if depth <= 0:
+                    break
+
+            if depth:
+                arguments.append(spelling)
+
+            if spelling == "(":
+                depth += 1
 
         # Even though this will place spaces around all the tokens, the sphinx C domain
         # will provide some formatting to make it look nicer in the final output.
-        full_signature = " ".join(t.spelling for t in non_comment_tokens)
-
-        _, _, arguments = full_signature.partition("(")
-        arguments = arguments.rstrip(")")
-        arguments = arguments.strip()
-
-        return arguments
+        return " ".join(arguments)
 
     def get_parsed_declaration(self) -> str:
         """
@@ -522,28 +694,25 @@ class DocumentedFunction(DocumentedObject):
         """
         args = self._get_arguments()
 
-        func = self.node
+        func = self.cursor
         tu = func.tu
 
         # For functions the extent encompasses the return value, and the
         # location is the beginning of the functions name.  So we can consume
         # all tokens in between.
-        end = cindex.SourceLocation.from_offset(
-            tu, func.location.file, func.location.offset - 1
+        tokens = get_token_index(tu).get_tokens(
+            func.extent.start.offset, func.location.offset - 1
         )
-        extent = cindex.SourceRange.from_locations(func.extent.start, end)
 
-        return_type = " ".join(
-            t.spelling for t in cindex.TokenGroup.get_tokens(tu, extent=extent)
-        )
+        return_type = " ".join(t.spelling for t in tokens)
 
         return f"{return_type} {func.spelling}({args})"
 
-    def is_public(self) -> bool:
+    def get_parsed_public(self) -> bool:
         """
         Functions are public as long as they are not static.
         """
-        if self.node.storage_class == StorageClass.STATIC:
+        if self.cursor.storage_class == StorageClass.STATIC:
             return False
 
         return True
@@ -556,6 +725,8 @@ class DocumentedType(DocumentedObject):
 
     type_ = "type"
 
+    __slots__ = ()
+
     def get_parsed_declaration(self) -> str:
         """Format the name of *self.object*.
 
@@ -565,7 +736,7 @@ class DocumentedType(DocumentedObject):
 
         For things like functions and others this will include the return type.
         """
-        parent_type = self.node.underlying_typedef_type.spelling
+        parent_type = self.cursor.underlying_typedef_type.spelling
 
         # Function prototypes need to be handled different. When clang can't
         # successfully parse the file it falls back to naming the return type
@@ -574,7 +745,7 @@ class DocumentedType(DocumentedObject):
         # will return a `POINTER` while others will return `FUNCITONNOPROTO`. The
         # `POINTER`s are easy to derive the real type from, but the test
         # environment doesn't use that version of clang.
-        type_ = self.node.underlying_typedef_type
+        type_ = self.cursor.underlying_typedef_type
         if type_.kind == cindex.TypeKind.POINTER:  # pragma: no cover
             type_ = type_.get_pointee()
 
@@ -597,11 +768,13 @@ class DocumentedStructure(DocumentedObject):
 
     type_ = "struct"
 
+    __slots__ = ()
+
     @property
-    def soup(self) -> None:
+    def comment_parts(self) -> None:
         """
         Since structures like objects use the "Members:" and
-        "Enumerators:" sections do *not* use the clang xml comments as they
+        "Enumerators:" sections do *not* use the clang comments as they
         don't preserve newlines, so the sections get lost.
         """
         return None
@@ -613,20 +786,19 @@ class DocumentedStructure(DocumentedObject):
         return f"{self.name}"
 
     @property
-    def children(self) -> dict:
+    def children(self) -> Mapping[str, DocumentedObject]:
         """
         Gets the children, members, of the structure.
         """
-        if self._children is None:
+        if self._children is None and self.node is not None:
             # Get the first level of the structures members.
-            struct = self.node
-            self._children = OrderedDict()
-            for member in struct.get_children():
-                item = object_from_cursor(member)
+            self._children = {}
+            for member in collect_children(self.node):
+                item = object_from_record(member)
                 if item:
-                    self._children[member.spelling] = item
+                    self._children[sys.intern(member.spelling)] = item
 
-        return self._children
+        return super().children
 
 
 class DocumentedUnion(DocumentedStructure):
@@ -636,6 +808,8 @@ class DocumentedUnion(DocumentedStructure):
 
     type_ = "union"
 
+    __slots__ = ()
+
 
 class DocumentedEnum(DocumentedStructure):
     """
@@ -644,6 +818,8 @@ class DocumentedEnum(DocumentedStructure):
 
     type_ = "enum"
 
+    __slots__ = ()
+
 
 class DocumentedVariable(DocumentedObject):
     """
@@ -652,6 +828,8 @@ class DocumentedVariable(DocumentedObject):
 
     type_ = "variable"
 
+    __slots__ = ()
+
     def format_name(self) -> str:
         """Format the name of *self.object*.
 
@@ -669,11 +847,11 @@ class DocumentedVariable(DocumentedObject):
         name, _, _ = decl.partition("=")
         return name
 
-    def is_public(self) -> bool:
+    def get_parsed_public(self) -> bool:
         """
         Variables are public as long as they are not static.
         """
-        if self.node.storage_class == StorageClass.STATIC:
+        if self.cursor.storage_class == StorageClass.STATIC:
             return False
 
         return True
@@ -685,7 +863,7 @@ class DocumentedVariable(DocumentedObject):
         # Libclang will return the type as `float [20]` when looking at
         # `float foo[20]`.  We could look at the kind `TypeKind.CONSTANTARRAY`
         # but partitioning on the "[" just seems more straight forward.
-        type_ = self.node.type.spelling
+        type_ = self.cursor.type.spelling
         type_, *(array) = type_.partition("[")
         array_contents = "".join(array)
 
@@ -704,11 +882,18 @@ class DocumentedVariable(DocumentedObject):
                 `int`.
         """
         type_ = "int"
-        tokens = list(
-            filter(
-                lambda t: t.kind == cindex.TokenKind.IDENTIFIER, self.node.get_tokens()
+
+        # Only look from the start of the declaration up to, and including,
+        # the variable name. Initializers can be huge tables, and may contain
+        # identifiers of their own.
+        cursor = self.cursor
+        tokens = [
+            t
+            for t in get_token_index(cursor.tu).get_tokens(
+                cursor.extent.start.offset, cursor.location.offset + 1
             )
-        )
+            if t.kind == cindex.TokenKind.IDENTIFIER
+        ]
         try:
             type_ = tokens[-2].spelling
         except IndexError:  # pragma: no cover
@@ -718,7 +903,7 @@ class DocumentedVariable(DocumentedObject):
 
         # clang doesn't provide the storage class in the type name, so we'll add it here
         storage_keyword = ""
-        storage_class = self.node.storage_class
+        storage_class = self.cursor.storage_class
         if storage_class == cindex.StorageClass.STATIC:
             storage_keyword = "static"
         if storage_class == cindex.StorageClass.EXTERN:
@@ -745,16 +930,29 @@ def object_from_cursor(cursor: Cursor) -> Optional[DocumentedObject]:
     """
     Create an instance from a :class:`cindex.Cursor`
     """
+    first_child = None
+    if cursor.kind in NESTED_KINDS:
+        first_child = next(cursor.get_children(), None)
+
+    return object_from_record(make_record(cursor, first_child))
+
+
+def object_from_record(record: CursorRecord) -> Optional[DocumentedObject]:
+    """
+    Create an instance from a :class:`CursorRecord`, see
+    :func:`~sphinx_c_autodoc.clang.cursors.collect_children`.
+    """
     # Prior to clang 16, anonymous constructs would have an empty `spelling` and
     # `displayname`. Clang 16 began naming anonymous constructs as:
     #   "<construct> (anonymous at # <path_to_c_file>:<lineno>)"
     # So need to look at the type spelling to determine if a construct is anonymous
-    name = cursor.spelling
+    cursor = record.cursor
+    name = record.spelling
     anonymous_type = any(
-        anon in cursor.type.spelling for anon in ("anonymous at", "unnamed at")
+        anon in record.type_spelling for anon in ("anonymous at", "unnamed at")
     )
     anonymous_construct = (
-        cursor.kind
+        record.kind
         in (
             cindex.CursorKind.STRUCT_DECL,
             cindex.CursorKind.UNION_DECL,
@@ -768,7 +966,7 @@ def object_from_cursor(cursor: Cursor) -> Optional[DocumentedObject]:
         # type spelling of:
         # "<construct> (anonymous at # <path_to_c_file>:<lineno>)"
         # Typedef's should be handled by the get_nested_node() function
-        if cursor.kind in ALLOWED_ANONYMOUS and anonymous_type:
+        if record.kind in ALLOWED_ANONYMOUS and anonymous_type:
             filename = os.path.basename(cursor.location.file.name)
             # remove the extension from the filename since the '.' is not a
             # valid c identifier. splitext will remove the trailing most
@@ -780,11 +978,11 @@ def object_from_cursor(cursor: Cursor) -> Optional[DocumentedObject]:
             # Don't document anonymous items
             return None
 
-    nested_cursor = get_nested_node(cursor)
+    nested_cursor = get_nested_node(cursor, record.first_child)
     class_ = CURSORKIND_TO_OBJECT_CLASS.get(nested_cursor.kind, DocumentedObject)
     doc = class_(nested_cursor)
 
-    doc.name = name
+    doc.name = sys.intern(name)
     psuedo_comment = PsuedoToken(
         nested_cursor.raw_comment, nested_cursor.comment_extent
     )
@@ -793,26 +991,28 @@ def object_from_cursor(cursor: Cursor) -> Optional[DocumentedObject]:
     return doc
 
 
-def get_nested_node(cursor: Cursor) -> Cursor:
+def get_nested_node(cursor: Cursor, first_child: Optional[Cursor]) -> Cursor:
     """
     Retrieve the nested node that `cursor` may be shadowing
+
+    Args:
+        cursor (:class:`cindex.Cursor`): The cursor which may be shadowing a
+            nested node.
+        first_child (:class:`cindex.Cursor`): The first child of `cursor`, None
+            if it has no children.
+
+    Returns:
+        :class:`cindex.Cursor`: The nested node, or `cursor` if it isn't
+        shadowing one.
     """
-    if cursor.kind in (
-        cindex.CursorKind.TYPEDEF_DECL,
-        cindex.CursorKind.FIELD_DECL,
-        cindex.CursorKind.VAR_DECL,
-    ):
-        try:
-            underlying_node = next(cursor.get_children())
-            if underlying_node.kind in (
-                cindex.CursorKind.STRUCT_DECL,
-                cindex.CursorKind.UNION_DECL,
-                cindex.CursorKind.ENUM_DECL,
-            ):
-                return underlying_node
-        except StopIteration:
-            # No children for typedefs of native types, i.e. `typedef int some_int;`
-            pass
+    # No children for typedefs of native types, i.e. `typedef int some_int;`
+    if cursor.kind in NESTED_KINDS and first_child is not None:
+        if first_child.kind in (
+            cindex.CursorKind.STRUCT_DECL,
+            cindex.CursorKind.UNION_DECL,
+            cindex.CursorKind.ENUM_DECL,
+        ):
+            return first_child
 
     return cursor
 
@@ -829,9 +1029,8 @@ def get_file_comment(cursor: Cursor, child: Optional[Cursor]) -> str:
     Returns:
         str: The file level comment.
     """
-    try:
-        token = next(cursor.get_tokens())
-    except StopIteration:
+    token = get_first_token(cursor.tu)
+    if token is None:
         # Only happens with a completely empty file
         return ""
 
@@ -844,13 +1043,17 @@ def get_file_comment(cursor: Cursor, child: Optional[Cursor]) -> str:
         # if the first comment is not the documentation comment for the first
         # child then assume it is the file comment.
         if child_comment != token.spelling:
-            return parse_comment(token)
+            return parse_comment(
+                PsuedoToken(token.spelling, token_extent(cursor, token))
+            )
 
     return ""
 
 
 def get_compilation_args(
-    filename: str, compilation_database: Optional[str] = None
+    filename: str,
+    compilation_database: Optional[str] = None,
+    compilation_database_policy: str = "first",
 ) -> List[str]:
     """
     Get the compilation args for `filename` for the compilation database found in
@@ -859,29 +1062,44 @@ def get_compilation_args(
     Args:
         filename (str): The file to get the compilation arguments for.
         compilation_database (str): The compilation database.
+        compilation_database_policy (str): Which entry of the compilation
+            database to use when `filename` is in it more than once, see
+            :data:`~sphinx_c_autodoc.compilation_database.ENTRY_POLICIES`.
 
     Returns:
         list[str]: The compilation arguments.
     """
     if not compilation_database:
         return []
-    directory = os.path.dirname(compilation_database)
-    comp_db = cindex.CompilationDatabase.fromDirectory(directory)
-    commands = comp_db.getCompileCommands(filename)
 
-    if not commands:
-        return []
+    database = get_compilation_database(compilation_database)
+    return database.get_args(filename, compilation_database_policy)
 
-    # For now only handling the first file instance seen in the database.
-    # First argument is compiler path, last is the file to compile
-    args = list(commands[0].arguments)[1:-1]
 
-    # Since things like includes and defines could be relative we force the working
-    # directory.
-    working_dir = commands[0].directory
-    args.append(f"-working-directory={working_dir}")
+def get_includes(tu: cindex.TranslationUnit, args: Sequence[str]) -> Tuple[str, ...]:
+    """
+    Get all of the files included by the translation unit.
 
-    return args
+    Args:
+        tu (:class:`cindex.TranslationUnit`): The translation unit to get the
+            includes of.
+        args (Sequence[str]): The arguments `tu` was parsed with. Relative
+            include paths are relative to any ``-working-directory`` in these.
+
+    Returns:
+        Tuple[str, ...]: The absolute path of every included file, in the order
+            they were first included.
+    """
+    working_dir = os.getcwd()
+    for arg in args:
+        if arg.startswith("-working-directory="):
+            _, _, working_dir = arg.partition("=")
+
+    includes = (
+        os.path.normpath(os.path.join(working_dir, i.include.name))
+        for i in tu.get_includes()
+    )
+    return tuple(dict.fromkeys(includes))
 
 
 def load(
@@ -889,6 +1107,7 @@ def load(
     contents: str,
     compilation_database: Optional[str] = None,
     compilation_args: Optional[Sequence[str]] = None,
+    parse_options: Sequence[str] = (),
 ) -> DocumentedObject:
     """
     Load a C file into a tree of :class:`DocumentedObject`\'s
@@ -899,9 +1118,13 @@ def load(
         compilation_database (str): The compilation database.
         compilation_args (str): Compilation arguments.  Will be applied *after*
             compilation database.
+        parse_options (Sequence[str]): Names of additional translation unit
+            options, see :data:`PARSE_OPTIONS`.
 
     Returns:
-        :class:`DocumentedObject`: The documented version of `filename`.
+        :class:`DocumentedObject`: The documented version of `filename`. This
+        will be frozen, see :meth:`DocumentedObject.freeze`, so it holds no
+        references to the libclang translation unit.
 
     """
     args = get_compilation_args(filename, compilation_database)
@@ -914,7 +1137,8 @@ def load(
         unsaved_files=[
             (filename, contents),
         ],
-        options=cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+        options=get_parse_options(parse_options),
+        index=get_index(),
     )
     cursor = tu.cursor
 
@@ -923,38 +1147,132 @@ def load(
     # Some nodes show up from header includes as well as compiler defines, so
     # skip those. Macro instantiations are the locations where macros are
     # expanded, no need to document these.
-    child_nodes = [
-        c
-        for c in cursor.get_children()
-        if c.location.isFromMainFile()
-        and c.kind
-        not in (
+    records = collect_children(
+        cursor,
+        skip_kinds=(
             cindex.CursorKind.MACRO_INSTANTIATION,
             cindex.CursorKind.INCLUSION_DIRECTIVE,
-        )
-    ]
+        ),
+        main_file_only=True,
+    )
+    if SCAN_MACROS in parse_options:
+        records += scan_macros(tu)
 
     # Macro definitions always come first in the child list, but that may not
     # be their location in the file, so sort all the nodes by location
-    sorted_nodes = sorted(child_nodes, key=lambda x: x.extent.start.offset)
+    records.sort(key=lambda r: r.start)
 
-    comment_nodes(cursor, sorted_nodes)
+    comment_nodes(cursor, [r.cursor for r in records])
 
-    # TODO need to consider a better way to build this up, taking the
-    # dictionary and modifying in place isn't ideal.
-    children = root_document.children
-    for node in sorted_nodes:
-        item = object_from_cursor(node)
+    children: Dict[str, DocumentedObject] = {}
+    for record in records:
+        item = object_from_record(record)
         if item:
             children[item.name] = item
+    root_document._children = children
 
     root_document.doc = cursor.raw_comment
     root_document.name = os.path.basename(cursor.spelling)
     root_document.node = cursor
+    root_document.includes = get_includes(tu, args)
+
+    # Everything needed has been pulled out of libclang, freezing lets go of
+    # all the cursors so the translation unit can be disposed of right away.
+    root_document.freeze()
 
     return root_document
 
 
+def find_block_end(source: bytes, offset: int) -> Optional[int]:
+    """
+    Find the end of the braced block which starts at `offset`.
+
+    Only the braces, along with the comments and literals which may hide
+    braces, are looked at, so finding the end of a large function body is far
+    cheaper than tokenizing it.
+
+    Args:
+        source (bytes): The source to look in.
+        offset (int): The byte offset to look for the block at. Whitespace and
+            comments before the opening brace are skipped over.
+
+    Returns:
+        int: The byte offset just past the closing brace of the block. None if
+        there isn't a block at `offset`, or it's never closed.
+    """
+    prefix = BLOCK_PREFIX_RE.match(source, offset)
+    start = prefix.end() if prefix else offset
+    if source[start : start + 1] != b"{":
+        return None
+
+    depth = 0
+    for match in BLOCK_CONTENTS_RE.finditer(source, start):
+        text = match.group()
+        if text == b"{":
+            depth += 1
+        elif text == b"}":
+            depth -= 1
+            if not depth:
+                return match.end()
+
+    return None
+
+
+def get_index() -> cindex.Index:
+    """
+    Get the libclang index shared by every file parsed in this process.
+
+    The python bindings otherwise create, and dispose of, an index for each
+    file parsed. The index is recreated in forked processes, like Sphinx's
+    parallel readers, rather than sharing the parent's.
+
+    Returns:
+        :class:`cindex.Index`: The index to parse files with.
+    """
+    pid = os.getpid()
+    index = _indexes.get(pid)
+    if index is None:
+        # Any other index was inherited from the parent of a forked process.
+        _indexes.clear()
+        index = _indexes[pid] = cindex.Index.create()
+
+    return index
+
+
+def get_parse_options(names: Sequence[str]) -> int:
+    """
+    Get the translation unit options to parse with.
+
+    The detailed processing record is how the macros are found, so it's
+    always used unless the macros are scanned for instead, see
+    :data:`SCAN_MACROS`.
+
+    Args:
+        names (Sequence[str]): Names of additional options, see
+            :data:`PARSE_OPTIONS`.
+
+    Returns:
+        int: The translation unit options.
+
+    Raises:
+        ValueError: When one of `names` isn't in :data:`PARSE_OPTIONS`.
+    """
+    options = 0
+    if SCAN_MACROS not in names:
+        options = cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+
+    for name in names:
+        try:
+            options |= PARSE_OPTIONS[name]
+        except KeyError:
+            raise ValueError(
+                f"Unknown parse option {name!r}, expected one of "
+                f"{', '.join(PARSE_OPTIONS)}"
+            ) from None
+
+    return options
+
+
 def comment_nodes(cursor: Cursor, children: List[Cursor]) -> None:
     """
     Comment all nodes in `cursor` and `children` that fall into the
@@ -997,9 +1315,11 @@ def comment_nodes(cursor: Cursor, children: List[Cursor]) -> None:
             tu, location.file, location.line - 1, 1
         )
 
-        start = prev_child.extent.end if prev_child else cursor.extent.start
-        extent = cindex.SourceRange.from_locations(start, end)
-        tokens = list(cindex.TokenGroup.get_tokens(tu, extent=extent))
+        # The first line of the file has no previous line to end on
+        tokens: List[IndexedToken] = []
+        if end.file is not None:
+            start = prev_child.extent.end if prev_child else cursor.extent.start
+            tokens = get_token_index(tu).get_tokens(start.offset, end.offset)
 
         if tokens:
             comment_node(child, tokens[-1])
@@ -1011,7 +1331,9 @@ def comment_nodes(cursor: Cursor, children: List[Cursor]) -> None:
     cast(Any, cursor).raw_comment = get_file_comment(cursor, first_child)
 
 
-def comment_node(node: Optional[Cursor], token: Token, trailing: bool = False) -> None:
+def comment_node(
+    node: Optional[Cursor], token: IndexedToken, trailing: bool = False
+) -> None:
     """
     Add the comment, `token`, to the `node`.
 
@@ -1022,7 +1344,7 @@ def comment_node(node: Optional[Cursor], token: Token, trailing: bool = False) -
 
     Args:
         node (Cursor): The node to attempt to comment.
-        token (Token): The token to use for the commenting.
+        token (IndexedToken): The token to use for the commenting.
         trailing (bool): Only comment `node` if `token` is a trailing
             comment, :data:`TRAILING_COMMENT_START`. If False then only
             comment `node` if `token` is a non trailing documentation
@@ -1043,7 +1365,7 @@ def comment_node(node: Optional[Cursor], token: Token, trailing: bool = False) -
 
     dynamic_node = cast(Any, node)
     dynamic_node.raw_comment = token.spelling
-    dynamic_node.comment_extent = token.extent
+    dynamic_node.comment_extent = token_extent(node, token)
 
 
 def parse_comment(comment: Union[Token, PsuedoToken]) -> str:
@@ -148,13 +148,18 @@ def process_autodoc_docstring(
     lines[:] = result_lines[:]
 
 
-def setup(app: Sphinx) -> None:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """
     Extend sphinx to assist sphinx_c_autodocs to allow Google style
     docstrings for C constructs.
 
     Args:
         app (:class:`Sphinx`): The Sphinx application object
+
+    Returns:
+        Dict[str, Any]: The extension metadata.
     """
     app.setup_extension("sphinx.ext.napoleon")
     app.connect("autodoc-process-docstring", process_autodoc_docstring)
+
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
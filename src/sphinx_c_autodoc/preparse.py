@@ -0,0 +1,522 @@
+"""
+Parse the C files referenced by the outdated documents before reading them.
+
+Normally each C file is parsed when the first directive referencing it is run,
+so files are parsed one at a time as Sphinx reads the documents. Once Sphinx
+knows which documents it's going to read, the C files they reference can be
+found by looking for the ``autoc*`` directives in their sources. These are then
+parsed in a pool of processes, with the directives only looking up the result.
+
+libclang objects can't be sent between processes, but the loaded modules are
+frozen, see :meth:`~sphinx_c_autodoc.loader.DocumentedObject.freeze`, so the
+workers send back trees which no longer reference libclang. Workers which
+aren't forked, the default on macOS and Windows, never run ``conf.py``, so
+they're given the libclang library this process is configured with.
+
+When Sphinx reads the documents in parallel it forks its reading processes
+after this, so they all inherit the parsed modules instead of each parsing the
+files its documents reference. The modules are held pickled, a single bytes
+object each, so that looking them up in a reading process doesn't touch, and
+copy, the memory of every object in the tree.
+"""
+
+import gc
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from clang import cindex
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+from sphinx.util.parallel import parallel_available
+
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.cache import (
+    find_compilation_database,
+    get_disk_cache,
+    get_module_cache,
+    get_parse_args,
+    load_module,
+    module_key,
+)
+from sphinx_c_autodoc.loader import DocumentedObject
+
+#: The attribute of the :class:`BuildEnvironment` holding the
+#: :class:`ParsedModules`.
+PARSED_MODULES_ATTRIBUTE = "_c_autodoc_parsed_modules"
+
+#: The C file of an ``autoc*`` directive, this is the part of the argument
+#: before any ``::``, see :meth:`sphinx_c_autodoc.CObjectDocumenter.parse_name`.
+DIRECTIVE_RE = re.compile(r"^[ \t]*\.\.[ \t]+autoc\w+::[ \t]*([^\s:]+)", re.MULTILINE)
+
+#: The number of documents older versions of Sphinx always read serially.
+PARALLEL_READ_MIN_DOCUMENTS = 5
+
+#: A file which needs parsing, as the (key, filename, contents, args) it's
+#: parsed, and cached, with.
+PendingFile = Tuple[Hashable, str, str, List[str]]
+
+logger = logging.getLogger(__name__)
+
+
+class ParsedModules:
+    """
+    The modules parsed ahead of the directives which document them.
+
+    Each module is handed out once, after that it's up to the
+    :class:`~sphinx_c_autodoc.cache.ModuleCache`. Like the module cache, the
+    modules are never pickled with the environment.
+
+    Attributes:
+        gc_frozen (bool): Whether the garbage collector was frozen after the
+            modules were parsed, see :func:`unfreeze_objects`.
+    """
+
+    def __init__(self) -> None:
+        self._modules: Dict[Hashable, Tuple[str, bytes]] = {}
+        self.gc_frozen = False
+
+    def __len__(self) -> int:
+        return len(self._modules)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        The modules are only valid for the current build, so leave them out
+        of the pickled environment.
+        """
+        return {"_modules": {}, "gc_frozen": False}
+
+    def add(self, key: Hashable, contents: str, module: DocumentedObject) -> None:
+        """
+        Add a parsed module.
+
+        The module is kept pickled until it's taken.
+
+        Args:
+            key (Hashable): The key of the module, see
+                :func:`~sphinx_c_autodoc.cache.module_key`.
+            contents (str): The contents the module was parsed from, after any
+                pre-processing.
+            module (DocumentedObject): The parsed module.
+        """
+        self._modules[key] = (contents, pickle.dumps(module, pickle.HIGHEST_PROTOCOL))
+
+    def pop(self, key: Hashable) -> Optional[Tuple[str, DocumentedObject]]:
+        """
+        Take the module for `key`.
+
+        Args:
+            key (Hashable): The key of the module, see
+                :func:`~sphinx_c_autodoc.cache.module_key`.
+
+        Returns:
+            Tuple[str, DocumentedObject]: The pre-processed contents and the
+            module. None if the module wasn't parsed ahead of time.
+        """
+        parsed = self._modules.pop(key, None)
+        if parsed is None:
+            return None
+
+        contents, data = parsed
+        return contents, pickle.loads(data)
+
+
+def find_c_file(env: BuildEnvironment, modname: str) -> Optional[Tuple[str, str]]:
+    """
+    Find the C file `modname` in the ``c_autodoc_roots``.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        modname (str): The C file, as written in the directive.
+
+    Returns:
+        Tuple[str, str]: The path of the file relative to the source directory
+        and its full path. None if it isn't in any of the roots.
+    """
+    for source_dir in env.config.c_autodoc_roots:
+        filename = os.path.join(source_dir, modname)
+
+        # Prefixing with "/" will force "absolute" path which is relative
+        # to the source directory.
+        rel_filename, filename = env.relfn2path(f"/{filename}")
+        if os.path.isfile(filename):
+            return rel_filename, filename
+
+    return None
+
+
+def find_referenced_files(env: BuildEnvironment, docnames: Sequence[str]) -> List[str]:
+    """
+    Find the C files referenced by the ``autoc*`` directives of `docnames`.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        docnames (Sequence[str]): The documents to look in.
+
+    Returns:
+        List[str]: The full path of each C file found, in the order they're
+        first referenced.
+    """
+    modnames: Dict[str, None] = {}
+    for docname in docnames:
+        try:
+            with open(env.doc2path(docname), encoding=env.config.source_encoding) as f:
+                source = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+
+        modnames.update(dict.fromkeys(DIRECTIVE_RE.findall(source)))
+
+    filenames: Dict[str, None] = {}
+    for modname in modnames:
+        found = find_c_file(env, modname)
+        if found is not None:
+            filenames[found[1]] = None
+
+    return list(filenames)
+
+
+def get_module(
+    env: BuildEnvironment,
+    modname: str,
+    filename: str,
+    compilation_db: Optional[str],
+) -> DocumentedObject:
+    """
+    Get the module of the C file `filename` for a document.
+
+    Modules which weren't in the module cache are announced with the
+    ``c-autodoc-module-loaded`` event, see :func:`load_c_file`.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        modname (str): The C file, as written in the directive.
+        filename (str): The full path of the C file.
+        compilation_db (str): The compilation database for `filename`, None if
+            there isn't one.
+
+    Returns:
+        DocumentedObject: The documented version of `filename`.
+    """
+    module, contents = load_c_file(env, filename, compilation_db)
+    if contents is not None:
+        # let extensions, like viewcode, know about the newly loaded file
+        env.app.emit("c-autodoc-module-loaded", modname, filename, contents, module)
+    return module
+
+
+def load_c_file(
+    env: BuildEnvironment, filename: str, compilation_db: Optional[str]
+) -> Tuple[DocumentedObject, Optional[str]]:
+    """
+    Get the module of the C file `filename`, without announcing it.
+
+    The module comes from the module cache, the modules parsed ahead of time
+    or, failing those, from loading `filename`. Modules which weren't in the
+    module cache are added to it.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        filename (str): The full path of the C file.
+        compilation_db (str): The compilation database for `filename`, None if
+            there isn't one.
+
+    Returns:
+        Tuple[DocumentedObject, Optional[str]]: The documented version of
+        `filename` and, when it wasn't in the module cache, the contents it was
+        loaded from after any pre-processing.
+    """
+    with open(filename, encoding="utf-8") as f:
+        contents = [f.read()]
+
+    compilation_args = env.config.c_autodoc_compilation_args
+    parse_options = env.config.c_autodoc_parse_options
+    policy = env.config.c_autodoc_compilation_database_policy
+    module_cache = get_module_cache(env)
+    key = module_key(
+        filename,
+        contents[0],
+        compilation_db,
+        compilation_args,
+        parse_options,
+        policy,
+    )
+    module = module_cache.get(key)
+    if module is not None:
+        return module, None
+
+    parsed_modules = get_parsed_modules(env)
+    parsed = parsed_modules.pop(key) if parsed_modules else None
+    if parsed is not None:
+        # Already pre-processed and parsed, see parse_referenced_files()
+        contents[0], module = parsed
+    else:
+        # let extensions preprocess files
+        env.app.emit("c-autodoc-pre-process", filename, contents)
+        module = load_module(
+            env,
+            filename,
+            contents[0],
+            compilation_db,
+            compilation_args,
+            parse_options,
+            policy,
+        )
+    module_cache.add(key, module)
+    return module, contents[0]
+
+
+def get_parsed_modules(env: BuildEnvironment) -> Optional[ParsedModules]:
+    """
+    Get the modules parsed ahead of the directives.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        ParsedModules: The parsed modules of `env`, None if nothing has been
+        parsed ahead of time.
+    """
+    return getattr(env, PARSED_MODULES_ATTRIBUTE, None)
+
+
+def get_parse_workers(app: Sphinx) -> int:
+    """
+    Get the number of processes to parse the referenced C files in.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+
+    Returns:
+        int: The ``c_autodoc_parallel_parse`` processes or, when that's None,
+        the processes Sphinx reads the documents in. 0 when the files aren't
+        parsed ahead of time.
+    """
+    workers = app.config.c_autodoc_parallel_parse
+    if workers is None:
+        return app.parallel if app.parallel > 1 else 0
+
+    # Overrides from the command line, ``-D``, are strings as the default is None
+    return int(workers)
+
+
+def reads_in_parallel(app: Sphinx, docnames: Sequence[str]) -> bool:
+    """
+    Determine if Sphinx will fork processes to read `docnames`.
+
+    This is the same check Sphinx makes, without the warnings it logs for
+    extensions which aren't parallel safe. Older versions of Sphinx read
+    :data:`PARALLEL_READ_MIN_DOCUMENTS` or fewer documents serially, so that
+    few are always considered to be read serially.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        docnames (Sequence[str]): The documents about to be read.
+
+    Returns:
+        bool: True if the documents are read in parallel.
+    """
+    if not parallel_available or app.parallel <= 1:
+        return False
+
+    if len(docnames) <= PARALLEL_READ_MIN_DOCUMENTS:
+        return False
+
+    return all(
+        getattr(extension, "parallel_read_safe", None)
+        for extension in app.extensions.values()
+    )
+
+
+def parse_referenced_files(
+    app: Sphinx, env: BuildEnvironment, docnames: List[str]
+) -> None:
+    """
+    Parse the C files referenced by `docnames` in ``c_autodoc_parallel_parse``
+    processes.
+
+    When ``c_autodoc_parallel_parse`` is None the files are only parsed ahead
+    of time when Sphinx may read the documents in parallel, using as many
+    processes as Sphinx does. When Sphinx does read them in parallel the
+    garbage collector is then frozen, so the reading processes which Sphinx
+    forks don't copy the memory of this process when collecting.
+
+    Files already in the module cache, or the disk cache, aren't parsed again.
+    Any file which fails to parse is warned about, and left for its directive
+    to parse again.
+
+    Meant to be connected to the `env-before-read-docs` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The current build environment.
+        docnames (List[str]): The documents about to be read.
+    """
+    workers = get_parse_workers(app)
+    if not workers:
+        setattr(env, PARSED_MODULES_ATTRIBUTE, None)
+        return
+
+    parsed_modules = ParsedModules()
+    setattr(env, PARSED_MODULES_ATTRIBUTE, parsed_modules)
+
+    compilation_db, exists = find_compilation_database(env)
+    if not exists:
+        compilation_db = None
+    compilation_args = app.config.c_autodoc_compilation_args
+    parse_options = app.config.c_autodoc_parse_options
+    policy = app.config.c_autodoc_compilation_database_policy
+    module_cache = get_module_cache(env)
+    disk_cache = get_disk_cache(env)
+
+    pending: List[PendingFile] = []
+    for filename in find_referenced_files(env, docnames):
+        with open(filename, encoding="utf-8") as f:
+            contents = [f.read()]
+
+        key = module_key(
+            filename,
+            contents[0],
+            compilation_db,
+            compilation_args,
+            parse_options,
+            policy,
+        )
+        if key in module_cache:
+            continue
+
+        app.emit("c-autodoc-pre-process", filename, contents)
+        args = get_parse_args(filename, compilation_db, compilation_args, policy)
+
+        module = None
+        if disk_cache is not None:
+            module = disk_cache.get(
+                disk_cache.key(filename, contents[0], args, parse_options)
+            )
+        if module is not None:
+            parsed_modules.add(key, contents[0], module)
+        else:
+            pending.append((key, filename, contents[0], args))
+
+    if workers > 1 and len(pending) > 1:
+        parsed = _parse_in_processes(pending, parse_options, workers)
+    else:
+        parsed = _parse_in_process(pending, parse_options)
+
+    for (key, filename, contents, args), module in parsed:
+        if disk_cache is not None:
+            disk_cache.add(
+                disk_cache.key(filename, contents, args, parse_options), module
+            )
+        parsed_modules.add(key, contents, module)
+
+    if reads_in_parallel(app, docnames):
+        # The pickled modules aren't tracked by the garbage collector, but the
+        # rest of this process's objects, like the module cache, are. Each
+        # collection in a forked reading process writes to their headers,
+        # copying the pages they're on.
+        gc.freeze()
+        parsed_modules.gc_frozen = True
+
+
+def unfreeze_objects(app: Sphinx, env: BuildEnvironment) -> None:
+    """
+    Let the garbage collector collect the objects frozen by
+    :func:`parse_referenced_files`, now that the documents have been read.
+
+    Meant to be connected to the `env-updated` event.
+
+    Args:
+        app (Sphinx): The current sphinx app being run.
+        env (BuildEnvironment): The current build environment.
+    """
+    parsed_modules = get_parsed_modules(env)
+    if parsed_modules is not None and parsed_modules.gc_frozen:
+        gc.unfreeze()
+        parsed_modules.gc_frozen = False
+
+
+def _parse_in_processes(
+    pending: List[PendingFile], parse_options: List[str], workers: int
+) -> Iterator[Tuple[PendingFile, DocumentedObject]]:
+    """
+    Parse the `pending` files in a pool of `workers` processes, yielding each
+    file which parses as it's done.
+    """
+    logger.info("[c_autodoc] parsing %d C files in %d processes", len(pending), workers)
+    library = (
+        cindex.Config.library_path,
+        cindex.Config.library_file,
+        cindex.Config.compatibility_check,
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=library
+    ) as executor:
+        futures = {
+            executor.submit(
+                loader.load,
+                filename,
+                contents,
+                compilation_args=args,
+                parse_options=parse_options,
+            ): (key, filename, contents, args)
+            for key, filename, contents, args in pending
+        }
+        for future in as_completed(futures):
+            try:
+                module = future.result()
+            except Exception as error:
+                _warn_parse_failure(futures[future][1], error)
+                continue
+
+            yield futures[future], module
+
+
+def _parse_in_process(
+    pending: List[PendingFile], parse_options: List[str]
+) -> Iterator[Tuple[PendingFile, DocumentedObject]]:
+    """
+    Parse the `pending` files one after the other, yielding each file which
+    parses.
+    """
+    for key, filename, contents, args in pending:
+        try:
+            module = loader.load(
+                filename, contents, compilation_args=args, parse_options=parse_options
+            )
+        except Exception as error:
+            _warn_parse_failure(filename, error)
+            continue
+
+        yield (key, filename, contents, args), module
+
+
+def _init_worker(
+    library_path: Optional[str], library_file: Optional[str], compatibility_check: bool
+) -> None:
+    """
+    Use the same libclang library as the main process.
+
+    Forked workers have already loaded the library, anything else starts
+    without the configuration from ``conf.py``.
+    """
+    if cindex.Config.loaded:
+        return
+
+    if library_path:
+        cindex.Config.set_library_path(library_path)
+    if library_file:
+        cindex.Config.set_library_file(library_file)
+    cindex.Config.set_compatibility_check(compatibility_check)
+
+
+def _warn_parse_failure(filename: str, error: Exception) -> None:
+    logger.warning(
+        "Unable to parse %s ahead of time, parsing it when documented: %s",
+        filename,
+        error,
+        type="c_autodoc",
+    )
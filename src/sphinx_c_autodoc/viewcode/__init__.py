@@ -3,19 +3,31 @@ Handles viewcode for c.
 
 The processing idea:
 
-1. Walk through every node in the document finding out if it is a C
+1. As each C file is loaded add it to the environment list of files to create
+   source listings of, :attr:`app.env._viewcode_c_modules`. This happens for
+   every builder, since the environment may be reused by a later html build.
+
+2. Walk through every node in the document finding out if it is a C
    construct. Then find out which file, if any it is associated with:
 
    a. Create a pending cross reference to the file.
 
-   b. Add the file to the environment list of files to create source listings
-      of, :attr:`app.env._viewcode_c_modules`
+   b. Add a link back to the documentation to the file's entry in
+      :attr:`app.env._viewcode_c_modules`
+
+   c. Note that the document references the file. Once all documents are
+      read, the files no document references are removed.
 
-2. Walk through all of the files in the environment list,
+   The files and links of each document are also indexed in
+   :attr:`app.env._viewcode_c_references`, so that they can be removed when
+   the document is purged.
+
+3. Walk through all of the files in the environment list,
    :attr:`app.env._viewcode_c_modules` and create a source listing for each
-   one.
+   one. Only html builders create the listings, and listings which are the
+   same as those written by the previous build are skipped.
 
-3. Process the pending cross references and link them up to the source
+4. Process the pending cross references and link them up to the source
    listings.
 
 .. note:: The environment attribute is namespaced with `c` to prevent
@@ -26,13 +38,20 @@ The processing idea:
 
 """
 
-from dataclasses import dataclass
-from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
+import functools
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
 
+import pygments
+import sphinx
 from docutils import nodes
 from docutils.nodes import Element, Node
 from sphinx import addnodes
 from sphinx.application import Sphinx
+from sphinx.builders import Builder
+from sphinx.builders.html import StandaloneHTMLBuilder
 from sphinx.environment import BuildEnvironment
 from sphinx.util import logging
 from sphinx.util.nodes import make_refnode
@@ -43,16 +62,54 @@ try:
 except ImportError:  # pragma: no cover
     from sphinx.util import status_iterator
 
-from sphinx_c_autodoc import ViewCodeListing
+from sphinx_c_autodoc.loader import DocumentedObject
+from sphinx_c_autodoc.viewcode.store import (
+    get_highlight_store,
+    get_listing_store,
+    load_page_digests,
+    save_page_digests,
+)
+from sphinx_c_autodoc.viewcode.table import ConstructTable
 
 MODULES_DIRECTORY = "_modules"
 
+# Set on the builder while it writes every page, see :func:`note_forced_builds`.
+WRITE_ALL_ATTRIBUTE = "_c_autodoc_write_all"
+
 # To work with the c domain from sphinx all C constructs will have this prefix.
 C_DOMAIN_LINK_PREFIX = "c."
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ViewCodeListing:
+    """
+    A data structure used for constructing a viewcode source listing.
+
+    Attributes:
+        source_key (str):
+            The key of the plain text representation of the code, after any
+            pre-processing, in the
+            :class:`~sphinx_c_autodoc.viewcode.store.ListingStore`.
+
+        constructs (ConstructTable):
+            The names and lines of the code constructs.
+
+        doc_links (Dict): To be used by the consumers, i.e. viewcode.
+
+        docnames (Set[str]): The documents which reference the listing. The
+            listing is dropped once no documents reference it, see
+            :func:`drop_unreferenced_modules`.
+
+    """
+
+    source_key: str
+    constructs: ConstructTable
+    doc_links: Dict = field(default_factory=dict)
+    docnames: Set[str] = field(default_factory=set)
+
+
 @dataclass
 class DocumentationReference:
     """
@@ -75,6 +132,181 @@ class DocumentationReference:
     fullname: str
 
 
+def _is_supported_builder(builder: Optional[Builder]) -> bool:
+    """
+    Determine if `builder` will create source listings.
+
+    Args:
+        builder (Builder): The builder of the current sphinx run.
+
+    Returns:
+        bool: True if `builder` creates html pages and thus emits the
+        ``html-collect-pages`` event.
+    """
+    return isinstance(builder, StandaloneHTMLBuilder)
+
+
+def add_module_listing(
+    app: Sphinx, modname: str, filename: str, contents: str, module: DocumentedObject
+) -> None:
+    """
+    Add a newly loaded C file to the files to create source listings of, or
+    update its listing when the file has changed.
+
+    Meant to be connected to the ``c-autodoc-module-loaded`` and
+    ``c-autodoc-module-changed`` events. Listings are recorded for every
+    builder, as the environment, and so the listings, may be shared with a
+    later html build which reads nothing again.
+
+    Args:
+        app (Sphinx):
+            The currently running sphinx application.
+
+        modname (str):
+            The module name of the loaded file, as given to the directives.
+
+        filename (str):
+            The full path of the loaded file.
+
+        contents (str):
+            The contents of the loaded file, after any pre-processing.
+
+        module (DocumentedObject):
+            The loaded file.
+    """
+    assert app.builder is not None
+    env = app.builder.env
+    source_dict = getattr(env, "_viewcode_c_modules", {})
+    cast(Any, env)._viewcode_c_modules = source_dict
+
+    source_key = get_listing_store(env).add(contents)
+    listing = source_dict.get(modname)
+    if listing is None:
+        source_dict[modname] = ViewCodeListing(
+            source_key, ConstructTable.from_module(module)
+        )
+    elif listing.source_key != source_key:
+        # Keep the links back to the documentation, the documents which
+        # aren't read again still link to the same constructs.
+        listing.source_key = source_key
+        listing.constructs = ConstructTable.from_module(module)
+
+
+def merge_module_listings(
+    app: Sphinx, env: BuildEnvironment, docnames: Set[str], other: BuildEnvironment
+) -> None:
+    """
+    Merge the source listings from a parallel reading process, `other`, into
+    `env`.
+
+    Meant to be connected to the ``env-merge-info`` event.
+
+    As when reading serially, a module keeps the listing from when it was first
+    loaded. The links back to the documentation are combined, when both
+    environments document the same construct the document which sorts first is
+    linked to. This is the document which would have been read first, so the
+    links are the same no matter which process finishes first.
+
+    Args:
+        app (Sphinx):
+            The currently running sphinx application.
+
+        env (BuildEnvironment):
+            The main build environment.
+
+        docnames (Set[str]):
+            The documents read by `other`.
+
+        other (BuildEnvironment):
+            The environment of the process which read `docnames`.
+    """
+    other_modules: Dict[str, ViewCodeListing] = getattr(
+        other, "_viewcode_c_modules", {}
+    )
+    if not other_modules:
+        return
+
+    modules = getattr(env, "_viewcode_c_modules", {})
+    cast(Any, env)._viewcode_c_modules = modules
+
+    for modname, other_listing in other_modules.items():
+        listing = modules.setdefault(modname, other_listing)
+        if listing is other_listing:
+            continue
+
+        listing.docnames.update(other_listing.docnames)
+        doc_links = listing.doc_links
+        for fullname, reference in other_listing.doc_links.items():
+            existing = doc_links.get(fullname)
+            if existing is None or reference.docname < existing.docname:
+                doc_links[fullname] = reference
+
+    other_references = getattr(other, "_viewcode_c_references", {})
+    references = _get_doc_references(env)
+    for docname in docnames:
+        if docname in other_references:
+            references[docname] = other_references[docname]
+
+
+def purge_doc_links(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    """
+    Remove the links back to `docname`, and its references, from the source
+    listings.
+
+    Meant to be connected to the ``env-purge-doc`` event, so that documents
+    which are removed, or read again, don't leave stale links behind.
+
+    Args:
+        app (Sphinx):
+            The currently running sphinx application.
+
+        env (BuildEnvironment):
+            The current build environment.
+
+        docname (str):
+            The document being removed from the environment.
+    """
+    references = _get_doc_references(env).pop(docname, {})
+    modules: Dict[str, ViewCodeListing] = getattr(env, "_viewcode_c_modules", {})
+    for modname, fullnames in references.items():
+        listing = modules.get(modname)
+        if listing is None:
+            continue
+
+        listing.docnames.discard(docname)
+        doc_links = listing.doc_links
+        for fullname in fullnames:
+            reference = doc_links.get(fullname)
+            # Another document may have linked the construct first
+            if reference is not None and reference.docname == docname:
+                del doc_links[fullname]
+
+
+def drop_unreferenced_modules(app: Sphinx, env: BuildEnvironment) -> None:
+    """
+    Remove the source listings which no document references any more, along
+    with their stored source text.
+
+    Meant to be connected to the ``env-updated`` event. Listings aren't
+    removed as documents are purged, since a document read again may use a
+    module which was already loaded this build, and so won't add its listing
+    again.
+
+    Args:
+        app (Sphinx):
+            The currently running sphinx application.
+
+        env (BuildEnvironment):
+            The current build environment.
+    """
+    modules: Dict[str, ViewCodeListing] = getattr(env, "_viewcode_c_modules", {})
+    unreferenced = [m for m, listing in modules.items() if not listing.docnames]
+    for modname in unreferenced:
+        del modules[modname]
+
+    get_listing_store(env).prune({listing.source_key for listing in modules.values()})
+
+
 def missing_reference(
     app: Sphinx, env: BuildEnvironment, node: Element, contnode: Node
 ) -> Optional[Node]:
@@ -112,8 +344,7 @@ def missing_reference(
         if module is None:
             return nodes.inline()
 
-        construct = _find_construct(node["fullname"], module.ast)
-        if construct is None:
+        if node["fullname"] not in module.constructs:
             return nodes.inline()
 
         return make_refnode(
@@ -130,6 +361,11 @@ def add_source_listings(app: Sphinx) -> Iterator[Tuple[str, Dict[str, Any], str]
     The pending source files to create listings for are stored in
     :attr:`app.env._viewcode_c_modules`.
 
+    Pages are only created when they would differ from those written by the
+    previous build, see :func:`_get_page_digest`, unless every page is being
+    written. The highlighted source is
+    cached, so a page whose links changed doesn't need highlighting again.
+
     Meant to be connected to the `html-collect-pages` event,
     https://www.sphinx-doc.org/en/master/extdev/appapi.html#event-html-collect-pages
 
@@ -141,20 +377,65 @@ def add_source_listings(app: Sphinx) -> Iterator[Tuple[str, Dict[str, Any], str]
         of the page, the name of the template to use for generating the final
         page.
     """
+    if not _is_supported_builder(app.builder):
+        return
+
     assert app.builder is not None
-    modules_to_list = getattr(app.builder.env, "_viewcode_c_modules", {})
+    builder = app.builder
+    env = builder.env
+    modules_to_list: Dict[str, ViewCodeListing] = getattr(
+        env, "_viewcode_c_modules", {}
+    )
+
+    style_key = _get_highlight_style_key(app)
+    build_key = _get_build_key(app)
+    previous_digests = load_page_digests(env)
+    write_all = getattr(builder, WRITE_ALL_ATTRIBUTE, False) or app.fresh_env_used
+    digests = {}
+    highlight_keys = {}
+    outdated = []
+    for module, code_listing in sorted(modules_to_list.items()):
+        page_name = _get_source_page_name(module)
+        highlight_key = _get_highlight_key(style_key, code_listing.source_key)
+        digest = _get_page_digest(build_key, highlight_key, code_listing)
+        digests[page_name] = digest
+        highlight_keys[module] = highlight_key
+        if (
+            write_all
+            or previous_digests.get(page_name) != digest
+            or not os.path.exists(cast(Any, builder).get_outfilename(page_name))
+        ):
+            outdated.append((module, code_listing))
 
     iterator = status_iterator(
-        sorted(modules_to_list.items()),
+        outdated,
         "highlighting c module code... ",
         "blue",
-        len(modules_to_list),
+        len(outdated),
         app.verbosity,
         lambda x: x[0],
     )
 
+    store = get_listing_store(env)
+    highlights = get_highlight_store(env)
     for module, code_listing in iterator:
-        highlighted_source = _get_highlighted_source(app, code_listing.raw_listing)
+        highlight_key = highlight_keys[module]
+        highlighted_code = highlights.get(highlight_key)
+        if highlighted_code is None:
+            source = store.get(code_listing.source_key)
+            if source is None:
+                logger.warning(
+                    "Unable to read the source listing of %s",
+                    module,
+                    type="c_autodoc",
+                )
+                del digests[_get_source_page_name(module)]
+                continue
+
+            highlighted_code = _highlight_source(app, source)
+            highlights.put(highlight_key, highlighted_code)
+
+        highlighted_source = _align_code_lines(highlighted_code.splitlines())
         _insert_line_anchors(app, highlighted_source, code_listing)
 
         context = {
@@ -165,6 +446,158 @@ def add_source_listings(app: Sphinx) -> Iterator[Tuple[str, Dict[str, Any], str]
         }
         yield (_get_source_page_name(module), context, "page.html")
 
+    # Only reached once every page has been written.
+    highlights.prune(set(highlight_keys.values()))
+    save_page_digests(env, digests)
+
+
+def _get_highlight_style_key(app: Sphinx) -> str:
+    """
+    Get a description of everything, other than the source, which changes
+    the highlighted source.
+
+    Args:
+        app (Sphinx): The sphinx app currently doing the processing.
+
+    Returns:
+        str: The versions of Pygments and Sphinx, along with the style and
+        formatter of the highlighter.
+    """
+    highlighter = cast(Any, app.builder).highlighter
+    style = highlighter.formatter_args.get("style")
+    parts = (
+        f"pygments={pygments.__version__}",
+        f"sphinx={sphinx.__version__}",
+        f"style={style.__module__}.{style.__qualname__}",
+        f"formatter={highlighter.formatter.__module__}."
+        f"{highlighter.formatter.__qualname__}",
+    )
+    return ";".join(parts)
+
+
+def _get_highlight_key(style_key: str, source_key: str) -> str:
+    """
+    Get the key of the highlighted source of a listing.
+
+    Args:
+        style_key (str): The highlighter, from :func:`_get_highlight_style_key`.
+        source_key (str): The key of the source text of the listing.
+
+    Returns:
+        str: The key of the highlighted source.
+    """
+    text = f"{style_key}\0{source_key}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _get_build_key(app: Sphinx) -> str:
+    """
+    Get a digest of everything, other than the listing itself, which changes
+    the written listing pages.
+
+    This follows what the html builder looks at to decide if every document
+    needs writing again: the configuration, the tags and the templates. The
+    titles, table of contents and toctrees of the documents are included as
+    the pages show the navigation of the documentation.
+
+    Args:
+        app (Sphinx): The sphinx app currently doing the processing.
+
+    Returns:
+        str: The digest of the build.
+    """
+    builder = cast(Any, app.builder)
+    env = builder.env
+    build_info = getattr(builder, "build_info", None)
+    templates = getattr(builder, "templates", None)
+
+    digest = hashlib.sha256()
+    for part in (
+        builder.name,
+        str(builder.outdir),
+        getattr(build_info, "config_hash", ""),
+        getattr(build_info, "tags_hash", ""),
+        str(templates.newest_template_mtime() if templates else 0),
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+
+    for docname in sorted(env.found_docs):
+        title = env.titles.get(docname)
+        toc = env.tocs.get(docname)
+        includes = env.toctree_includes.get(docname, ())
+        for part in (
+            docname,
+            title.astext() if title is not None else "",
+            toc.astext() if toc is not None else "",
+            "\0".join(includes),
+        ):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def note_forced_builds(app: Sphinx) -> None:
+    """
+    Note when the builder is told to write every page, ``sphinx-build -a``, so
+    the source listings are written too.
+
+    Sphinx only passes this on to the builder's writing, so the builder's
+    :meth:`~sphinx.builders.Builder.build_all` is wrapped to record it.
+
+    Meant to be connected to the `builder-inited` event.
+
+    Args:
+        app (Sphinx): The sphinx app currently doing the processing.
+    """
+    builder = app.builder
+    if builder is None:
+        return
+
+    build_all = builder.build_all
+
+    @functools.wraps(build_all)
+    def forced_build_all() -> None:
+        setattr(builder, WRITE_ALL_ATTRIBUTE, True)
+        try:
+            build_all()
+        finally:
+            setattr(builder, WRITE_ALL_ATTRIBUTE, False)
+
+    cast(Any, builder).build_all = forced_build_all
+
+
+def _get_page_digest(
+    build_key: str, highlight_key: str, code_listing: ViewCodeListing
+) -> str:
+    """
+    Get the digest of the listing page of `code_listing`.
+
+    The page is the same as the one written by the previous build when the
+    digest is, so it needn't be written again.
+
+    Args:
+        build_key (str): The build, from :func:`_get_build_key`.
+        highlight_key (str): The key of the highlighted source.
+        code_listing (ViewCodeListing): The listing of the page.
+
+    Returns:
+        str: The digest of the page.
+    """
+    digest = hashlib.sha256()
+    constructs = code_listing.constructs
+    for part in (build_key, highlight_key, "\0".join(constructs.names)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    for column in (constructs.start_lines, constructs.end_lines, constructs.parents):
+        digest.update(column.tobytes())
+
+    for fullname, doc in sorted(code_listing.doc_links.items()):
+        digest.update(f"{fullname}\0{doc.docname}\0{doc.module}\0".encode("utf-8"))
+
+    return digest.hexdigest()
+
 
 def _get_source_page_name(module: str) -> str:
     """
@@ -197,15 +630,16 @@ def _insert_documentation_backlinks(
             Contains the documentation locations which documented `highlighted_code`.
     """
     assert app.builder is not None
+    constructs = code_listing.constructs
     for doc in code_listing.doc_links.values():
-        construct = _find_construct(doc.fullname, code_listing.ast)
+        row = constructs.find(doc.fullname)
 
         # Can happen when documenting a non existent C construct.
         # TODO consider if this should be a warning.
-        if construct is None:
+        if row is None:
             continue
 
-        link_line = construct["start_line"]
+        link_line = constructs.start_lines[row]
         page_name = _get_source_page_name(doc.module)
         relative_link = app.builder.get_relative_uri(page_name, doc.docname)
         link_text = f"{relative_link}#{C_DOMAIN_LINK_PREFIX}{doc.fullname}"
@@ -215,37 +649,6 @@ def _insert_documentation_backlinks(
         )
 
 
-def _find_construct(fullname: str, ast: Dict) -> Optional[Dict]:
-    """
-    Find a C construct inside of the provided `ast`.
-
-    Args:
-        fullname (str): The full, dotted name, to the C construct.
-
-        ast (dict):
-            A dictionary like representation of the code constructs.
-            See :ref:`developer_notes:Common Terms`.
-
-    Returns:
-        Dict: The C construct if it is found in the `ast`.  None otherwise.
-
-    """
-    parts = fullname.split(".", 1)
-    parent = parts[0]
-    child = {}
-    for child in ast["children"]:
-        if child["name"] == parent:
-            break
-    else:
-        return None
-
-    if len(parts) > 1:
-        child_path = parts[1]
-        return _find_construct(child_path, child)
-
-    return child
-
-
 def _insert_line_anchors(
     app: Sphinx, highlighted_source: List[str], code_listing: ViewCodeListing
 ) -> None:
@@ -266,50 +669,15 @@ def _insert_line_anchors(
     """
     _insert_documentation_backlinks(app, highlighted_source, code_listing)
 
-    # The root file needs no anchor so only document it's children
-    for child in code_listing.ast["children"]:
-        _insert_construct_anchor(app, highlighted_source, child)
-
-
-def _insert_construct_anchor(
-    app: Sphinx,
-    highlighted_source: List[str],
-    construct: Dict,
-    prefix: Optional[str] = None,
-) -> None:
-    """
-    Recursivley insert an anchor for a c construct and anchors for all of
-    it's children.
-
-    Args:
-        app (Sphinx):
-            The sphinx app currently doing the processing.
-        highlighted_source (List[str]):
-            The source to populate with anchors. This should already
-            highlighted in html format.
-        construct (Dict):
-            The construct to create an anchor for.
-            See :ref:`c_construct`
-        prefix (Optional[str]):
-            The prefix representing the dotted path of the current
-    """
-    start = construct["start_line"]
-    end = construct["end_line"]
-    name = construct["name"]
-    if prefix:
-        prefix = ".".join((prefix, name))
-    else:
-        prefix = name
-    highlighted_source[start] = (
-        f'<div class="viewcode-block" id="{C_DOMAIN_LINK_PREFIX}{prefix}">'
-        + highlighted_source[start]
-    )
-    highlighted_source[end] += "</div>"
-    for child in construct.get("children", []):
-        _insert_construct_anchor(app, highlighted_source, child, prefix)
+    for fullname, start, end in code_listing.constructs.constructs():
+        highlighted_source[start] = (
+            f'<div class="viewcode-block" id="{C_DOMAIN_LINK_PREFIX}{fullname}">'
+            + highlighted_source[start]
+        )
+        highlighted_source[end] += "</div>"
 
 
-def _get_highlighted_source(app: Sphinx, code: str) -> List[str]:
+def _highlight_source(app: Sphinx, code: str) -> str:
     """
     Turn the code into a highlighted source file.
 
@@ -320,14 +688,11 @@ def _get_highlighted_source(app: Sphinx, code: str) -> List[str]:
             The code to turn into highlighted source.
 
     Returns:
-        List[str]: The code lines with necessary markup to be highlighted.
-        The first line of the `code` will be in index ``1`` of the list.
+        str: The code with necessary markup to be highlighted. See
+        :func:`_align_code_lines` for splitting it into lines.
     """
     highlighter = cast(Any, app.builder).highlighter
-    highlighted_code = highlighter.highlight_block(code, "c", linenos=False)
-
-    lines = highlighted_code.splitlines()
-    return _align_code_lines(lines)
+    return highlighter.highlight_block(code, "c", linenos=False)
 
 
 def _align_code_lines(highlighted_code: List[str]) -> List[str]:
@@ -390,11 +755,35 @@ def doctree_read(app: Sphinx, doctree: Node) -> None:
 
         for signature in signature_nodes:
             fullname = signature.get("fullname")
+            _add_module_reference(app, signature)
             if use_back_refs:
                 _add_pending_back_reference(app, signature, fullname)
             _add_pending_source_cross_reference(app, signature, fullname)
 
 
+def _add_module_reference(app: Sphinx, signode: addnodes.desc_signature) -> None:
+    """
+    Note that the current document references the module of `signode`, so
+    that its source listing is kept.
+
+    Args:
+        app (Sphinx):
+            The sphinx app currently doing the processing.
+        signode (Node):
+            The signature node of a C construct.
+    """
+    module = signode.get("module")
+    if module is None:
+        return
+
+    assert app.builder is not None
+    env = app.builder.env
+    code_listing = getattr(env, "_viewcode_c_modules", {}).get(module)
+    if code_listing is not None:
+        code_listing.docnames.add(env.docname)
+        _get_doc_references(env).setdefault(env.docname, {}).setdefault(module, set())
+
+
 def _add_pending_source_cross_reference(
     app: Sphinx, signode: addnodes.desc_signature, fullname: str
 ) -> None:
@@ -470,24 +859,62 @@ def _add_pending_back_reference(
     assert app.builder.env is not None
 
     env = app.builder.env
-    code_listing = cast(Any, env)._viewcode_c_modules.get(module)
+    code_listing = getattr(env, "_viewcode_c_modules", {}).get(module)
     if code_listing is None:
         return
 
     doc_links = code_listing.doc_links
-    doc_links.setdefault(
+    reference = doc_links.setdefault(
         fullname, DocumentationReference(env.docname, module, fullname)
     )
+    if reference.docname == env.docname:
+        doc_references = _get_doc_references(env).setdefault(env.docname, {})
+        doc_references.setdefault(module, set()).add(fullname)
+
+
+def _get_doc_references(env: BuildEnvironment) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    Get the index of what each document references in the source listings.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        Dict[str, Dict[str, Set[str]]]: For each document, the modules it
+        references, and the constructs of each module it's the documentation
+        link of.
+    """
+    references = getattr(env, "_viewcode_c_references", None)
+    if references is None:
+        references = {}
+        cast(Any, env)._viewcode_c_references = references
+    return references
 
 
-def setup(app: Sphinx) -> None:
+def setup(app: Sphinx) -> Dict[str, Any]:
     """
     Setup function for registering this with sphinx
 
     Args:
         app (Sphinx):
             The application for the current run of sphinx.
+
+    Returns:
+        Dict[str, Any]: The extension metadata. The environment version is
+        bumped whenever the pickled source listings change layout.
     """
+    app.connect("builder-inited", note_forced_builds)
+    app.connect("c-autodoc-module-loaded", add_module_listing)
+    app.connect("c-autodoc-module-changed", add_module_listing)
     app.connect("doctree-read", doctree_read)
+    app.connect("env-merge-info", merge_module_listings)
+    app.connect("env-purge-doc", purge_doc_links)
+    app.connect("env-updated", drop_unreferenced_modules)
     app.connect("missing-reference", missing_reference)
     app.connect("html-collect-pages", add_source_listings)
+
+    return {
+        "env_version": 4,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,222 @@
+"""
+Storage of the source text of the viewcode listings outside of the environment.
+
+Sphinx pickles the entire environment at the end of every build, and unpickles
+it at the start of the next. Holding the source of every listed C file in the
+environment means reading and writing all of it on every build, even though
+the text is only needed when a listing page is written. Instead the text is
+stored in files named by the hash of the text, with only the hash kept in the
+environment.
+
+The highlighted source of the listings is kept the same way, so unchanged
+listings aren't highlighted again, along with a record of the listing pages
+written, so unchanged pages aren't written again.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Collection, Dict, Optional
+
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+
+#: The directory, within the doctree directory, holding the source text.
+LISTINGS_DIRECTORY = "c_autodoc_listings"
+
+#: The extension of the files holding the source text.
+LISTING_SUFFIX = ".c.txt"
+
+#: The directory, within the doctree directory, holding the highlighted source.
+HIGHLIGHT_DIRECTORY = "c_autodoc_highlighted"
+
+#: The extension of the files holding the highlighted source.
+HIGHLIGHT_SUFFIX = ".html"
+
+#: The file, within the doctree directory, recording the listing pages written.
+PAGES_FILENAME = "c_autodoc_pages.json"
+
+logger = logging.getLogger(__name__)
+
+
+class ListingStore:
+    """
+    The source text of the listings, stored by the hash of the text.
+
+    Identical text, like a C file listed under two names, is only stored once.
+
+    Arguments:
+        directory (str): The directory to store the text in.
+        suffix (str): The extension of the stored files.
+    """
+
+    def __init__(self, directory: str, suffix: str = LISTING_SUFFIX) -> None:
+        self.directory = directory
+        self.suffix = suffix
+
+    def add(self, text: str) -> str:
+        """
+        Store `text`, unless it's already stored.
+
+        Args:
+            text (str): The source text of a listing.
+
+        Returns:
+            str: The key to get `text` back with.
+        """
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.put(key, text)
+        return key
+
+    def put(self, key: str, text: str) -> None:
+        """
+        Store `text` under `key`, unless something is already stored under
+        `key`.
+
+        Args:
+            key (str): The key to store `text` under, this must change
+                whenever `text` does.
+            text (str): The text to store.
+        """
+        path = self._entry_path(key)
+        if os.path.exists(path):
+            return
+
+        try:
+            _write_atomic(self.directory, path, text)
+        except OSError as error:
+            logger.warning(
+                "Unable to write C source listing to %s: %s",
+                self.directory,
+                error,
+                type="c_autodoc",
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get the text stored under `key`.
+
+        Args:
+            key (str): The key from :meth:`add`.
+
+        Returns:
+            str: The source text, None if it isn't stored.
+        """
+        try:
+            with open(self._entry_path(key), encoding="utf-8", newline="") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def prune(self, keys: Collection[str]) -> None:
+        """
+        Remove the text of every listing other than those of `keys`.
+
+        Args:
+            keys (Collection[str]): The keys of the listings still in use.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+
+        for name in names:
+            if name.endswith(self.suffix) and name[: -len(self.suffix)] in keys:
+                continue
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as error:
+                logger.debug("[c_autodoc] unable to remove %s: %s", name, error)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+
+def get_listing_store(env: BuildEnvironment) -> ListingStore:
+    """
+    Get the store of the listings' source text for `env`.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        ListingStore: The store, within the doctree directory.
+    """
+    return ListingStore(os.path.join(env.doctreedir, LISTINGS_DIRECTORY))
+
+
+def get_highlight_store(env: BuildEnvironment) -> ListingStore:
+    """
+    Get the store of the listings' highlighted source for `env`.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        ListingStore: The store, within the doctree directory.
+    """
+    return ListingStore(
+        os.path.join(env.doctreedir, HIGHLIGHT_DIRECTORY), HIGHLIGHT_SUFFIX
+    )
+
+
+def load_page_digests(env: BuildEnvironment) -> Dict[str, str]:
+    """
+    Load the digests of the listing pages written by the previous build.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+
+    Returns:
+        Dict[str, str]: The digest of each page, by page name. Empty when
+        there is no usable record.
+    """
+    try:
+        with open(os.path.join(env.doctreedir, PAGES_FILENAME), encoding="utf-8") as f:
+            digests = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(digests, dict):
+        return {}
+
+    return digests
+
+
+def save_page_digests(env: BuildEnvironment, digests: Dict[str, str]) -> None:
+    """
+    Record the digests of the listing pages written by this build.
+
+    Args:
+        env (BuildEnvironment): The current build environment.
+        digests (Dict[str, str]): The digest of each page, by page name.
+    """
+    directory = str(env.doctreedir)
+    try:
+        _write_atomic(
+            directory,
+            os.path.join(directory, PAGES_FILENAME),
+            json.dumps(digests, sort_keys=True),
+        )
+    except OSError as error:
+        logger.debug("[c_autodoc] unable to record the listing pages: %s", error)
+
+
+def _write_atomic(directory: str, path: str, text: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary file and then move it in place so that readers,
+    # possibly in other processes, never see a partial file.
+    fd, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(temp_name, path)
+    except OSError:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        raise
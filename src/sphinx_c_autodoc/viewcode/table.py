@@ -0,0 +1,135 @@
+"""
+A compact table of the C constructs in a source listing.
+
+The source listings only need the name and lines of each construct, to find
+the constructs documentation links to, and to place the anchors. Rather than
+the nested dictionaries of the AST, the constructs are kept in columns, with a
+row for each construct, and an index from the dotted name of each construct to
+its row.
+"""
+
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sphinx_c_autodoc.loader import DocumentedObject
+
+#: The row of the C file itself, the parent of the top level constructs.
+ROOT_ROW = 0
+
+
+class ConstructTable:
+    """
+    The C constructs of a C file, in the order they are in the file with each
+    construct before its children.
+
+    The index of dotted names is rebuilt when unpickled, only the columns are
+    pickled.
+
+    Attributes:
+        names (List[str]): The name of each construct, without its parents.
+        start_lines (array): The line each construct starts on.
+        end_lines (array): The line each construct ends on.
+        parents (array): The row of the parent of each construct.
+    """
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.start_lines = array("I")
+        self.end_lines = array("I")
+        self.parents = array("I")
+        self._rows: Dict[str, int] = {}
+
+    @classmethod
+    def from_module(cls, module: DocumentedObject) -> "ConstructTable":
+        """
+        Create the table of the constructs in `module`.
+
+        Args:
+            module (DocumentedObject): The loaded C file.
+
+        Returns:
+            ConstructTable: The constructs of `module`, the first row being
+            `module` itself.
+        """
+        table = cls()
+        start_line, end_line = module.line_range()
+        table._append("", start_line, end_line, ROOT_ROW, "")
+
+        # Children are pushed in reverse so they're added in order.
+        stack = [(ROOT_ROW, "", c) for c in reversed(list(module.children.values()))]
+        while stack:
+            parent, prefix, obj = stack.pop()
+            fullname = f"{prefix}.{obj.name}" if prefix else obj.name
+            start_line, end_line = obj.line_range()
+            row = table._append(obj.name, start_line, end_line, parent, fullname)
+            children = list(obj.children.values())
+            stack.extend((row, fullname, c) for c in reversed(children))
+
+        return table
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, fullname: str) -> bool:
+        return fullname in self._rows
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "names": self.names,
+            "start_lines": self.start_lines,
+            "end_lines": self.end_lines,
+            "parents": self.parents,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._rows = {}
+        for row, fullname in enumerate(self._fullnames()):
+            if row != ROOT_ROW:
+                self._rows.setdefault(fullname, row)
+
+    def find(self, fullname: str) -> Optional[int]:
+        """
+        Find the row of a C construct.
+
+        Args:
+            fullname (str): The full, dotted name, of the C construct.
+
+        Returns:
+            int: The row of the construct, None if it's not in the table. When
+            more than one construct has `fullname` the first is found.
+        """
+        return self._rows.get(fullname)
+
+    def constructs(self) -> Iterator[Tuple[str, int, int]]:
+        """
+        Iterate over the constructs, excluding the C file itself.
+
+        Yields:
+            Tuple[str, int, int]: The full, dotted name, the start line and the
+            end line of each construct, in the order of the table.
+        """
+        for row, fullname in enumerate(self._fullnames()):
+            if row != ROOT_ROW:
+                yield fullname, self.start_lines[row], self.end_lines[row]
+
+    def _fullnames(self) -> List[str]:
+        # Parents always come before their children
+        fullnames: List[str] = []
+        for row, name in enumerate(self.names):
+            parent = self.parents[row]
+            prefix = fullnames[parent] if row != ROOT_ROW else ""
+            fullnames.append(f"{prefix}.{name}" if prefix else name)
+        return fullnames
+
+    def _append(
+        self, name: str, start_line: int, end_line: int, parent: int, fullname: str
+    ) -> int:
+        row = len(self.names)
+        self.names.append(name)
+        self.start_lines.append(start_line)
+        self.end_lines.append(end_line)
+        self.parents.append(parent)
+        if row != ROOT_ROW:
+            self._rows.setdefault(fullname, row)
+        return row
@@ -29,3 +29,8 @@ unknown_type unknown_array_type_var[24];
  * Unknown extern type
  */
 extern unknown_type * unknown_extern_type_var;
+
+/**
+ * A table with an unknown type, the initializer doesn't affect the type.
+ */
+unknown_type unknown_type_table[] = {FIRST_ENTRY, SECOND_ENTRY};
@@ -0,0 +1,166 @@
+"""
+Test the persistent caching of loaded C modules
+"""
+
+import os
+import shutil
+
+from sphinx_c_autodoc import cache, loader
+from sphinx_c_autodoc.cache import (
+    DISK_CACHE_ATTRIBUTE,
+    DiskCache,
+    disk_key,
+    extension_fingerprint,
+    load_module,
+)
+
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "assets"))
+
+SOURCE = """\
+/**
+ * A file which includes a header
+ */
+#include "header.h"
+
+/**
+ * A function using the header type
+ */
+header_type foo(void);
+"""
+
+
+def load_file(filename):
+    with open(filename) as f:
+        contents = f.read()
+    return loader.load(filename, contents)
+
+
+def test_round_trip(tmp_path):
+    """
+    A module read back from the cache documents the same as the freshly loaded
+    module.
+    """
+    filename = os.path.join(ASSETS_DIR, "c_source", "example.c")
+    module = load_file(filename)
+    expected = str(module)
+
+    cache = DiskCache(str(tmp_path))
+    cache.add("some_key", module)
+    cached_module = DiskCache(str(tmp_path)).get("some_key")
+
+    assert cached_module.node is None
+    assert str(cached_module) == expected
+    for name, child in module.children.items():
+        cached_child = cached_module.children[name]
+        assert cached_child.get_doc() == child.get_doc()
+        assert cached_child.format_name() == child.format_name()
+        assert cached_child.format_args() == child.format_args()
+        assert cached_child.is_public() == child.is_public()
+
+
+def test_missing_entry(tmp_path):
+    """
+    A key which was never added is a miss.
+    """
+    assert DiskCache(str(tmp_path)).get("not_there") is None
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    """
+    An entry which can't be unpickled is a miss, rather than an error.
+    """
+    (tmp_path / "bad_key.pickle").write_bytes(b"not a pickle")
+
+    assert DiskCache(str(tmp_path)).get("bad_key") is None
+
+
+def test_changed_include_invalidates_entry(tmp_path):
+    """
+    An entry is stale once any header it included has changed.
+    """
+    header = tmp_path / "header.h"
+    header.write_text("typedef int header_type;\n")
+    source = tmp_path / "source.c"
+    source.write_text(SOURCE)
+
+    module = load_file(str(source))
+    assert str(header) in module.includes
+
+    cache_dir = str(tmp_path / "cache")
+    DiskCache(cache_dir).add("some_key", module)
+    assert DiskCache(cache_dir).get("some_key") is not None
+
+    header.write_text("typedef float header_type;\n")
+    assert DiskCache(cache_dir).get("some_key") is None
+
+
+def test_key_changes_with_contents_and_args():
+    """
+    Anything which changes how a file is parsed, or the extension itself,
+    gives a different key.
+    """
+    key = disk_key("file.c", "int a;", ["-DFOO"])
+
+    assert key == disk_key("file.c", "int a;", ["-DFOO"])
+    assert key != disk_key("file.c", "int b;", ["-DFOO"])
+    assert key != disk_key("file.c", "int a;", ["-DBAR"])
+    assert key != disk_key("other_file.c", "int a;", ["-DFOO"])
+    assert key != disk_key("file.c", "int a;", ["-DFOO"], ["incomplete"])
+    assert key != disk_key("file.c", "int a;", ["-DFOO"], fingerprint="other")
+
+
+def test_fingerprint_changes_with_the_source(tmp_path, monkeypatch):
+    """
+    Changing any of the code of the extension, without changing its version,
+    stops the modules it saved from being used.
+    """
+    package_dir = tmp_path / "sphinx_c_autodoc"
+    shutil.copytree(cache.PACKAGE_DIR, package_dir)
+    monkeypatch.setattr(cache, "PACKAGE_DIR", str(package_dir))
+    fingerprint = extension_fingerprint()
+
+    assert fingerprint == extension_fingerprint()
+
+    with (package_dir / "loader.py").open("a") as f:
+        f.write("\n# A change\n")
+
+    assert fingerprint != extension_fingerprint()
+
+
+def test_prune_keeps_recently_used_entries(tmp_path):
+    """
+    Pruning removes the least recently used entries, reading an entry counts
+    as using it.
+    """
+    module = load_file(os.path.join(ASSETS_DIR, "c_source", "file_2.c"))
+    cache_dir = str(tmp_path)
+    for age, key in enumerate(("new", "old", "older")):
+        DiskCache(cache_dir).add(key, module)
+        os.utime(tmp_path / f"{key}.pickle", (1000 - age, 1000 - age))
+    entry_size = (tmp_path / "new.pickle").stat().st_size
+
+    DiskCache(cache_dir).get("older")
+    DiskCache(cache_dir).prune()
+    DiskCache(cache_dir, max_size=2 * entry_size).prune()
+
+    assert sorted(os.listdir(cache_dir)) == ["new.pickle", "older.pickle"]
+
+
+def test_cache_hit_skips_libclang(sphinx_state, tmp_path, monkeypatch):
+    """
+    Once a module is in the disk cache, loading it again doesn't parse it.
+    """
+    setattr(sphinx_state.env, DISK_CACHE_ATTRIBUTE, DiskCache(str(tmp_path)))
+    filename = os.path.join(ASSETS_DIR, "c_source", "example.c")
+    with open(filename) as f:
+        contents = f.read()
+
+    first = load_module(sphinx_state.env, filename, contents, None, None)
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("libclang should not have been used")
+
+    monkeypatch.setattr(loader, "load", fail_load)
+    second = load_module(sphinx_state.env, filename, contents, None, None)
+
+    assert str(second) == str(first)
@@ -0,0 +1,170 @@
+"""
+Test the build wide caching of loaded C modules
+"""
+
+import pickle
+
+from sphinx.ext.autodoc.directive import AutodocDirective
+
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.cache import (
+    ModuleCache,
+    estimate_size,
+    get_module_cache,
+    module_key,
+)
+
+
+def test_least_recently_used_module_is_evicted():
+    """
+    Once full, the cache drops the module that was used the longest ago.
+    """
+    cache = ModuleCache(100)
+    cache.add("a", "module a", size=40)
+    cache.add("b", "module b", size=40)
+
+    # Touch "a" so that "b" becomes the least recently used
+    assert cache.get("a") == "module a"
+
+    cache.add("c", "module c", size=40)
+
+    assert len(cache) == 2
+    assert cache.total_size == 80
+    assert "b" not in cache
+    assert cache.get("a") == "module a"
+    assert cache.get("c") == "module c"
+
+
+def test_evicted_by_size_not_count():
+    """
+    One large module pushes out several small ones.
+    """
+    cache = ModuleCache(100)
+    for name in "abcd":
+        cache.add(name, f"module {name}", size=20)
+
+    cache.add("large", "large module", size=70)
+
+    assert list(cache._modules) == ["d", "large"]
+    assert cache.total_size == 90
+
+
+def test_module_larger_than_the_cache_is_not_added():
+    """
+    A module which can never fit isn't cached, rather than emptying the cache.
+    """
+    cache = ModuleCache(100)
+    cache.add("a", "module a", size=40)
+
+    cache.add("huge", "huge module", size=101)
+
+    assert "huge" not in cache
+    assert cache.get("a") == "module a"
+
+
+def test_readding_a_module_replaces_its_size():
+    """
+    Adding a module again counts only its latest size.
+    """
+    cache = ModuleCache(100)
+    cache.add("a", "module a", size=40)
+    cache.add("a", "module a", size=30)
+
+    assert len(cache) == 1
+    assert cache.total_size == 30
+
+
+def test_estimated_size_follows_the_module():
+    """
+    Modules with more constructs are estimated to be larger.
+    """
+    small = loader.load("small.c", "int a;")
+    large = loader.load(
+        "large.c",
+        "".join(f"/** Doc {i} */\nint function_{i}(int a);\n" for i in range(50)),
+    )
+
+    assert 0 < estimate_size(small) < estimate_size(large)
+
+
+def test_unbounded_cache():
+    """
+    Without a maximum size every module is kept.
+    """
+    cache = ModuleCache(None)
+    for i in range(100):
+        cache.add(i, f"module {i}")
+
+    assert len(cache) == 100
+
+
+def test_zero_size_cache_holds_nothing():
+    """
+    A maximum size of zero disables the cache.
+    """
+    cache = ModuleCache(0)
+    cache.add("a", "module a")
+
+    assert cache.get("a") is None
+
+
+def test_cache_is_not_pickled():
+    """
+    The cached modules are only valid for a build so should never end up in
+    the pickled environment.
+    """
+    cache = ModuleCache(1024)
+    cache.add("a", "module a")
+
+    unpickled = pickle.loads(pickle.dumps(cache))
+
+    assert unpickled.max_size == 1024
+    assert len(unpickled) == 0
+    assert unpickled.total_size == 0
+
+
+def test_key_changes_with_contents_and_args():
+    """
+    Anything which changes how a file is parsed gives a different key.
+    """
+    key = module_key("file.c", "int a;", None, ["-DFOO"])
+
+    assert key == module_key("file.c", "int a;", None, ["-DFOO"])
+    assert key != module_key("file.c", "int b;", None, ["-DFOO"])
+    assert key != module_key("file.c", "int a;", None, ["-DBAR"])
+    assert key != module_key("file.c", "int a;", "compile_commands.json", ["-DFOO"])
+    assert key != module_key("file.c", "int a;", None, ["-DFOO"], ["incomplete"])
+    assert key != module_key("file.c", "int a;", None, ["-DFOO"], (), "last")
+
+
+def test_module_loaded_once_across_documents(sphinx_state):
+    """
+    Documents referencing the same file share the same loaded module, so the
+    file is only pre-processed once.
+    """
+    load_calls = []
+
+    def pre_process(app, filename, contents, *args):
+        load_calls.append(filename)
+
+    sphinx_state.env.app.connect("c-autodoc-pre-process", pre_process)
+
+    for docname in ("first_doc", "second_doc"):
+        # Sphinx resets the temporary data for every document
+        sphinx_state.env.temp_data.clear()
+        sphinx_state.env.temp_data["docname"] = docname
+        directive = AutodocDirective(
+            "autocfunction",
+            ["example.c::my_func"],
+            {},
+            None,
+            None,
+            None,
+            None,
+            sphinx_state,
+            sphinx_state.state_machine,
+        )
+        directive.run()
+
+    assert len(load_calls) == 1
+    assert len(get_module_cache(sphinx_state.env)) == 1
@@ -0,0 +1,96 @@
+"""
+Test reading the parsed clang comments
+"""
+
+import pytest
+from clang import cindex
+
+# The loader applies the clang patches
+from sphinx_c_autodoc import loader  # noqa: F401
+
+SOURCE = """\
+/**
+ * \\brief The brief.
+ *
+ * The discussion with \\p a, \\c code and <b>html</b>
+ * over two lines.
+ *
+ * \\note A note.
+ * \\param[in] b The b.
+ * \\param a The a.
+ * \\param missing Not a parameter.
+ * \\param c
+ * \\returns The sum.
+ */
+int documented(int a, int b, int c);
+
+/**
+ * Only a plain comment.
+ *
+ * With two paragraphs.
+ */
+int plain(void);
+
+int undocumented(void);
+"""
+
+
+@pytest.fixture
+def comments():
+    tu = cindex.TranslationUnit.from_source(
+        "source.c", unsaved_files=[("source.c", SOURCE)]
+    )
+    # The comments only point into the translation unit, so it must outlive them.
+    yield {c.spelling: c.getParsedComment() for c in tu.cursor.get_children()}
+
+
+def test_parts(comments):
+    """
+    The brief, discussion, parameters and return value of a comment are
+    separated.
+    """
+    parts = comments["documented"].get_parts()
+
+    assert parts.abstract.get_text() == " The brief."
+    assert [p.get_text() for p in parts.discussion] == [
+        " The discussion with a, code and <b>html</b> over two lines.",
+        " A note. ",
+    ]
+    assert [(n, p.get_text()) for n, p in parts.params] == [
+        ("a", " The a. "),
+        ("b", " The b. "),
+        ("missing", " Not a parameter. "),
+    ]
+    assert [p.get_text() for p in parts.returns] == [" The sum."]
+
+
+def test_first_paragraph_is_the_abstract(comments):
+    """
+    Without a brief command the first paragraph is the abstract.
+    """
+    parts = comments["plain"].get_parts()
+
+    assert parts.abstract.get_text() == " Only a plain comment."
+    assert [p.get_text() for p in parts.discussion] == [" With two paragraphs."]
+    assert parts.params == []
+    assert parts.returns == []
+
+
+def test_no_comment(comments):
+    """
+    A construct without a comment has no parts.
+    """
+    assert comments["undocumented"].get_parts() is None
+
+
+def test_matches_the_xml(comments):
+    """
+    The parts are the same ones clang provides in the XML of the comment.
+    """
+    comment = comments["documented"]
+    xml = comment.as_xml()
+
+    assert "<Abstract><Para> The brief.</Para></Abstract>" in xml
+    assert "<Name>a</Name>" in xml
+    assert "<Name>c</Name>" not in xml
+    assert "<Para> The sum.</Para>" in xml
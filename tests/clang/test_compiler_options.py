@@ -218,6 +218,68 @@ class TestCompilerFlags:
         message = f'Compilation database "{db_name}" not found.'
         assert message in warnings
 
+    def test_compilation_database_policy(self, sphinx_state, tmp_path):
+        """
+        The policy picks which entry is used for a file listed more than once.
+        """
+        undefined = dict(compile_commands[0], command="some_compiler other.c")
+        compilation_db = tmp_path / "compile_commands.json"
+        compilation_db.write_text(json.dumps([undefined, compile_commands[0]]))
+        sphinx_state.env.config.c_autodoc_compilation_database = str(compilation_db)
+        sphinx_state.env.config.c_autodoc_compilation_database_policy = "last"
+        directive = AutodocDirective(
+            "autocmodule",
+            ["compilation_flags_1.c"],
+            {"members": None},
+            None,
+            None,
+            None,
+            None,
+            sphinx_state,
+            sphinx_state.state_machine,
+        )
+        output = self.get_directive_output(directive)
+        assert output == dedent(self.define)
+
+    @pytest.mark.parametrize(
+        "setting, roots, noted",
+        [
+            ("all", ["c_source"], True),
+            ("roots", ["c_source"], False),
+            ("roots", ["c_source", "include"], True),
+            ("none", ["c_source", "include"], False),
+            (None, ["c_source"], False),
+            (None, ["c_source", "include"], True),
+        ],
+    )
+    def test_include_dependencies(self, sphinx_state, setting, roots, noted):
+        """
+        The included headers are dependencies of the document, by default
+        only those in the ``c_autodoc_roots``.
+        """
+        env = sphinx_state.env
+        env.config.c_autodoc_compilation_args = [f"-I{ROOT_DIR}/include"]
+        if setting is not None:
+            env.config.c_autodoc_include_dependencies = setting
+        env.config.c_autodoc_roots = roots
+        directive = AutodocDirective(
+            "autocmodule",
+            ["compilation_flags_2.c"],
+            {"members": None},
+            None,
+            None,
+            None,
+            None,
+            sphinx_state,
+            sphinx_state.state_machine,
+        )
+        output = self.get_directive_output(directive)
+        assert output == dedent(self.include)
+
+        dependencies = {str(d) for d in env.dependencies[env.docname]}
+        header = os.path.join(ROOT_DIR, "include", "some_include.h")
+        assert (header in dependencies) == noted
+
     @staticmethod
     def get_directive_output(directive):
         """
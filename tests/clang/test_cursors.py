@@ -0,0 +1,108 @@
+"""
+Test gathering the cursors of a file in a single pass
+"""
+
+import os
+
+from clang import cindex
+
+# The loader applies the clang patches
+from sphinx_c_autodoc import loader  # noqa: F401
+from sphinx_c_autodoc.clang.cursors import collect_children
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "c_source")
+
+SKIP_KINDS = (
+    cindex.CursorKind.MACRO_INSTANTIATION,
+    cindex.CursorKind.INCLUSION_DIRECTIVE,
+)
+
+
+def parse(filename):
+    return cindex.TranslationUnit.from_source(
+        os.path.join(SOURCE_DIR, filename),
+        options=cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+    )
+
+
+def test_matches_the_bindings():
+    """
+    The gathered children are the same as filtering the children from the
+    bindings.
+    """
+    tu = parse("example.c")
+    expected = [
+        c
+        for c in tu.cursor.get_children()
+        if c.location.isFromMainFile() and c.kind not in SKIP_KINDS
+    ]
+
+    records = collect_children(tu.cursor, skip_kinds=SKIP_KINDS, main_file_only=True)
+
+    assert [r.cursor for r in records] == expected
+    for record, cursor in zip(records, expected, strict=True):
+        assert record.kind == cursor.kind
+        assert record.spelling == cursor.spelling
+        assert record.type_spelling == cursor.type.spelling
+        assert record.start == cursor.extent.start.offset
+
+
+def test_first_child_of_nested_kinds():
+    """
+    Only the kinds which may shadow a nested construct get their first child.
+    """
+    tu = parse("example.c")
+    records = collect_children(tu.cursor, skip_kinds=SKIP_KINDS, main_file_only=True)
+
+    for record in records:
+        children = list(record.cursor.get_children())
+        if record.kind == cindex.CursorKind.TYPEDEF_DECL and children:
+            assert record.first_child == children[0]
+        elif record.kind == cindex.CursorKind.FUNCTION_DECL:
+            assert record.first_child is None
+
+
+def test_all_files():
+    """
+    Without limiting to the main file, cursors from the includes are gathered.
+    """
+    tu = parse("example.c")
+    records = collect_children(tu.cursor)
+
+    assert len(records) == len(list(tu.cursor.get_children()))
+
+
+def test_main_file_only_with_macros(tmp_path):
+    """
+    Constructs declared through macros are judged the same way libclang does,
+    even though their locations aren't plain file locations.
+    """
+    header = tmp_path / "declare.h"
+    header.write_text(
+        "#define DECLARE(name) int name(void);\n"
+        "DECLARE(header_function)\n"
+        "int plain_header_function(void);\n"
+    )
+    source = tmp_path / "source.c"
+    source.write_text(
+        '#include "declare.h"\n'
+        "#define MAIN_DECLARE(name) int name(int a);\n"
+        "DECLARE(main_function)\n"
+        "MAIN_DECLARE(other_main_function)\n"
+        "int plain_main_function(void);\n"
+    )
+    tu = cindex.TranslationUnit.from_source(
+        str(source),
+        options=cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+    )
+
+    expected = [
+        c.spelling
+        for c in tu.cursor.get_children()
+        if c.location.isFromMainFile() and c.kind not in SKIP_KINDS
+    ]
+    records = collect_children(tu.cursor, skip_kinds=SKIP_KINDS, main_file_only=True)
+
+    assert [r.spelling for r in records] == expected
+    assert "plain_main_function" in expected
+    assert "plain_header_function" not in expected
@@ -0,0 +1,131 @@
+"""
+Test scanning the source for macro definitions
+"""
+
+import pytest
+from clang import cindex
+
+# The loader applies the clang patches
+from sphinx_c_autodoc import loader  # noqa: F401
+from sphinx_c_autodoc.clang.macros import scan_macros
+
+SOURCE = """\
+/* #define IN_A_COMMENT 1 */
+// #define IN_A_LINE_COMMENT 1
+const char *string = "\\
+#define IN_A_STRING 1";
+#define PLAIN 1
+  #  define INDENTED 2 /**< Trailing comment */
+#define FUNCTION_LIKE(a, b) ((a) + \\
+    (b))
+#define NOT_FUNCTION_LIKE (1)
+#if 0
+#define IN_IF_0 1
+#elif 1
+#define IN_ELIF_1 1
+#else
+#define IN_TAKEN_ELSE 1
+#endif
+#if 0
+#define ALSO_IN_IF_0 1
+#else
+#define IN_ELSE 1
+#endif
+#ifdef UNKNOWN
+#define IN_IFDEF 1
+#endif
+#define LAST
+#if 0 // disabled
+#define IN_COMMENTED_IF_0 1
+#endif
+#if 0 /* disabled */
+#define IN_BLOCK_COMMENTED_IF_0 1
+#elif 1 /* enabled */
+#define IN_COMMENTED_ELIF_1 1
+#endif
+#if 0 /* disabled
+         for a while */
+#define IN_MULTILINE_COMMENTED_IF_0 1
+#endif
+"""
+
+
+@pytest.fixture
+def macros():
+    tu = cindex.TranslationUnit.from_source(
+        "source.c", unsaved_files=[("source.c", SOURCE)]
+    )
+    # The macros only point into the translation unit, so it must outlive them.
+    yield {r.spelling: r.cursor for r in scan_macros(tu)}
+
+
+def test_names(macros):
+    """
+    Only the macros which are defined are found, skipping those in comments,
+    strings and the branches which aren't taken. Macros in ``#ifdef`` blocks
+    are kept, as the scan doesn't know what is defined.
+    """
+    assert list(macros) == [
+        "PLAIN",
+        "INDENTED",
+        "FUNCTION_LIKE",
+        "NOT_FUNCTION_LIKE",
+        "IN_ELIF_1",
+        "IN_ELSE",
+        "IN_IFDEF",
+        "LAST",
+        "IN_COMMENTED_ELIF_1",
+    ]
+
+
+def test_function_like(macros):
+    """
+    Only macros with parameters immediately after the name are function like.
+    """
+    assert macros["FUNCTION_LIKE"].is_macro_function_like()
+    assert not macros["NOT_FUNCTION_LIKE"].is_macro_function_like()
+    assert not macros["PLAIN"].is_macro_function_like()
+
+
+@pytest.mark.parametrize(
+    "name, start, end",
+    [
+        ("PLAIN", (5, 9), (5, 16)),
+        ("INDENTED", (6, 13), (6, 23)),
+        ("FUNCTION_LIKE", (7, 9), (8, 9)),
+        ("LAST", (25, 9), (25, 13)),
+    ],
+)
+def test_extent(macros, name, start, end):
+    """
+    The extents are the same as the ones from the detailed processing record,
+    the name up to the last token.
+    """
+    extent = macros[name].extent
+    assert (extent.start.line, extent.start.column) == start
+    assert (extent.end.line, extent.end.column) == end
+
+
+def test_matches_the_processing_record():
+    """
+    The scanned macros are the ones, with the same extents, that the detailed
+    processing record has.
+    """
+    tu = cindex.TranslationUnit.from_source(
+        "source.c",
+        unsaved_files=[("source.c", SOURCE)],
+        options=cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+    )
+    expected = [
+        (c.spelling, c.extent.start.offset, c.extent.end.offset)
+        for c in tu.cursor.get_children()
+        if c.kind == cindex.CursorKind.MACRO_DEFINITION and c.location.isFromMainFile()
+    ]
+
+    scanned = [
+        (r.spelling, r.cursor.extent.start.offset, r.cursor.extent.end.offset)
+        for r in scan_macros(tu)
+        if r.spelling != "IN_IFDEF"
+    ]
+
+    assert scanned == expected
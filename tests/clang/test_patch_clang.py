@@ -2,9 +2,15 @@
 Focus on testing the patching of clang
 """
 
-from sphinx_c_autodoc.clang.patches import patch_clang
+import os
+
+import pytest
 from clang import cindex
 
+from sphinx_c_autodoc.clang.patches import TokenBuffer, patch_clang
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "c_source")
+
 
 def test_re_patch():
     """
@@ -21,3 +27,41 @@ def test_re_patch():
         cindex_function_list = cindex.functionList
     functions = tuple(f[0] for f in cindex_function_list)
     assert len(functions) == len(set(functions))
+
+
+@pytest.mark.parametrize("filename", ["example.c", "file_2.c", "empty_file.c"])
+def test_token_buffer_matches_bindings(filename):
+    """
+    The token buffer provides the same tokens as the clang python bindings.
+    """
+    tu = cindex.TranslationUnit.from_source(os.path.join(SOURCE_DIR, filename))
+    extent = tu.cursor.extent
+    expected = [
+        (t.kind.value, t.spelling, t.extent.start.offset, t.extent.end.offset)
+        for t in cindex.TokenGroup.get_tokens(tu, extent=extent)
+    ]
+
+    with TokenBuffer(tu, extent) as buffer:
+        tokens = [
+            (kind, spelling, offset, offset + length)
+            for kind, spelling, offset, length in zip(
+                buffer.kinds, buffer.spellings(), buffer.offsets, buffer.lengths
+            )
+        ]
+        assert len(buffer) == len(expected)
+
+    assert tokens == expected
+
+
+def test_token_buffer_disposed_once():
+    """
+    Disposing of a token buffer more than once only frees the clang tokens the
+    first time, and the released views can no longer be read.
+    """
+    tu = cindex.TranslationUnit.from_source(os.path.join(SOURCE_DIR, "example.c"))
+    buffer = TokenBuffer(tu, tu.cursor.extent)
+    buffer.dispose()
+    buffer.dispose()
+
+    with pytest.raises(ValueError):
+        buffer.kinds[0]
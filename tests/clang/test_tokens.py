@@ -0,0 +1,60 @@
+"""
+Test the token index of a translation unit's main file
+"""
+
+import os
+
+import pytest
+from clang import cindex
+
+# The loader applies the clang patches
+from sphinx_c_autodoc import loader  # noqa: F401
+from sphinx_c_autodoc.clang.tokens import TokenIndex, get_token_index
+
+SCRIPT_DIR = os.path.dirname(__file__)
+SOURCE_DIR = os.path.join(SCRIPT_DIR, "..", "assets", "c_source")
+
+
+def parse(filename):
+    return cindex.TranslationUnit.from_source(
+        filename,
+        options=cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+    )
+
+
+@pytest.mark.parametrize("filename", ["example.c", "file_2.c", "variables.c"])
+def test_matches_tokenizing_each_extent(filename):
+    """
+    Looking up the tokens of a construct gives the same tokens as having
+    libclang tokenize the construct on its own.
+    """
+    tu = parse(os.path.join(SOURCE_DIR, filename))
+    token_index = TokenIndex(tu)
+
+    cursors = [c for c in tu.cursor.walk_preorder() if c.location.isFromMainFile()]
+    assert cursors
+
+    for cursor in cursors:
+        expected = [(t.kind, t.spelling) for t in cursor.get_tokens()]
+        tokens = token_index.get_extent_tokens(cursor.extent)
+        assert [(t.kind, t.spelling) for t in tokens] == expected
+
+
+def test_empty_file():
+    """
+    A file without any tokens has an empty index.
+    """
+    tu = parse(os.path.join(SOURCE_DIR, "empty_file.c"))
+    token_index = TokenIndex(tu)
+
+    assert len(token_index) == 0
+    assert token_index.get_tokens(0, 10) == []
+
+
+def test_index_is_created_once():
+    """
+    A translation unit is only tokenized once.
+    """
+    tu = parse(os.path.join(SOURCE_DIR, "example.c"))
+
+    assert get_token_index(tu) is get_token_index(tu)
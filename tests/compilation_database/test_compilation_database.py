@@ -0,0 +1,193 @@
+"""
+Test reading and indexing compilation databases
+"""
+
+import io
+import json
+import os
+
+import pytest
+from clang import cindex
+
+from sphinx_c_autodoc.compilation_database import (
+    CompilationDatabase,
+    get_compilation_database,
+    iter_entries,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    (tmp_path / "flags.rsp").write_text('-DFROM_RSP "-Ispaced dir"\n')
+    entries = [
+        {
+            "directory": str(tmp_path),
+            "command": "cc -DA=1 -I inc 'quoted arg' -o a.o -c a.c",
+            "file": "a.c",
+        },
+        {
+            "directory": str(tmp_path),
+            "arguments": ["cc", "-DFIRST", "-c", "b.c"],
+            "file": "b.c",
+        },
+        {
+            "directory": str(tmp_path / "sub"),
+            "arguments": ["cc", "-DLAST", "../b.c"],
+            "file": "../b.c",
+        },
+        {
+            "directory": str(tmp_path),
+            "command": "ccache gcc -DC c.c",
+            "file": str(tmp_path / "." / "c.c"),
+        },
+        {
+            "directory": str(tmp_path),
+            "command": "cc @flags.rsp d.c",
+            "file": "d.c",
+        },
+    ]
+    filename = tmp_path / "compile_commands.json"
+    filename.write_text(json.dumps(entries))
+    return str(filename)
+
+
+def libclang_args(database, filename):
+    """
+    The arguments of the first command libclang provides for `filename`.
+    """
+    directory = os.path.dirname(database)
+    commands = cindex.CompilationDatabase.fromDirectory(directory)
+    command = commands.getCompileCommands(filename)[0]
+    args = list(command.arguments)[1:-1]
+    args.append(f"-working-directory={command.directory}")
+    return args
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("a.c", ["-DA=1", "-I", "inc", "quoted arg", "-o", "a.o", "-c"]),
+        ("b.c", ["-DFIRST", "-c"]),
+        ("c.c", ["-DC"]),
+        ("d.c", ["-DFROM_RSP", "-Ispaced dir"]),
+    ],
+)
+def test_args(database, filename, expected):
+    """
+    The arguments match the ones libclang provides.
+    """
+    directory = os.path.dirname(database)
+    fullname = os.path.join(directory, filename)
+
+    args = CompilationDatabase(database).get_args(fullname)
+
+    assert args == [*expected, f"-working-directory={directory}"]
+    assert args == libclang_args(database, fullname)
+
+
+def test_last_entry_policy(database):
+    """
+    The ``last`` policy uses the last of several commands for a file, rather
+    than the first one libclang uses.
+    """
+    directory = os.path.dirname(database)
+    args = CompilationDatabase(database).get_args(
+        os.path.join(directory, "b.c"), "last"
+    )
+
+    assert args == ["-DLAST", f"-working-directory={os.path.join(directory, 'sub')}"]
+
+
+def test_args_can_be_added_to(database):
+    """
+    The arguments returned can be changed without changing the database.
+    """
+    filename = os.path.join(os.path.dirname(database), "b.c")
+    compilation_database = CompilationDatabase(database)
+
+    compilation_database.get_args(filename).append("-DEXTRA")
+
+    assert "-DEXTRA" not in compilation_database.get_args(filename)
+
+
+def test_files_not_in_the_database_are_inferred(database):
+    """
+    Like libclang, headers get the commands of similar files in the database.
+    """
+    header = os.path.join(os.path.dirname(database), "inc", "a.h")
+
+    args = CompilationDatabase(database).get_args(header)
+
+    assert "-DA=1" in args
+    assert args == libclang_args(database, header)
+
+
+def test_other_names_are_read(database, tmp_path):
+    """
+    A database which isn't named ``compile_commands.json`` is read itself,
+    libclang would read the ``compile_commands.json`` next to it instead.
+    """
+    other = tmp_path / "commands.json"
+    other.write_text(
+        json.dumps(
+            [{"directory": str(tmp_path), "command": "cc -DOTHER a.c", "file": "a.c"}]
+        )
+    )
+
+    args = CompilationDatabase(str(other)).get_args(str(tmp_path / "a.c"))
+
+    assert args == ["-DOTHER", f"-working-directory={tmp_path}"]
+
+
+def test_nothing_inferred_for_other_names(tmp_path):
+    """
+    libclang only infers the commands of files from databases named
+    ``compile_commands.json``.
+    """
+    database = tmp_path / "commands.json"
+    database.write_text("[]")
+
+    assert CompilationDatabase(str(database)).get_args(str(tmp_path / "a.c")) == []
+
+
+def test_database_is_read_once(database):
+    """
+    Every file uses the same database, rather than reading it again.
+    """
+    assert get_compilation_database(database) is get_compilation_database(database)
+
+
+def test_changed_database_is_read_again(database, tmp_path):
+    """
+    Changing the database, e.g. by building the code again, is seen.
+    """
+    original = get_compilation_database(database)
+
+    with open(database, "w") as f:
+        json.dump([], f)
+
+    changed = get_compilation_database(database)
+    assert changed is not original
+    assert changed.get_args(str(tmp_path / "a.c")) == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1024])
+def test_iter_entries_in_chunks(database, chunk_size):
+    """
+    The entries are the same however the text is split up when read.
+    """
+    with open(database) as f:
+        text = f.read()
+
+    entries = list(iter_entries(io.StringIO(text), chunk_size))
+
+    assert entries == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ["", "{}", '[{"file": "a.c"}', "[1,"])
+def test_iter_entries_not_an_array(text):
+    """
+    Text which isn't a complete array of entries is an error.
+    """
+    with pytest.raises(ValueError, match="JSON array"):
+        list(iter_entries(io.StringIO(text), 2))
@@ -3,6 +3,7 @@ Common pytest configuration for the test suites
 """
 
 import os
+import shutil
 
 import pytest
 import sphinx
@@ -11,6 +12,7 @@ from docutils.parsers.rst.states import RSTStateMachine, Struct, Inliner, state_
 from docutils.parsers.rst.languages import en
 from docutils.statemachine import StringList
 from docutils.utils import new_document
+from sphinx.cmd.build import main
 from sphinx.util.docutils import sphinx_domains
 
 if sphinx.version_info < (7, 2):
@@ -20,23 +22,118 @@ else:
 
 pytest_plugins = "sphinx.testing.fixtures"
 
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "assets"))
+
+
+class SphinxProject:
+    """
+    A copy of the test assets which is built with the sphinx command line, the
+    same way a user would build it.
+
+    Attributes:
+        source_dir (pathlib.Path): The copy of the assets.
+        out_dir (pathlib.Path): The directory builds are written to by default.
+    """
+
+    def __init__(self, source_dir, out_dir):
+        self.source_dir = source_dir
+        self.out_dir = out_dir
+
+    def build(self, *options, out_dir=None):
+        """
+        Build the project, with every document and the viewcode index as the
+        root document.
+
+        Args:
+            options (str): Additional command line options, e.g. ``-a``.
+            out_dir (pathlib.Path): The directory to build into, defaults to
+                :attr:`out_dir`.
+
+        Returns:
+            int: The exit status of the build.
+        """
+        out_dir = self.out_dir if out_dir is None else out_dir
+        return main(
+            [
+                *options,
+                "-D",
+                "exclude_patterns=[]",
+                "-D",
+                "master_doc=viewcode_index",
+                str(self.source_dir),
+                str(out_dir),
+            ]
+        )
+
+    def listing(self, name, out_dir=None):
+        """
+        Get the viewcode listing page of a C file.
+
+        Args:
+            name (str): The name of the C file, e.g. ``example.c``.
+            out_dir (pathlib.Path): The directory the project was built into,
+                defaults to :attr:`out_dir`.
+
+        Returns:
+            pathlib.Path: The listing page.
+        """
+        out_dir = self.out_dir if out_dir is None else out_dir
+        return out_dir / "_modules" / f"{name}.html"
+
+    @staticmethod
+    def age(paths):
+        """
+        Set the modification time of `paths` to the epoch, so that a later
+        build writing them again can be seen.
+
+        Args:
+            paths (Iterable[pathlib.Path]): The files to age.
+        """
+        for path in paths:
+            os.utime(path, ns=(0, 0))
+
 
 @pytest.fixture()
-def local_app(make_app):
+def local_app(make_app, tmp_path):
     """
     Creates a sphinx app specific to this environment.
 
-    The main thing that is set up is the path to the conf.py file.
+    The main thing that is set up is the path to the conf.py file. The build
+    output goes in a temporary directory, so that nothing from a previous run,
+    such as the parsed modules, is reused.
 
     yields:
         SphinxApp: The sphinx app.
 
     """
-    # Provide sphinx with the path to the documentation directory.
-    conf_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "assets"))
-
     # Note the sphinx fixture expects a :class:`Path` object, not a string
-    yield make_app(srcdir=Path(conf_dir))
+    yield make_app(srcdir=Path(ASSETS_DIR), builddir=Path(tmp_path / "_build"))
+
+
+@pytest.fixture()
+def sphinx_project(tmp_path):
+    """
+    Copies the test assets so that a test can modify, and build, them.
+
+    Yields:
+        SphinxProject: The copied project, building into ``tmp_path / "out"``.
+    """
+    source_dir = tmp_path / "assets"
+    shutil.copytree(ASSETS_DIR, source_dir)
+    yield SphinxProject(source_dir, tmp_path / "out")
+
+
+@pytest.fixture()
+def built_sphinx_project(sphinx_project):
+    """
+    The copied test assets after a full build, for tests which build the
+    project again.
+
+    Yields:
+        SphinxProject: The built project.
+    """
+    sphinx_project.build("-a", "-E")
+    yield sphinx_project
 
 
 @pytest.fixture()
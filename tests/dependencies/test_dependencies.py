@@ -0,0 +1,226 @@
+"""
+Test reading again only the documents whose documented constructs changed
+"""
+
+import os
+import pickle
+from pathlib import Path
+
+import pytest
+
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.dependencies import (
+    ConstructKey,
+    Fingerprints,
+    find_changed_constructs,
+    fingerprint,
+)
+
+HEADER = """\
+/**
+ * The header comment.
+ */
+
+/**
+ * The first function.
+ */
+int first(int a);
+
+/**
+ * The second function.
+ */
+int second(int b);
+"""
+
+DOCUMENTS = {
+    "index": "Index\n=====\n\n.. toctree::\n\n   first\n   second\n   module\n",
+    "first": "First\n=====\n\n.. autocfunction:: lib.h::first\n",
+    "second": "Second\n======\n\n.. autocfunction:: lib.h::second\n",
+    "module": "Module\n======\n\n.. autocmodule:: lib.h\n   :members:\n",
+}
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "conf.py").write_text(
+        'extensions = ["sphinx_c_autodoc"]\n'
+        'c_autodoc_roots = ["src"]\n'
+        "c_autodoc_construct_dependencies = True\n"
+    )
+    for docname, text in DOCUMENTS.items():
+        (tmp_path / f"{docname}.rst").write_text(text)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "lib.h").write_text(HEADER)
+    return tmp_path
+
+
+def read_documents(make_app, project):
+    """
+    Build `project` and get the documents which were read.
+    """
+    app = make_app(srcdir=Path(project))
+    read = []
+    app.connect(
+        "env-before-read-docs", lambda app, env, docnames: read.extend(docnames)
+    )
+    app.build()
+    return sorted(read)
+
+
+def update_header(project, text):
+    header = project / "src" / "lib.h"
+    header.write_text(text)
+
+    # Make sure the change is seen, no matter the resolution of the timestamps
+    stat = header.stat()
+    os.utime(header, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_only_documents_of_changed_constructs_are_read(make_app, project):
+    """
+    Changing a construct reads the documents which document it, along with
+    the documents of the whole file, but not the other documents of the file.
+    """
+    assert read_documents(make_app, project) == ["first", "index", "module", "second"]
+
+    update_header(project, HEADER.replace("The first function.", "Changed."))
+
+    assert read_documents(make_app, project) == ["first", "module"]
+    html = (project / "_build" / "html" / "first.html").read_text()
+    assert "Changed." in html
+
+
+def test_unchanged_constructs_read_nothing(make_app, project):
+    """
+    Changes to a file which don't change any construct read nothing.
+    """
+    read_documents(make_app, project)
+
+    # Moving the constructs around within the file doesn't change them
+    update_header(project, "\n\n" + HEADER)
+
+    assert read_documents(make_app, project) == []
+
+
+def test_changed_files_refresh_their_listings(make_app, project):
+    """
+    A C file which changes without any of its constructs changing reads
+    nothing, but its viewcode listing still shows the new file. Loading it to
+    compare the constructs isn't announced as documents loading it.
+    """
+    conf = project / "conf.py"
+    conf.write_text(
+        conf.read_text().replace(
+            '"sphinx_c_autodoc"', '"sphinx_c_autodoc", "sphinx_c_autodoc.viewcode"'
+        )
+    )
+    read_documents(make_app, project)
+    listing = project / "_build" / "html" / "_modules" / "lib.h.html"
+    contents = listing.read_text()
+
+    def build():
+        app = make_app(srcdir=Path(project))
+        events = {"c-autodoc-module-loaded": [], "c-autodoc-module-changed": []}
+        for event, modnames in events.items():
+            app.connect(
+                event, lambda app, modname, *args, m=modnames: m.append(modname)
+            )
+        app.build()
+        return events
+
+    update_header(project, HEADER.replace("*/\n\n", "*/\n\n\n"))
+
+    assert build() == {
+        "c-autodoc-module-loaded": [],
+        "c-autodoc-module-changed": ["lib.h"],
+    }
+    assert listing.read_text() != contents
+    assert "\n\n\n" in listing.read_text().replace("</span>", "")
+
+    # The new stamps were saved, so the file isn't loaded again
+    assert build() == {"c-autodoc-module-loaded": [], "c-autodoc-module-changed": []}
+
+
+def test_removed_construct_is_outdated(make_app, project):
+    """
+    Documents of a construct which is no longer in the file are read again.
+    """
+    read_documents(make_app, project)
+
+    update_header(project, HEADER[: HEADER.index("/**\n * The second")])
+
+    app = make_app(srcdir=Path(project))
+    outdated = find_changed_constructs(app, app.env, set(), set(), set())
+    assert outdated == ["module", "second"]
+
+
+def test_file_dependencies_without_the_option(make_app, project):
+    """
+    Without ``c_autodoc_construct_dependencies`` every document of a changed
+    file is read again.
+    """
+    (project / "conf.py").write_text(
+        'extensions = ["sphinx_c_autodoc"]\nc_autodoc_roots = ["src"]\n'
+    )
+    read_documents(make_app, project)
+
+    update_header(project, HEADER.replace("The first function.", "Changed."))
+
+    assert read_documents(make_app, project) == ["first", "module", "second"]
+
+
+def test_fingerprint_ignores_anonymous_names():
+    """
+    The names of anonymous constructs differ between parses.
+    """
+    source = "/** A struct */\nstruct outer {\n  struct { int a; } inner;\n};\n"
+    first = loader.load("file.c", source)
+    second = loader.load("file.c", source.replace("int a;", "int a; "))
+
+    assert fingerprint(first, members=True) == fingerprint(second, members=True)
+
+
+def test_fingerprint_of_members():
+    """
+    The members only count towards the fingerprint of constructs documented
+    with their members.
+    """
+    module = loader.load("file.c", "/** A */\nint a;\n")
+    changed = loader.load("file.c", "/** A */\nint a;\n/** B */\nint b;\n")
+
+    assert fingerprint(module, members=False) == fingerprint(changed, members=False)
+    assert fingerprint(module, members=True) != fingerprint(changed, members=True)
+
+
+def test_fingerprints_are_merged_and_purged():
+    """
+    The fingerprints of parallel reads are merged into the environment, and
+    dropped with their documents.
+    """
+    key = ConstructKey("lib.h", ("first",), False)
+    fingerprints = Fingerprints()
+    fingerprints.add("a", key, "old")
+    other = Fingerprints()
+    other.add("a", key, "new")
+    other.add("b", key, "new")
+    other.stamp("lib.h", [])
+
+    fingerprints.merge(["a"], other)
+    assert fingerprints.documents == {"a": {key: "new"}}
+    assert fingerprints.stamps == other.stamps
+
+    fingerprints.purge("a")
+    assert fingerprints.documents == {}
+
+
+def test_stamped_files_are_not_pickled():
+    """
+    Which files have been checked only lasts a build, their stamps are kept.
+    """
+    fingerprints = Fingerprints()
+    fingerprints.stamp("lib.h", [])
+
+    unpickled = pickle.loads(pickle.dumps(fingerprints))
+
+    assert unpickled.stamps == fingerprints.stamps
+    assert unpickled.stamped == set()
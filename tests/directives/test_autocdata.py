@@ -47,6 +47,10 @@ class TestAutoCData:
         extern unknown_type *unknown_extern_type_var
         Unknown extern type"""
 
+    unknown_type_table = """\
+        unknown_type unknown_type_table[]
+        A table with an unknown type, the initializer doesn't affect the type."""
+
     doc_data = [
         ("variables.c::file_level_variable", file_level_variable),
         ("example.c::inline_struct_variable", inline_struct_variable),
@@ -60,6 +64,7 @@ class TestAutoCData:
             ),
         ),
         ("variables.c::unknown_extern_type_var", unknown_extern_file_variable),
+        ("variables.c::unknown_type_table", unknown_type_table),
     ]
 
     @pytest.mark.parametrize("variable, expected_doc", doc_data)
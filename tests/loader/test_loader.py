@@ -2,11 +2,17 @@
 Test the loading of C files into the needed pieces.
 """
 
+import gc
 import json
 import os
+import pickle
+from textwrap import dedent
 import pytest
 
+from clang import cindex
+
 from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.clang import tokens
 
 SCRIPT_DIR = os.path.dirname(__file__)
 testdata = [
@@ -98,3 +104,248 @@ def test_basic_file_loading_grabbed_twice():
     # second call getting the cached version of some things.
     ast = str(doc_item)
     assert json.loads(ast) == expected
+
+
+def test_loaded_file_is_detached_from_libclang():
+    """
+    The loaded tree shouldn't keep any libclang data alive, only plain python
+    objects, so that it can be pickled and the translation unit disposed of.
+    """
+    filename, expected = testdata[1]
+    fullname = os.path.join(SCRIPT_DIR, "assets", filename)
+    with open(fullname) as f:
+        contents = f.read()
+    doc_item = loader.load(fullname, contents)
+
+    gc.collect()
+    live_clang_objects = [
+        o
+        for o in gc.get_objects()
+        if isinstance(o, (cindex.TranslationUnit, cindex.Cursor))
+    ]
+    assert live_clang_objects == []
+
+    unpickled = pickle.loads(pickle.dumps(doc_item))
+    assert json.loads(str(unpickled)) == expected
+
+    struct = unpickled.children["unknown_member"]
+    assert struct.node is None
+    assert struct.children["foo"].node is None
+
+
+def test_leaf_constructs_are_compact():
+    """
+    Leaf constructs share the same empty children and carry no instance
+    dictionary.
+    """
+    fullname = os.path.join(SCRIPT_DIR, "assets", "typedef.c")
+    with open(fullname) as f:
+        contents = f.read()
+    doc_item = loader.load(fullname, contents)
+
+    function = doc_item.children["my_func"]
+    member = doc_item.children["unknown_member"].children["foo"]
+    for leaf in (function, member):
+        assert not hasattr(leaf, "__dict__")
+        assert leaf.children is loader.NO_CHILDREN
+
+
+def nested_header(depth):
+    """
+    Create a header with `depth` levels of alternately nested anonymous
+    structures and unions.
+    """
+    lines = []
+    for level in range(depth):
+        kind = "struct" if level % 2 == 0 else "union"
+        lines.append(f"{kind} {{")
+        lines.append(f"int leaf_{level};")
+    for level in reversed(range(depth)):
+        lines.append(f"}} level_{level};" if level else "} top_level;")
+    return "/** A nested header */\n" + "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("depth", [8, 64])
+def test_to_ast_scales_linearly(depth, tmp_path, monkeypatch):
+    """
+    Deeply nested constructs are exported by visiting each construct once,
+    rather than re-serializing every subtree for each level it is nested in.
+    """
+    fullname = tmp_path / "nested.h"
+    contents = nested_header(depth)
+    fullname.write_text(contents)
+    doc_item = loader.load(str(fullname), contents)
+
+    visits = []
+    original_to_ast = loader.DocumentedObject.to_ast
+
+    def counting_to_ast(self):
+        visits.append(self.name)
+        return original_to_ast(self)
+
+    monkeypatch.setattr(loader.DocumentedObject, "to_ast", counting_to_ast)
+    ast = doc_item.to_ast()
+
+    def count_constructs(construct):
+        return 1 + sum(count_constructs(c) for c in construct["children"])
+
+    assert len(visits) == count_constructs(ast)
+
+    # Each level contributes the nested construct and the leaf member
+    assert len(visits) == 1 + 2 * depth
+    assert json.loads(str(doc_item)) == ast
+
+
+@pytest.mark.parametrize("declarations", [1, 5000])
+def test_file_comment_only_tokenizes_the_start(declarations, tmp_path, monkeypatch):
+    """
+    Finding the file comment only looks at the start of the file, so it costs
+    the same no matter how large the file is.
+    """
+    fullname = tmp_path / "large.h"
+    functions = "".join(f"int function_{i}(int a);\n" for i in range(declarations))
+    contents = "/*\n * The file comment\n */\n\n" + functions
+    fullname.write_text(contents)
+
+    tokenized = []
+    original_tokenize = tokens.tokenize
+
+    def counting_tokenize(tu, extent):
+        result = original_tokenize(tu, extent)
+        tokenized.append(len(result))
+        return result
+
+    monkeypatch.setattr(tokens, "tokenize", counting_tokenize)
+    tu = cindex.TranslationUnit.from_source(str(fullname))
+    first_child = next(tu.cursor.get_children())
+
+    assert loader.get_file_comment(tu.cursor, first_child) == "The file comment"
+    assert tokenized == [1]
+
+
+def test_variable_type_ignores_the_initializer(tmp_path, monkeypatch):
+    """
+    Only the tokens up to the variable name are looked at to find the type,
+    large tables don't need to have all of their entries looked at.
+    """
+    fullname = tmp_path / "table.c"
+    entries = ", ".join(f"ENTRY_{i}" for i in range(1000))
+    contents = f"unknown_type table[] = {{{entries}}};\n"
+    fullname.write_text(contents)
+
+    tu = cindex.TranslationUnit.from_source(str(fullname))
+    cursor = next(tu.cursor.get_children())
+    variable = loader.object_from_cursor(cursor)
+
+    looked_at = []
+    original_getitem = tokens.TokenIndex.__getitem__
+
+    def counting_getitem(self, index):
+        looked_at.append(index)
+        return original_getitem(self, index)
+
+    monkeypatch.setattr(tokens.TokenIndex, "__getitem__", counting_getitem)
+
+    assert variable._find_declaration_type().strip() == "unknown_type"
+    assert len(looked_at) == 2
+
+
+@pytest.mark.parametrize("filename, expected", testdata)
+def test_skipping_function_bodies(filename, expected):
+    """
+    Skipping the function bodies still covers the lines of the body.
+    """
+    fullname = os.path.join(SCRIPT_DIR, "assets", filename)
+    with open(fullname) as f:
+        contents = f.read()
+    doc_item = loader.load(
+        fullname, contents, parse_options=["skip_function_bodies", "keep_going"]
+    )
+    assert json.loads(str(doc_item)) == expected
+
+
+def test_function_bodies_parsed_by_default():
+    """
+    Without ``skip_function_bodies`` the lines of a function come from
+    libclang, even when its braces only balance across ``#if`` branches.
+    """
+    contents = dedent(
+        """\
+        int function(int a)
+        {
+        #if UNKNOWN
+            if (a) {
+        #else
+            if (!a) {
+        #endif
+                a++;
+            }
+            return a;
+        }
+        """
+    )
+    doc_item = loader.load("unbalanced.c", contents)
+
+    assert doc_item.children["function"].line_range() == (1, 11)
+
+
+def test_unknown_parse_option():
+    """
+    Misspelt parse options are an error, rather than being ignored.
+    """
+    with pytest.raises(ValueError, match="not_an_option"):
+        loader.get_parse_options(["incomplete", "not_an_option"])
+
+
+def test_index_is_shared():
+    """
+    Every file is parsed with the same libclang index.
+    """
+    assert loader.get_index() is loader.get_index()
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        (b"  /* { */ {\n '}' \"}\" // }\n { } }  x", 32),
+        (b"{ int a; }", 10),
+        (b"; { }", None),
+        (b"{ { }", None),
+    ],
+)
+def test_find_block_end(source, expected):
+    """
+    The end of a brace block skips the braces in comments, strings and
+    characters. It's ``None`` without a closed block at the start.
+    """
+    assert loader.find_block_end(source, 0) == expected
+
+
+def test_scanned_macros_match_the_processing_record():
+    """
+    Scanning for the macros documents them the same as the detailed processing
+    record.
+    """
+    fullname = os.path.join(SCRIPT_DIR, "..", "assets", "c_source", "example.c")
+    with open(fullname) as f:
+        contents = f.read()
+
+    def macros(parse_options):
+        doc_item = loader.load(fullname, contents, parse_options=parse_options)
+        return [
+            (name, c.get_doc(), c.declaration, c.line_range())
+            for name, c in doc_item.children.items()
+            if c.type_ == "macro"
+        ]
+
+    expected = macros([])
+    assert expected
+    assert macros(["scan_macros"]) == expected
+
+
+def test_scanning_macros_drops_the_processing_record():
+    """
+    Scanning for macros parses without the slow detailed processing record.
+    """
+    options = loader.get_parse_options(["scan_macros"])
+    assert not options & cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
@@ -0,0 +1,307 @@
+"""
+Test parsing the referenced C files before the documents are read
+"""
+
+import gc
+import os
+from pathlib import Path
+
+from clang import cindex
+
+import sphinx_c_autodoc
+from sphinx_c_autodoc import preparse
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.cache import module_key
+from sphinx_c_autodoc.preparse import (
+    ParsedModules,
+    find_referenced_files,
+    get_parsed_modules,
+    parse_referenced_files,
+    unfreeze_objects,
+)
+
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "assets"))
+
+
+def test_find_referenced_files(local_app):
+    """
+    Each file is found once, through the ``c_autodoc_roots``.
+    """
+    env = local_app.env
+
+    filenames = find_referenced_files(env, ["example", "sub_dir/file_2", "example"])
+
+    assert filenames == [
+        os.path.join(ASSETS_DIR, "c_source", "example.c"),
+        os.path.join(ASSETS_DIR, "c_source", "file_2.c"),
+    ]
+
+
+def test_disabled_by_default(local_app):
+    """
+    Nothing is parsed ahead of time unless ``c_autodoc_parallel_parse`` is set.
+    """
+    env = local_app.env
+
+    parse_referenced_files(local_app, env, ["example"])
+
+    assert get_parsed_modules(env) is None
+
+
+def test_parsed_in_processes(local_app):
+    """
+    The files are parsed in other processes, giving the same modules as
+    parsing them here. Each parsed module is only taken once.
+    """
+    local_app.config.c_autodoc_parallel_parse = 2
+    local_app.config.c_autodoc_cache_dir = False
+    env = local_app.env
+    sphinx_c_autodoc.cache.reset_module_cache(local_app)
+
+    parse_referenced_files(local_app, env, ["example", "sub_dir/file_2"])
+
+    filename = os.path.join(ASSETS_DIR, "c_source", "example.c")
+    with open(filename) as f:
+        contents = f.read()
+    key = module_key(filename, contents, None, [""], [])
+
+    parsed_modules = get_parsed_modules(env)
+    assert len(parsed_modules) == 2
+    parsed_contents, module = parsed_modules.pop(key)
+    assert parsed_contents == contents
+    expected = loader.load(filename, contents)
+    assert len(module.children) == len(expected.children)
+    for name, child in expected.children.items():
+        if not name.startswith("anon_"):
+            assert module.children[name].get_doc() == child.get_doc()
+    assert parsed_modules.pop(key) is None
+
+
+def test_directives_use_the_parsed_modules(local_app, monkeypatch):
+    """
+    With the files parsed ahead of time, the directives don't parse anything.
+    """
+    app = local_app
+    app.config.c_autodoc_parallel_parse = 2
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("The module should have been parsed already")
+
+    monkeypatch.setattr(preparse, "load_module", fail_load)
+    app.build(force_all=True)
+
+    assert len(get_parsed_modules(app.env)) == 0
+    with open(os.path.join(app.outdir, "example.html")) as f:
+        assert "This is a file comment" in f.read()
+
+
+def test_parsed_modules_are_not_pickled():
+    """
+    The parsed modules only last the read phase of a build.
+    """
+    parsed_modules = ParsedModules()
+    parsed_modules.add("key", "contents", "module")
+
+    assert parsed_modules.__getstate__() == {"_modules": {}, "gc_frozen": False}
+
+
+def test_parsed_modules_are_kept_pickled():
+    """
+    Each module is a single bytes object until it's taken.
+    """
+    module = loader.load("file.c", "int a;")
+    parsed_modules = ParsedModules()
+    parsed_modules.add("key", "int a;", module)
+
+    contents, data = parsed_modules._modules["key"]
+    assert isinstance(data, bytes)
+
+    contents, taken = parsed_modules.pop("key")
+    assert contents == "int a;"
+    assert taken is not module
+    assert taken.children["a"].get_doc() == module.children["a"].get_doc()
+
+
+def test_parsed_in_process(local_app, monkeypatch):
+    """
+    With one process the files are parsed without a process pool.
+    """
+    local_app.config.c_autodoc_parallel_parse = 1
+    local_app.config.c_autodoc_cache_dir = False
+    sphinx_c_autodoc.cache.reset_module_cache(local_app)
+
+    def fail_pool(*args, **kwargs):
+        raise AssertionError("No process pool should be used")
+
+    monkeypatch.setattr(preparse, "ProcessPoolExecutor", fail_pool)
+    parse_referenced_files(local_app, local_app.env, ["example", "sub_dir/file_2"])
+
+    assert len(get_parsed_modules(local_app.env)) == 2
+
+
+def test_follows_parallel_reads(local_app):
+    """
+    By default the files are parsed ahead of time when Sphinx reads in
+    parallel, with the garbage collector frozen until the reading is done.
+    """
+    local_app.config.c_autodoc_cache_dir = False
+    local_app.parallel = 2
+    env = local_app.env
+    sphinx_c_autodoc.cache.reset_module_cache(local_app)
+
+    # Enough documents for Sphinx to read them in parallel
+    docnames = ["example", "sub_dir/file_2", *(f"other_{i}" for i in range(4))]
+
+    try:
+        parse_referenced_files(local_app, env, docnames)
+        parsed_modules = get_parsed_modules(env)
+        assert len(parsed_modules) == 2
+        assert parsed_modules.gc_frozen
+        assert gc.get_freeze_count() > 0
+    finally:
+        unfreeze_objects(local_app, env)
+
+    assert not parsed_modules.gc_frozen
+    assert gc.get_freeze_count() == 0
+
+
+def test_serial_reads_leave_the_garbage_collector(local_app):
+    """
+    Sphinx reads few documents, or documents with an extension which isn't
+    parallel safe, serially. Nothing is forked so nothing is frozen.
+    """
+    local_app.config.c_autodoc_cache_dir = False
+    local_app.parallel = 2
+    env = local_app.env
+    sphinx_c_autodoc.cache.reset_module_cache(local_app)
+
+    parse_referenced_files(local_app, env, ["example", "sub_dir/file_2"])
+
+    assert len(get_parsed_modules(env)) == 2
+    assert not get_parsed_modules(env).gc_frozen
+    assert gc.get_freeze_count() == 0
+
+    docnames = ["example", "sub_dir/file_2", *(f"other_{i}" for i in range(4))]
+    assert preparse.reads_in_parallel(local_app, docnames)
+
+    extension = local_app.extensions["sphinx_c_autodoc"]
+    extension.parallel_read_safe = False
+    try:
+        assert not preparse.reads_in_parallel(local_app, docnames)
+    finally:
+        extension.parallel_read_safe = True
+
+
+def test_parallel_reads_share_the_parsed_modules(make_app, sphinx_project, monkeypatch):
+    """
+    The forked reading processes use the modules parsed before they were
+    forked, rather than parsing the files again.
+    """
+    source_dir = sphinx_project.source_dir
+
+    # Sphinx only reads in parallel when there are enough documents
+    for i in range(6):
+        (source_dir / f"extra_{i}.rst").write_text(
+            f"Extra {i}\n=======\n\n.. autocmodule:: example.c\n"
+        )
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("The module should have been parsed already")
+
+    monkeypatch.setattr(preparse, "load_module", fail_load)
+    app = make_app(
+        srcdir=Path(source_dir),
+        parallel=2,
+        confoverrides={"c_autodoc_cache_dir": False},
+    )
+    app.build(force_all=True)
+
+    assert gc.get_freeze_count() == 0
+    for docname in ("example", "extra_5"):
+        with open(os.path.join(app.outdir, f"{docname}.html")) as f:
+            assert "This is a file comment" in f.read()
+
+
+def test_workers_use_the_same_libclang(monkeypatch):
+    """
+    Workers which aren't forked are given the libclang library of the main
+    process, as they never run ``conf.py``.
+    """
+    monkeypatch.setattr(cindex.Config, "loaded", False)
+    monkeypatch.setattr(cindex.Config, "library_path", None)
+    monkeypatch.setattr(cindex.Config, "library_file", None)
+    monkeypatch.setattr(cindex.Config, "compatibility_check", True)
+
+    preparse._init_worker("/path/to/llvm/lib", "/path/to/libclang.so", False)
+
+    assert cindex.Config.library_path == "/path/to/llvm/lib"
+    assert cindex.Config.library_file == "/path/to/libclang.so"
+    assert cindex.Config.compatibility_check is False
+
+
+def test_forked_workers_keep_their_libclang(monkeypatch):
+    """
+    Forked workers already have libclang loaded, so it isn't replaced.
+    """
+    monkeypatch.setattr(cindex.Config, "loaded", True)
+    library_file = cindex.Config.library_file
+
+    preparse._init_worker("/path/to/llvm/lib", "/path/to/libclang.so", False)
+
+    assert cindex.Config.library_file == library_file
+
+
+def test_parse_failures_are_warned(local_app, monkeypatch):
+    """
+    A file which fails to parse is warned about, and left for the directive
+    to load, rather than failing the build.
+    """
+    local_app.config.c_autodoc_parallel_parse = 1
+    local_app.config.c_autodoc_cache_dir = False
+    sphinx_c_autodoc.cache.reset_module_cache(local_app)
+
+    def fail_load(*args, **kwargs):
+        raise RuntimeError("no libclang")
+
+    monkeypatch.setattr(loader, "load", fail_load)
+    parse_referenced_files(local_app, local_app.env, ["example"])
+
+    assert len(get_parsed_modules(local_app.env)) == 0
+    warnings = local_app._warning.getvalue()
+    assert "Unable to parse" in warnings
+    assert "example.c" in warnings
+    assert "no libclang" in warnings
+
+
+def test_file_names_with_dashes(make_app, sphinx_project, monkeypatch):
+    """
+    C files with names the ``\\w`` class doesn't cover are still parsed ahead
+    of time, and documented.
+    """
+    source_dir = sphinx_project.source_dir
+    (source_dir / "c_source" / "dashed-name.c").write_text(
+        "/**\n * A dashed file\n */\n\n/// A dashed function\nvoid dashed(void);\n"
+    )
+    (source_dir / "dashed.rst").write_text(
+        "Dashed\n======\n\n.. autocmodule:: dashed-name.c\n    :members:\n"
+    )
+
+    app = make_app(
+        srcdir=Path(source_dir),
+        confoverrides={"c_autodoc_cache_dir": False, "c_autodoc_parallel_parse": 1},
+    )
+    env = app.env
+    sphinx_c_autodoc.cache.reset_module_cache(app)
+
+    assert find_referenced_files(env, ["dashed"]) == [
+        str(source_dir / "c_source" / "dashed-name.c")
+    ]
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("The module should have been parsed already")
+
+    monkeypatch.setattr(preparse, "load_module", fail_load)
+    app.build(filenames=[str(source_dir / "dashed.rst")])
+
+    with open(os.path.join(app.outdir, "dashed.html")) as f:
+        assert "A dashed function" in f.read()
@@ -85,3 +85,30 @@ def test_incremental_build_updates_docs(tmp_path):
         contents = f.read()
 
     assert new_expected_contents in contents
+
+
+def test_incremental_build_follows_included_headers(sphinx_project):
+    """
+    Tests the output is updated if a header included by a documented file is
+    changed.
+    """
+    source_dir = sphinx_project.source_dir
+    (source_dir / "flags.rst").write_text(
+        ":orphan:\n\nFlags\n=====\n\n.. autocmodule:: compilation_flags_2.c\n"
+        "   :members:\n"
+    )
+
+    include_arg = f"c_autodoc_compilation_args=-I{source_dir / 'include'}"
+    # The header isn't in any of the c_autodoc_roots
+    args = ["-W", "-D", include_arg, "-D", "c_autodoc_include_dependencies=all"]
+    sphinx_project.build("-a", "-E", *args)
+
+    file_name = sphinx_project.out_dir / "flags.html"
+    assert "float" in file_name.read_text()
+
+    header = source_dir / "include" / "some_include.h"
+    header.write_text("/* No longer defines anything */\n")
+
+    sphinx_project.build(*args)
+
+    assert "float" not in file_name.read_text()
@@ -0,0 +1,97 @@
+"""
+Test storing the source text of the listings outside of the environment
+"""
+
+import os
+from types import SimpleNamespace
+
+from sphinx_c_autodoc.viewcode.store import (
+    PAGES_FILENAME,
+    ListingStore,
+    load_page_digests,
+    save_page_digests,
+)
+
+
+def test_text_is_stored_by_hash(tmp_path):
+    """
+    The same text is only stored once, byte for byte.
+    """
+    store = ListingStore(str(tmp_path / "listings"))
+
+    key = store.add("int a;\r\n")
+
+    assert store.get(key) == "int a;\r\n"
+    assert store.add("int a;\r\n") == key
+    assert len(os.listdir(store.directory)) == 1
+
+
+def test_missing_text(tmp_path):
+    """
+    Text which isn't stored is ``None``.
+    """
+    store = ListingStore(str(tmp_path / "listings"))
+
+    assert store.get("0" * 64) is None
+
+
+def test_prune_keeps_only_the_given_keys(tmp_path):
+    """
+    Pruning removes the text of the listings which are no longer used.
+    """
+    store = ListingStore(str(tmp_path / "listings"))
+    kept = store.add("int kept;")
+    removed = store.add("int removed;")
+
+    store.prune({kept})
+
+    assert store.get(kept) == "int kept;"
+    assert store.get(removed) is None
+
+
+def test_prune_without_directory(tmp_path):
+    """
+    Pruning before anything is stored doesn't create the directory.
+    """
+    store = ListingStore(str(tmp_path / "listings"))
+
+    store.prune(set())
+
+    assert not os.path.exists(store.directory)
+
+
+def test_put_under_a_given_key(tmp_path):
+    """
+    Text put under a key is kept the first time, as the key identifies it.
+    """
+    store = ListingStore(str(tmp_path / "highlighted"), ".html")
+
+    store.put("key", "<pre>int a;</pre>")
+    store.put("key", "ignored")
+
+    assert store.get("key") == "<pre>int a;</pre>"
+    assert os.listdir(store.directory) == ["key.html"]
+
+
+def test_page_digests_round_trip(tmp_path):
+    """
+    The digests of the written listing pages are saved in the doctree
+    directory.
+    """
+    env = SimpleNamespace(doctreedir=str(tmp_path))
+
+    assert load_page_digests(env) == {}
+
+    save_page_digests(env, {"_modules/a.c": "1234"})
+
+    assert load_page_digests(env) == {"_modules/a.c": "1234"}
+
+
+def test_unusable_page_digests(tmp_path):
+    """
+    Digests which can't be read mean every listing page is written.
+    """
+    env = SimpleNamespace(doctreedir=str(tmp_path))
+    (tmp_path / PAGES_FILENAME).write_text("[")
+
+    assert load_page_digests(env) == {}
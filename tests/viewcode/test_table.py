@@ -0,0 +1,102 @@
+"""
+Test the table of C constructs used by the source listings
+"""
+
+import pickle
+from textwrap import dedent
+
+from sphinx_c_autodoc import loader
+from sphinx_c_autodoc.viewcode.table import ConstructTable
+
+SOURCE = dedent(
+    """
+    /**
+     * A structure
+     */
+    struct outer {
+        int first;
+        struct inner {
+            int deep;
+        } nested;
+    };
+
+    /// A function
+    int function(int a)
+    {
+        return a;
+    }
+
+    #define MACRO 1
+    """
+)
+
+
+def load_module():
+    return loader.load("table.c", SOURCE)
+
+
+def flatten_ast(ast, prefix=""):
+    for child in ast["children"]:
+        name = f"{prefix}.{child['name']}" if prefix else child["name"]
+        yield name, child["start_line"], child["end_line"]
+        yield from flatten_ast(child, name)
+
+
+def test_constructs_match_the_ast():
+    """
+    The table holds the same constructs, in the same order, as the tree the
+    listing was made from, along with a row for the file.
+    """
+    module = load_module()
+
+    table = ConstructTable.from_module(module)
+
+    assert list(table.constructs()) == list(flatten_ast(module.to_ast()))
+    assert len(table) == len(list(table.constructs())) + 1
+
+
+def test_find_nested_constructs():
+    """
+    Constructs are found by their full dotted names.
+    """
+    table = ConstructTable.from_module(load_module())
+
+    row = table.find("outer.inner.deep")
+
+    assert row is not None
+    assert table.names[row] == "deep"
+    assert table.start_lines[row] == 8
+    assert table.names[table.parents[row]] == "inner"
+    assert "function" in table
+    assert table.find("outer.missing") is None
+    assert "deep" not in table
+
+
+def test_first_duplicate_is_found():
+    """
+    Of the constructs with the same name, the first one is found.
+    """
+    table = ConstructTable()
+    table._append("", 1, 10, 0, "")
+    table._append("name", 2, 3, 0, "name")
+    table._append("name", 5, 6, 0, "name")
+
+    assert table.start_lines[table.find("name")] == 2
+    assert [c[1] for c in table.constructs()] == [2, 5]
+
+
+def test_pickled_without_the_index():
+    """
+    The index of names is rebuilt when unpickled, rather than pickled, and
+    the table pickles smaller than the tree.
+    """
+    module = load_module()
+    table = ConstructTable.from_module(module)
+
+    pickled = pickle.dumps(table)
+    unpickled = pickle.loads(pickled)
+
+    assert b"outer.inner.deep" not in pickled
+    assert len(pickled) < len(pickle.dumps(module.to_ast()))
+    assert list(unpickled.constructs()) == list(table.constructs())
+    assert unpickled.find("outer.inner.deep") == table.find("outer.inner.deep")
@@ -10,35 +10,36 @@ from bad logic can more easily be seen in the test output
 
 import re
 import os
-from sphinx.cmd.build import main
+import pickle
+from types import SimpleNamespace
+
 from bs4 import BeautifulSoup
 
-SCRIPT_DIR = os.path.dirname(__file__)
+from sphinx_c_autodoc.viewcode import (
+    DocumentationReference,
+    ViewCodeListing,
+    drop_unreferenced_modules,
+    purge_doc_links,
+)
+from sphinx_c_autodoc.viewcode.store import (
+    HIGHLIGHT_DIRECTORY,
+    LISTINGS_DIRECTORY,
+    ListingStore,
+)
+from sphinx_c_autodoc.viewcode.table import ConstructTable
 
 
-def test_viewcode_of_sphinx_project(tmp_path):
+def test_viewcode_of_sphinx_project(built_sphinx_project):
     """
     Tests the insertion of hyperlinks between documentation and code.
 
     This isn't ideal to have all asserts in one function, but to keep the
     overall test run times down it is done this way.
     """
-    source_dir = os.path.join(SCRIPT_DIR, "..", "assets")
     # With sphinx 3 it will throw a warning for duplicate declarations, even with no
-    # index usage, so allow warnings in this test.
-    main(
-        [
-            "-a",
-            "-E",
-            "-D",
-            "exclude_patterns=[]",
-            "-D",
-            "master_doc=viewcode_index",
-            source_dir,
-            str(tmp_path),
-        ]
-    )
-    file_name = tmp_path / "example.html"
+    # index usage, so the project is built allowing warnings.
+    out_dir = built_sphinx_project.out_dir
+    file_name = out_dir / "example.html"
     with file_name.open() as f:
         contents = f.read()
 
@@ -55,7 +56,7 @@ def test_viewcode_of_sphinx_project(tmp_path):
         tag = soup.find("a", {"href": href})
         assert "[source]" == tag.text
 
-    file_name = tmp_path / "sub_dir" / "file_2.html"
+    file_name = out_dir / "sub_dir" / "file_2.html"
     with file_name.open() as f:
         contents = f.read()
 
@@ -69,7 +70,7 @@ def test_viewcode_of_sphinx_project(tmp_path):
         assert "[source]" == tag.text
 
     # Test the back links
-    file_name = tmp_path / "_modules" / "example.c.html"
+    file_name = built_sphinx_project.listing("example.c")
     with file_name.open() as f:
         contents = f.read()
 
@@ -83,7 +84,7 @@ def test_viewcode_of_sphinx_project(tmp_path):
         assert "[docs]" == tag.text
 
     # Test normal C constructs elsewhere in docs
-    file_name = tmp_path / "viewcode.html"
+    file_name = out_dir / "viewcode.html"
     with file_name.open() as f:
         contents = f.read()
 
@@ -101,3 +102,208 @@ def test_viewcode_of_sphinx_project(tmp_path):
     # Ensure only the one function that actually had a source file to be able to link to creates a link
     link_count = len(re.findall("viewcode-link", contents))
     assert link_count == 1
+
+
+def test_listings_survive_a_shared_doctree_directory(sphinx_project, tmp_path):
+    """
+    A non html build which shares the doctree directory with a later html
+    build still records the listings, as the html build reads nothing again.
+    """
+    doctree_dir = str(tmp_path / "doctrees")
+
+    sphinx_project.build("-b", "text", "-d", doctree_dir, out_dir=tmp_path / "text")
+    sphinx_project.build("-b", "html", "-d", doctree_dir, out_dir=tmp_path / "html")
+
+    assert (tmp_path / "text" / "example.txt").exists()
+    assert not (tmp_path / "text" / "_modules").exists()
+    for name in ("example.c.html", "file_2.c.html"):
+        assert (tmp_path / "html" / "_modules" / name).exists()
+
+
+def test_parallel_read_matches_serial(sphinx_project, tmp_path):
+    """
+    The source listings, and their links back to the documentation, are the
+    same when the documents are read in parallel.
+    """
+    source_dir = sphinx_project.source_dir
+
+    # Sphinx only reads in parallel when there are enough documents
+    toctree = []
+    for i in range(6):
+        (source_dir / f"extra_{i}.rst").write_text(f"Extra {i}\n=======\n")
+        toctree.append(f"   extra_{i}")
+    with (source_dir / "viewcode_index.rst").open("a") as f:
+        f.write("\n.. toctree::\n\n" + "\n".join(toctree) + "\n")
+
+    listings = {}
+    for jobs in ("1", "2"):
+        out_dir = tmp_path / f"out_{jobs}"
+        sphinx_project.build("-a", "-E", "-j", jobs, out_dir=out_dir)
+        # The names of anonymous constructs differ between runs
+        listings[jobs] = [
+            re.sub(
+                r"anon_example_\d+",
+                "anon_example",
+                sphinx_project.listing(name, out_dir).read_text(),
+            )
+            for name in ("example.c", "file_2.c")
+        ]
+
+    assert "../example.html#c.MY_COOL_MACRO" in listings["2"][0]
+    assert listings["2"] == listings["1"]
+
+
+def test_extensions_are_parallel_safe(local_app):
+    """
+    Both extensions declare that documents can be read, and written, in
+    parallel.
+    """
+    for name in ("sphinx_c_autodoc", "sphinx_c_autodoc.viewcode"):
+        extension = local_app.extensions[name]
+        assert extension.parallel_read_safe
+        assert extension.parallel_write_safe
+
+
+def test_purged_documents_release_their_listings(tmp_path):
+    """
+    Purging a document drops the links it owns and its use of the listings,
+    which are dropped once no document uses them.
+    """
+    reference = DocumentationReference("doc_1", "b.c", "func")
+    env = SimpleNamespace(
+        doctreedir=str(tmp_path),
+        _viewcode_c_modules={
+            "a.c": ViewCodeListing("", ConstructTable(), docnames={"doc_1"}),
+            "b.c": ViewCodeListing(
+                "",
+                ConstructTable(),
+                doc_links={"func": reference},
+                docnames={"doc_1", "doc_2"},
+            ),
+        },
+        _viewcode_c_references={
+            "doc_1": {"a.c": set(), "b.c": {"func"}},
+            "doc_2": {"b.c": {"func"}},
+        },
+    )
+
+    # doc_1 linked the construct first, so doc_2 doesn't own the link
+    purge_doc_links(None, env, "doc_2")
+
+    assert env._viewcode_c_modules["b.c"].doc_links == {"func": reference}
+    assert env._viewcode_c_modules["b.c"].docnames == {"doc_1"}
+
+    purge_doc_links(None, env, "doc_1")
+
+    # Listings are only dropped once everything has been read
+    assert set(env._viewcode_c_modules) == {"a.c", "b.c"}
+    assert env._viewcode_c_modules["b.c"].doc_links == {}
+
+    drop_unreferenced_modules(None, env)
+
+    assert env._viewcode_c_modules == {}
+    assert env._viewcode_c_references == {}
+
+
+def test_incremental_build_drops_unreferenced_listings(built_sphinx_project):
+    """
+    The pickled listings only hold the modules the current documents use.
+    """
+    source_dir = built_sphinx_project.source_dir
+    out_dir = built_sphinx_project.out_dir
+
+    (source_dir / "sub_dir" / "file_2.rst").write_text("File 2\n======\n")
+    built_sphinx_project.build()
+
+    with (out_dir / ".doctrees" / "environment.pickle").open("rb") as f:
+        env = pickle.load(f)
+
+    modules = env._viewcode_c_modules
+    assert "file_2.c" not in modules
+    assert "example.c" in modules
+
+    # Only the source of the listings still in use is kept
+    store = ListingStore(str(out_dir / ".doctrees" / LISTINGS_DIRECTORY))
+    with (source_dir / "c_source" / "example.c").open() as f:
+        assert store.get(modules["example.c"].source_key) == f.read()
+    assert len(os.listdir(store.directory)) == len(modules)
+    for listing in modules.values():
+        assert "sub_dir/file_2" not in listing.docnames
+        assert all(r.docname != "sub_dir/file_2" for r in listing.doc_links.values())
+
+
+def test_incremental_build_skips_unchanged_listings(sphinx_project):
+    """
+    Listing pages are only written again when they change, and the
+    highlighted source is reused when only the links back to the
+    documentation change.
+    """
+    source_dir = sphinx_project.source_dir
+    out_dir = sphinx_project.out_dir
+    # Otherwise changing the documented constructs changes the navigation
+    options = ["-D", "toc_object_entries=0"]
+
+    sphinx_project.build("-a", "-E", *options)
+
+    pages = {name: sphinx_project.listing(name) for name in ("example.c", "file_2.c")}
+    highlight_dir = out_dir / ".doctrees" / HIGHLIGHT_DIRECTORY
+    highlighted = list(highlight_dir.iterdir())
+    sphinx_project.age([*pages.values(), *highlighted])
+
+    with (source_dir / "viewcode.rst").open("a") as f:
+        f.write("\nAnother paragraph.\n")
+    sphinx_project.build(*options)
+
+    assert all(p.stat().st_mtime_ns == 0 for p in pages.values())
+
+    (source_dir / "example.rst").write_text(
+        "Example C file\n==============\n\n.. autocfunction:: example.c::my_func\n"
+    )
+    sphinx_project.build(*options)
+
+    assert pages["example.c"].stat().st_mtime_ns != 0
+    assert pages["file_2.c"].stat().st_mtime_ns == 0
+    assert "#c.my_func" in pages["example.c"].read_text()
+    assert sorted(highlight_dir.iterdir()) == sorted(highlighted)
+    assert all(p.stat().st_mtime_ns == 0 for p in highlighted)
+
+
+def test_removed_listing_pages_are_written_again(built_sphinx_project):
+    """
+    A listing page missing from the output is written again, even though its
+    contents haven't changed.
+    """
+    page = built_sphinx_project.listing("example.c")
+    contents = page.read_text()
+    page.unlink()
+    built_sphinx_project.build()
+
+    assert page.read_text() == contents
+
+
+def test_navigation_changes_write_every_listing(built_sphinx_project):
+    """
+    The listing pages show the navigation of the documentation, so changing a
+    title, or forcing every page to be written, writes them all again.
+    """
+    project = built_sphinx_project
+    pages = [project.listing(name) for name in ("example.c", "file_2.c")]
+
+    project.age(pages)
+    viewcode = project.source_dir / "viewcode.rst"
+    viewcode.write_text(
+        viewcode.read_text().replace("Viewcode\n========", "Renamed\n=======")
+    )
+    project.build()
+
+    assert all(p.stat().st_mtime_ns != 0 for p in pages)
+    assert "Renamed" in pages[0].read_text()
+
+    project.age(pages)
+    project.build()
+
+    assert all(p.stat().st_mtime_ns == 0 for p in pages)
+
+    project.build("-a")
+
+    assert all(p.stat().st_mtime_ns != 0 for p in pages)